@@ -1,18 +1,28 @@
 import os
+import time
+import uuid
 import streamlit as st
-from openai import OpenAI
-import anthropic
-from google.genai import Client
 import json
 import base64
-from datetime import datetime
-from urllib.parse import urlencode, parse_qs
-from io import BytesIO
+from urllib.parse import urlencode
+
+from llm_providers import stream_response, MOCK_DEFAULTS
+from chat_compare import compare_stream, tokens_per_sec
+from chat_metrics import TurnMetrics, MetricsStore, record_from_compare
+from chat_render import RenderCoalescer, RENDER_MODES
+from chat_history_store import HistoryStore
+from chat_share import create_share_params, load_shared
+from llm_scheduler import RequestScheduler
+from llm_router import Router, HEDGE_AFTER
+
+# 各プロバイダの SDK（openai / anthropic / google.genai）は llm_providers の中で
+# 初めて使うときに読み込む。起動時に全部を読み込まないこと（bench_startup.py で確認）
 
 # ===== Gemini Client（Streamlit用）=====
-gemini_client = Client(
-    api_key=st.secrets["GOOGLE_API_KEY"]
-)
+@st.cache_resource
+def get_gemini_client():
+    from google.genai import Client
+    return Client(api_key=st.secrets["GOOGLE_API_KEY"])
 
 ###### dotenv を利用しない場合は消してください ######
 try:
@@ -29,13 +39,15 @@ MODEL_PRICES = {
         "gpt-3.5-turbo": 0.5 / 1_000_000,
         "gpt-4o": 5 / 1_000_000,
         "claude-3-haiku-20240307": 3 / 1_000_000,
-        "gemini-1.5-pro-latest": 3.5 / 1_000_000
+        "gemini-1.5-pro-latest": 3.5 / 1_000_000,
+        "mock": 0.0
     },
     "output": {
         "gpt-3.5-turbo": 1.5 / 1_000_000,
         "gpt-4o": 15 / 1_000_000,
         "claude-3-haiku-20240307": 15 / 1_000_000,
-        "gemini-1.5-pro-latest": 10.5 / 1_000_000
+        "gemini-1.5-pro-latest": 10.5 / 1_000_000,
+        "mock": 0.0
     }
 }
 
@@ -53,14 +65,78 @@ def init_page():
     st.sidebar.title("Options")
 
 
+HISTORY_PAGE_SIZE = 10
+
+
+HISTORY_OWNER_PARAM = "u"
+LOCAL_DEV_EMAIL = "test@example.com"  # ログイン機能の無い環境で st.experimental_user が返す仮の値
+
+
+@st.cache_resource
+def get_history_store():
+    """チャット履歴のSQLiteストア（全セッション共通。会話は持ち主ごとに分ける）"""
+    return HistoryStore(os.environ.get("CHAT_HISTORY_DB", "chat_history.db"))
+
+
+@st.cache_resource
+def get_local_embedder():
+    """履歴の意味検索と TODO 検索で共有する埋め込みモデル"""
+    # numpy と埋め込みモデルは起動時ではなく初めて使うときに読み込む
+    from chat_vector_index import get_embedder
+    return get_embedder()
+
+
+@st.cache_resource
+def get_vector_index():
+    """意味検索用のベクトルインデックス。未登録の会話はバックグラウンドで追加する"""
+    from chat_vector_index import INDEX_DIR, VectorIndex
+    index = VectorIndex(get_local_embedder(), os.environ.get("CHAT_VECTOR_DIR", INDEX_DIR))
+    index.sync_async(get_history_store())
+    return index
+
+
+@st.cache_resource
+def get_todo_index():
+    """TODO リスト（todo_list.json）の検索用インデックス"""
+    from todo_rag import TODO_FILE, TodoIndex
+    return TodoIndex(get_local_embedder(), os.environ.get("TODO_JSON", TODO_FILE))
+
+
+def get_history_owner():
+    """チャット履歴の持ち主。ログインしていればそのユーザー、していなければ URL の ?u= に残すトークン。
+    トークンは再読み込みしても URL に残るので、同じ URL（ブックマーク）を開けば同じ履歴が見える"""
+    owner = st.session_state.get("history_owner")
+    if owner:
+        # ほかの処理で URL のパラメータが消えても、同じトークンを戻しておく
+        if owner.startswith("token:") and st.query_params.get(HISTORY_OWNER_PARAM) != owner[6:]:
+            st.query_params[HISTORY_OWNER_PARAM] = owner[6:]
+        return owner
+    user = getattr(st, "experimental_user", None)
+    email = user.get("email") if user is not None else None
+    if email and email != LOCAL_DEV_EMAIL:
+        owner = f"user:{email}"
+    else:
+        token = st.query_params.get(HISTORY_OWNER_PARAM, "")
+        if not token:
+            token = uuid.uuid4().hex
+            st.query_params[HISTORY_OWNER_PARAM] = token
+        owner = f"token:{token}"
+    st.session_state.history_owner = owner
+    return owner
+
+
+def clear_share_params():
+    """共有リンクのパラメータだけを URL から消す（?u= や ?jobs= は残す）"""
+    for key in ("c", "s", "chat"):
+        if key in st.query_params:
+            del st.query_params[key]
+
+
 def save_chat_history():
     """現在の会話を履歴に保存"""
     if "message_history" not in st.session_state or len(st.session_state.message_history) <= 1:
         return
     
-    if "chat_histories" not in st.session_state:
-        st.session_state.chat_histories = []
-    
     # タイトルを最初のユーザーメッセージから生成
     title = "New Chat"
     for role, msg in st.session_state.message_history:
@@ -68,50 +144,34 @@ def save_chat_history():
             title = msg[:30] + ("..." if len(msg) > 30 else "")
             break
     
-    # 保存
-    chat_data = {
-        "title": title,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "messages": st.session_state.message_history.copy(),
-        "model": st.session_state.get("model_name", "gpt-3.5-turbo")
-    }
-    
-    st.session_state.chat_histories.insert(0, chat_data)
-    
-    # 最大50件まで保持
-    if len(st.session_state.chat_histories) > 50:
-        st.session_state.chat_histories = st.session_state.chat_histories[:50]
+    # 保存（意味検索のインデックスへはバックグラウンドで追加）
+    conversation_id = get_history_store().save_conversation(
+        get_history_owner(),
+        title,
+        st.session_state.get("model_name", "gpt-3.5-turbo"),
+        st.session_state.message_history,
+    )
+    get_vector_index().add_async(conversation_id, st.session_state.message_history)
 
 
-def load_chat_history(index):
+def load_chat_history(conversation_id):
     """保存された会話を読み込む"""
-    if "chat_histories" in st.session_state and 0 <= index < len(st.session_state.chat_histories):
-        chat_data = st.session_state.chat_histories[index]
-        st.session_state.message_history = chat_data["messages"].copy()
-        st.session_state.model_name = chat_data.get("model", "gpt-3.5-turbo")
+    chat_data = get_history_store().load_conversation(conversation_id, owner=get_history_owner())
+    if chat_data:
+        st.session_state.message_history = chat_data["messages"]
+        st.session_state.model_name = chat_data.get("model") or "gpt-3.5-turbo"
         st.rerun()
 
 
-def delete_chat_history(index):
+def delete_chat_history(conversation_id):
     """特定の会話履歴を削除"""
-    if "chat_histories" in st.session_state and 0 <= index < len(st.session_state.chat_histories):
-        st.session_state.chat_histories.pop(index)
-        st.rerun()
-
-
-def encode_conversation(message_history):
-    """会話履歴をBase64エンコード"""
-    try:
-        json_str = json.dumps(message_history, ensure_ascii=False)
-        encoded = base64.urlsafe_b64encode(json_str.encode('utf-8')).decode('utf-8')
-        return encoded
-    except Exception as e:
-        st.error(f"エンコードエラー: {e}")
-        return None
+    if get_history_store().delete_conversation(conversation_id, owner=get_history_owner()):
+        get_vector_index().remove(conversation_id)
+    st.rerun()
 
 
 def decode_conversation(encoded_str):
-    """Base64エンコードされた会話履歴をデコード"""
+    """Base64エンコードされた会話履歴をデコード（旧形式 ?chat= のリンク用）"""
     try:
         json_str = base64.urlsafe_b64decode(encoded_str.encode('utf-8')).decode('utf-8')
         return json.loads(json_str)
@@ -121,81 +181,132 @@ def decode_conversation(encoded_str):
 
 
 def create_share_url():
-    """共有用URLを生成"""
+    """共有用URLを生成（URLには短いキー、または小さい会話なら圧縮した本文だけを載せる）"""
     if "message_history" not in st.session_state:
         return None
     
-    encoded = encode_conversation(st.session_state.message_history)
-    if encoded:
-        base_url = st.get_option("browser.serverAddress") or "localhost:8501"
-        share_url = f"http://{base_url}?chat={encoded}"
-        return share_url
-    return None
+    try:
+        params = create_share_params(st.session_state.message_history, get_history_store())
+    except Exception as e:
+        st.error(f"共有URLの作成エラー: {e}")
+        return None
+    base_url = st.get_option("browser.serverAddress") or "localhost:8501"
+    share_url = f"http://{base_url}?{urlencode(params)}"
+    return share_url
 
 
 def load_conversation_from_url():
     """URLパラメータから会話をロード"""
     query_params = st.query_params
-    if "chat" in query_params:
+    if "c" in query_params or "s" in query_params:
+        try:
+            decoded = load_shared(query_params.to_dict(), get_history_store())
+        except Exception as e:
+            st.error(f"共有会話の読み込みエラー: {e}")
+            decoded = None
+        if decoded:
+            st.session_state.message_history = decoded
+            st.success("会話を読み込みました！")
+        else:
+            st.warning("共有された会話が見つかりませんでした")
+        clear_share_params()
+    elif "chat" in query_params:
         encoded = query_params["chat"]
         decoded = decode_conversation(encoded)
         if decoded:
             st.session_state.message_history = decoded
             st.success("会話を読み込みました！")
-            st.query_params.clear()
+            clear_share_params()
 
 
-def transcribe_audio(audio_file):
-    """音声ファイルを文字起こし"""
-    try:
-        client = OpenAI()
-        audio_bytes = audio_file.read()
-        audio_file.seek(0)
-        
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file,
-            response_format="text"
-        )
-        
-        return transcript
-    except Exception as e:
-        st.error(f"文字起こしエラー: {e}")
-        return None
+TRANSCRIBE_BACKEND_LABELS = {
+    "openai": "API (whisper-1)",
+    "local": "ローカル (CPU・オフライン)",
+}
 
 
-def generate_minutes(transcript):
-    """文字起こしテキストから議事録を生成"""
-    try:
-        client = OpenAI()
-        
-        prompt = f"""
-以下は会議の文字起こしテキストです。これを読みやすい議事録形式にまとめてください。
-
-【要件】
-- 日時、参加者、議題を推測して記載
-- 主要な議論ポイントを箇条書き
-- 決定事項を明確に記載
-- アクションアイテム（誰が何をするか）を整理
-- 次回の予定があれば記載
-
-【文字起こしテキスト】
-{transcript}
-"""
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "あなたは優秀な議事録作成アシスタントです。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3
-        )
-        
-        return response.choices[0].message.content
-    except Exception as e:
-        st.error(f"議事録生成エラー: {e}")
-        return None
+@st.cache_resource
+def get_job_queue():
+    """議事録ジョブのキューとワーカープロセス（全セッション共通。使うときに読み込む）"""
+    from meeting_jobs import JobQueue, JOB_DB
+    return JobQueue(os.environ.get("MEETING_JOB_DB", JOB_DB))
+
+
+def get_my_job_ids():
+    """このセッション（またはURL）で投入したジョブID"""
+    ids = list(st.session_state.get("job_ids", []))
+    for job_id in st.query_params.get("jobs", "").split(","):
+        if job_id and job_id not in ids:
+            ids.append(job_id)
+    return ids
+
+
+def submit_minutes_job(audio_file, backend):
+    """音声をジョブとして登録（処理は別プロセスで行う）"""
+    job_id = get_job_queue().submit(audio_file.getvalue(), audio_file.name, backend)
+    ids = get_my_job_ids() + [job_id]
+    st.session_state.job_ids = ids
+    # 再読み込みしても結果を開けるようURLにも残す
+    st.query_params["jobs"] = ",".join(ids)
+    return job_id
+
+
+JOB_STATUS_ICONS = {"queued": "⏳", "running": "🔄", "done": "✅", "error": "❌"}
+
+
+def has_active_jobs():
+    """投入したジョブに待ち・処理中のものがあるか"""
+    job_ids = get_my_job_ids()
+    return bool(job_ids) and any(job["status"] in ("queued", "running") for job in get_job_queue().list_jobs(job_ids))
+
+
+def display_jobs():
+    """投入した議事録ジョブの状態と結果を表示。待ち・処理中のジョブがあれば True を返す"""
+    job_ids = get_my_job_ids()
+    if not job_ids:
+        return False
+
+    queue = get_job_queue()
+    jobs = queue.list_jobs(job_ids)
+    st.markdown("## 📝 議事録ジョブ")
+    for job in jobs:
+        icon = JOB_STATUS_ICONS.get(job["status"], "")
+        st.markdown(f"{icon} **{job['filename']}** — {job['progress'] or ''}（{job['created_at']}）")
+        if job["status"] == "error":
+            st.error(f"議事録生成エラー: {job['error']}")
+        elif job["status"] == "done":
+            with st.expander("議事録を表示"):
+                result = queue.get(job["id"])
+                st.markdown(result["minutes"])
+                st.download_button(
+                    label="議事録をダウンロード",
+                    data=result["minutes"],
+                    file_name="minutes.txt",
+                    mime="text/plain",
+                    key=f"download_{job['id']}"
+                )
+                st.text_area("文字起こし", result["transcript"], height=200, key=f"transcript_{job['id']}")
+
+    active = any(job["status"] in ("queued", "running") for job in jobs)
+    if active:
+        st.button("状態を更新", key="refresh_jobs")
+    return active
+
+
+def display_jobs_auto_refresh():
+    """処理中のジョブがあれば数秒ごとに表示を更新（st.fragment が使える場合）。
+    全部終わったらページ全体を再実行し、run_every の無い表示に戻して定期実行をやめる"""
+    fragment = getattr(st, "fragment", None)
+    if fragment is None or not has_active_jobs():
+        display_jobs()
+        return
+
+    @fragment(run_every=3)
+    def poll_jobs():
+        if not display_jobs():
+            st.rerun()
+
+    poll_jobs()
 
 
 def init_messages():
@@ -214,6 +325,15 @@ def init_messages():
         ]
 
 
+MODEL_CHOICES = {
+    "GPT-3.5": "gpt-3.5-turbo",
+    "GPT-4": "gpt-4o",
+    "Claude 3.5 Sonnet": "claude-3-haiku-20240307",
+    "Gemini 1.5 Pro": "gemini",
+    "Mock (ローカル)": "mock",
+}
+
+
 def select_model():
     st.session_state.temperature = st.sidebar.slider(
         "Temperature", 0.0, 2.0, 0.0, 0.01
@@ -221,59 +341,201 @@ def select_model():
 
     model = st.sidebar.radio(
         "Choose a model",
-        ("GPT-3.5", "GPT-4", "Claude 3.5 Sonnet", "Gemini 1.5 Pro")
+        tuple(MODEL_CHOICES)
     )
-    if model == "GPT-3.5":
-        st.session_state.model_name = "gpt-3.5-turbo"
-    elif model == "GPT-4":
-        st.session_state.model_name = "gpt-4o"
-    elif model == "Claude 3.5 Sonnet":
-        st.session_state.model_name = "claude-3-haiku-20240307"
+    st.session_state.model_name = MODEL_CHOICES[model]
+
+    # 比較モード：同じ質問を複数モデルへ同時に送る
+    st.session_state.compare_mode = st.sidebar.checkbox("比較モード（複数モデルに同時送信）")
+    if st.session_state.compare_mode:
+        labels = st.sidebar.multiselect(
+            "比較するモデル", tuple(MODEL_CHOICES), default=[model]
+        )
+        st.session_state.compare_models = [MODEL_CHOICES[label] for label in labels]
     else:
-        st.session_state.model_name = "gemini"
+        st.session_state.compare_models = []
 
+    if "mock" in [st.session_state.model_name] + st.session_state.compare_models:
+        select_mock_options()
 
-def get_llm_response(user_input: str):
-    model = st.session_state.model_name
+    select_render_options()
+    select_failover_options()
+    select_todo_options()
+
+
+RENDER_MODE_LABELS = {
+    "frame": "一定間隔",
+    "sentence": "文の区切り",
+    "token": "トークンごと（間引きなし）",
+}
 
-    # GPT
-    if model.startswith("gpt"):
-        client = OpenAI()
-        stream = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": user_input}],
-            stream=True,
+
+def select_render_options():
+    """ストリーミング表示の描画間隔をセッションごとに設定"""
+    with st.sidebar.expander("描画設定"):
+        mode = st.selectbox(
+            "描画タイミング", RENDER_MODES, format_func=lambda m: RENDER_MODE_LABELS[m]
         )
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
-
-    # Claude
-    elif model.startswith("claude"):
-        client = anthropic.Anthropic()
-        with client.messages.stream(
-            model=model,
-            max_tokens=1024,
-            messages=[{"role": "user", "content": user_input}],
-        ) as stream:
-            for text in stream.text_stream:
-                yield text
-
-    # Gemini ✅
-    elif model.startswith("gemini"):
-        client = Client(api_key=st.secrets["GOOGLE_API_KEY"])
-
-        response = client.models.generate_content_stream(
-            model="models/gemini-2.5-flash",
-            contents=user_input
+        fps = st.slider("最大描画回数（回/秒）", 1, 60, 10)
+    st.session_state.render_config = {"mode": mode, "fps": fps}
+
+
+def new_coalescer(render):
+    return RenderCoalescer(render, **st.session_state.get("render_config", {}))
+
+
+def select_failover_options():
+    """主モデルが遅い・落ちているときに切り替える予備モデルを設定"""
+    with st.sidebar.expander("フェイルオーバー"):
+        labels = ("なし",) + tuple(MODEL_CHOICES)
+        label = st.selectbox("予備モデル", labels)
+        hedge_after = st.slider("予備モデルに送るまでの待ち時間（秒）", 0.5, 10.0, HEDGE_AFTER, 0.5)
+        states = get_router().states()
+        if states:
+            st.caption("  /  ".join(f"{provider}: {state}" for provider, state in states.items()))
+    st.session_state.failover_config = {
+        "fallback": MODEL_CHOICES.get(label),
+        "hedge_after": hedge_after,
+    }
+
+
+def select_todo_options():
+    """TODO リストを参照して答えるかどうか"""
+    with st.sidebar.expander("TODO リスト参照"):
+        enabled = st.checkbox("TODO リストを参照して答える")
+        top_k = st.slider("参照するタスクの最大件数", 1, 20, 8)
+    st.session_state.todo_config = {"enabled": enabled, "top_k": top_k}
+
+
+def with_todo_context_if_enabled(user_input):
+    """設定が有効なら、関係するタスクだけを質問の前に付ける"""
+    config = st.session_state.get("todo_config", {})
+    if not config.get("enabled"):
+        return user_input
+    from todo_rag import format_task, with_todo_context
+    try:
+        prompt, used = with_todo_context(user_input, get_todo_index(), config["top_k"])
+    except Exception as e:
+        st.warning(f"TODO リストを読み込めませんでした: {e}")
+        return user_input
+    with st.expander(f"参照したタスク（{len(used)}件）"):
+        st.text("\n".join(format_task(t) for t in used) or "該当なし")
+    return prompt
+
+
+def select_mock_options():
+    """モックプロバイダの生成速度・遅延・エラー率を設定（オフライン計測用）"""
+    with st.sidebar.expander("Mock 設定", expanded=True):
+        st.session_state.mock_config = {
+            "tokens_per_sec": st.slider("トークン/秒", 1.0, 1000.0, MOCK_DEFAULTS["tokens_per_sec"]),
+            "latency": st.slider("初回トークンまでの遅延（秒）", 0.0, 5.0, MOCK_DEFAULTS["latency"], 0.1),
+            "error_rate": st.slider("エラー率", 0.0, 1.0, MOCK_DEFAULTS["error_rate"], 0.01),
+            "max_tokens": st.slider("最大トークン数", 10, 5000, MOCK_DEFAULTS["max_tokens"]),
+        }
+
+
+def get_provider_options(model):
+    """プロバイダごとの追加オプション"""
+    options = {}
+    if model.startswith("gemini"):
+        options["api_key"] = st.secrets["GOOGLE_API_KEY"]
+    elif model.startswith("mock"):
+        options.update(st.session_state.get("mock_config", {}))
+    return options
+
+
+@st.cache_resource
+def get_scheduler():
+    """APIキーを共有する全セッションの送信ペースと順番を管理"""
+    return RequestScheduler()
+
+
+@st.cache_resource
+def get_router():
+    """プロバイダごとのサーキットブレーカーを全セッションで共有"""
+    return Router()
+
+
+def get_session_id():
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    return st.session_state.session_id
+
+
+def scheduled_stream_fn(session_id):
+    """stream_response と同じ呼び出し方で、スケジューラを通して送信する関数を作る"""
+    scheduler = get_scheduler()
+
+    def stream_fn(model, user_input, **options):
+        return scheduler.stream(
+            model, user_input, session_id,
+            lambda: stream_response(model, user_input, **options)
         )
 
-    for chunk in response:
-        if chunk.text:
-            yield chunk.text
+    return stream_fn
 
 
-            
+def get_llm_response(user_input: str, trace=None, route=None):
+    """route に dict を渡すと、実際に応答したモデルとヘッジしたかが入る"""
+    model = st.session_state.model_name
+    stream_fn = scheduled_stream_fn(get_session_id())
+    config = st.session_state.get("failover_config", {})
+    fallback = config.get("fallback")
+    # ヘッジ・フェイルオーバーの呼び出しは別スレッド（ScriptRunContext なし）で行われるので、
+    # st.secrets / st.session_state を読むオプションはここ（スクリプトのスレッド）で作っておく
+    options = {m: get_provider_options(m) for m in (model, fallback) if m}
+    yield from get_router().stream(
+        model,
+        lambda m: stream_fn(m, user_input, trace=trace, **options[m]),
+        fallback=fallback,
+        hedge_after=config.get("hedge_after", HEDGE_AFTER),
+        info=route,
+    )
+
+
+def calc_cost(model, input_text, output_text):
+    """1往復分の概算コスト"""
+    input_cost = MODEL_PRICES["input"].get(model, 0.0) * get_message_counts(input_text)
+    output_cost = MODEL_PRICES["output"].get(model, 0.0) * get_message_counts(output_text)
+    return input_cost + output_cost
+
+
+def compare_models_response(user_input: str, models):
+    """複数モデルに同時送信し、横並びで表示。モデルごとの計測値も表示する"""
+    columns = st.columns(len(models))
+    coalescers = {}
+    for column, model in zip(columns, models):
+        column.markdown(f"**{model}**")
+        coalescers[model] = new_coalescer(column.empty().markdown)
+
+    stats = {}
+    start = time.perf_counter()
+    stream_fn = scheduled_stream_fn(get_session_id())
+    for model, token in compare_stream(models, user_input, get_provider_options, stats, stream_fn):
+        if token is None:
+            coalescers[model].flush()
+            continue
+        coalescers[model].push(token)
+    wall = time.perf_counter() - start
+    texts = {model: coalescer.close() for model, coalescer in coalescers.items()}
+
+    metrics_store = get_metrics_store()
+    for column, model in zip(columns, models):
+        stat = stats[model]
+        metrics_store.add(record_from_compare(model, stat))
+        if stat["error"]:
+            column.error(f"エラー: {stat['error']}")
+            continue
+        ttft = f"{stat['ttft']:.2f}s" if stat["ttft"] is not None else "-"
+        column.caption(
+            f"TTFT {ttft} | {tokens_per_sec(stat):.1f} tok/s | "
+            f"${calc_cost(model, user_input, stat['text']):.5f}"
+        )
+    total = sum(stat["elapsed"] or 0.0 for stat in stats.values())
+    st.caption(f"全体 {wall:.2f}s（各モデルの合計 {total:.2f}s）")
+
+    return "\n\n".join(f"### {model}\n{texts[model]}" for model in models)
+
 
 def calc_and_display_costs():
     output_count = 0
@@ -302,38 +564,142 @@ def calc_and_display_costs():
     st.sidebar.markdown(f"- Output cost: ${output_cost:.5f}")
 
 
+@st.cache_resource
+def get_metrics_store():
+    """レイテンシ計測結果（全セッション共通）。環境変数を設定するとファイルにも書き出す"""
+    return MetricsStore(
+        jsonl_path=os.environ.get("CHAT_METRICS_JSONL"),
+        prom_path=os.environ.get("CHAT_METRICS_PROM"),
+    )
+
+
+def format_sec(value):
+    return f"{value:.3f}s" if value is not None else "-"
+
+
+def display_metrics_sidebar():
+    """サイドバーにレイテンシ計測結果を表示"""
+    st.sidebar.markdown("---")
+    st.sidebar.markdown("## ⏱️ レイテンシ")
+
+    last = st.session_state.get("last_turn_metrics")
+    if last:
+        st.sidebar.markdown(f"**直近の応答（{last['model']}）**")
+        st.sidebar.markdown(
+            f"- クライアント生成: {format_sec(last['client_sec'])}\n"
+            f"- リクエスト送信: {format_sec(last['request_sec'])}\n"
+            f"- 最初のトークン: {format_sec(last['ttft_sec'])}\n"
+            f"- 合計: {format_sec(last['total_sec'])}\n"
+            f"- 描画: {format_sec(last['render_sec'])}（{last['render_calls']}回）"
+        )
+        if last["chunks_per_sec"]:
+            st.sidebar.caption(f"{last['chunks_per_sec']:.1f} chunks/s, {last['chars']} 文字")
+
+    store = get_metrics_store()
+    summary = store.summary()
+    if not summary:
+        st.sidebar.info("まだ計測結果はありません")
+        return
+
+    rows = []
+    for model, s in summary.items():
+        rows.append({
+            "model": model,
+            "turns": s["turns"],
+            "errors": s["errors"],
+            "TTFT p50": s["ttft_p50"],
+            "TTFT p95": s["ttft_p95"],
+            "chunks/s": s["chunks_per_sec"],
+        })
+    st.sidebar.dataframe(rows, hide_index=True)
+    st.sidebar.download_button(
+        "JSON Lines で保存", store.to_jsonl(), file_name="chat_metrics.jsonl", mime="application/json"
+    )
+    st.sidebar.download_button(
+        "Prometheus 形式で保存", store.to_prometheus(), file_name="chat_metrics.prom", mime="text/plain"
+    )
+
+
 def display_chat_history_sidebar():
-    """サイドバーにチャット履歴を表示"""
+    """サイドバーにチャット履歴を表示（1ページ分だけ読み込む）"""
     st.sidebar.markdown("---")
     st.sidebar.markdown("## 📚 チャット履歴")
-    
-    if "chat_histories" not in st.session_state or len(st.session_state.chat_histories) == 0:
-        st.sidebar.info("まだ保存された会話はありません")
-        return
-    
-    for i, chat in enumerate(st.session_state.chat_histories):
-        col1, col2 = st.sidebar.columns([3, 1])
+
+    store = get_history_store()
+    owner = get_history_owner()
+    if owner.startswith("token:"):
+        st.sidebar.caption("履歴はこのページの URL（?u=...）に結び付いています。ブックマークすると次回も同じ履歴を開けます。")
+    query = st.sidebar.text_input("履歴を検索", key="history_query")
+    search_mode = st.sidebar.radio("検索方法", ("キーワード", "意味"), horizontal=True, key="history_search_mode")
+    similar_to = st.session_state.get("history_similar_to")
+    if similar_to:
+        st.sidebar.caption(f"「{similar_to['title']}」に似た会話")
+        if st.sidebar.button("似た会話の表示をやめる", key="history_similar_clear"):
+            del st.session_state.history_similar_to
+            st.rerun()
+        hits = get_vector_index().similar(similar_to["id"], k=HISTORY_PAGE_SIZE, only=store.conversation_ids(owner))
+        chats = store.get_summaries([cid for cid, _ in hits], owner=owner)
+        if not chats:
+            st.sidebar.info("似た会話は見つかりませんでした")
+    elif query and search_mode == "意味":
+        hits = get_vector_index().search(query, k=HISTORY_PAGE_SIZE, only=store.conversation_ids(owner))
+        chats = store.get_summaries([cid for cid, _ in hits], owner=owner)
+        if not chats:
+            st.sidebar.info("該当する会話はありません")
+    elif query:
+        chats = store.search(query, owner=owner, limit=HISTORY_PAGE_SIZE)
+        if not chats:
+            st.sidebar.info("該当する会話はありません")
+    else:
+        total = store.count(owner)
+        if total == 0:
+            st.sidebar.info("まだ保存された会話はありません")
+            return
+        pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+        page = min(st.session_state.get("history_page", 0), pages - 1)
+        chats = store.list_conversations(owner, HISTORY_PAGE_SIZE, page * HISTORY_PAGE_SIZE)
+
+    for chat in chats:
+        col1, col2, col3 = st.sidebar.columns([3, 1, 1])
+        with col1:
+            if st.button(f"📝 {chat['title']}", key=f"load_{chat['id']}"):
+                load_chat_history(chat["id"])
+        with col2:
+            if st.button("🔍", key=f"similar_{chat['id']}", help="似た会話を探す"):
+                st.session_state.history_similar_to = {"id": chat["id"], "title": chat["title"]}
+                st.rerun()
+        with col3:
+            if st.button("🗑️", key=f"delete_{chat['id']}"):
+                delete_chat_history(chat["id"])
+        st.sidebar.caption(f"{chat['created_at']} | {chat['model']}")
+
+    if not query and not similar_to and pages > 1:
+        col1, col2, col3 = st.sidebar.columns([1, 2, 1])
         with col1:
-            if st.button(f"📝 {chat['title']}", key=f"load_{i}"):
-                load_chat_history(i)
+            if st.button("◀", key="history_prev", disabled=page == 0):
+                st.session_state.history_page = page - 1
+                st.rerun()
         with col2:
-            if st.button("🗑️", key=f"delete_{i}"):
-                delete_chat_history(i)
-        st.sidebar.caption(f"{chat['timestamp']} | {chat['model']}")
+            st.caption(f"{page + 1} / {pages} ページ")
+        with col3:
+            if st.button("▶", key="history_next", disabled=page >= pages - 1):
+                st.session_state.history_page = page + 1
+                st.rerun()
 
 
 def main():
     init_page()
 
-    # 🔽 ここに貼る（Geminiの利用可能モデル確認）
-    st.write("### Gemini Available Models")
-    st.write([m.name for m in gemini_client.models.list()])
-
     # URLから会話をロード
     load_conversation_from_url()
     
     init_messages()
     select_model()
+
+    # Geminiの利用可能モデル確認（Gemini選択時のみ。モックではネットワークを使わない）
+    if st.session_state.model_name == "gemini":
+        st.write("### Gemini Available Models")
+        st.write([m.name for m in get_gemini_client().models.list()])
     
     # チャット履歴表示
     display_chat_history_sidebar()
@@ -354,31 +720,17 @@ def main():
         "音声ファイルをアップロード",
         type=["mp3", "mp4", "mpeg", "mpga", "m4a", "wav", "webm"]
     )
+    transcribe_backend = st.sidebar.radio(
+        "文字起こしエンジン",
+        tuple(TRANSCRIBE_BACKEND_LABELS),
+        format_func=lambda b: TRANSCRIBE_BACKEND_LABELS[b]
+    )
     
     if audio_file and st.sidebar.button("議事録を作成"):
-        with st.spinner("文字起こし中..."):
-            transcript = transcribe_audio(audio_file)
-        
-        if transcript:
-            st.sidebar.success("文字起こし完了！")
-            
-            with st.spinner("議事録を生成中..."):
-                minutes = generate_minutes(transcript)
-            
-            if minutes:
-                st.sidebar.success("議事録生成完了！")
-                
-                # 議事録を表示
-                st.markdown("## 📝 生成された議事録")
-                st.markdown(minutes)
-                
-                # ダウンロードボタン
-                st.download_button(
-                    label="議事録をダウンロード",
-                    data=minutes,
-                    file_name="minutes.txt",
-                    mime="text/plain"
-                )
+        submit_minutes_job(audio_file, transcribe_backend)
+        st.sidebar.success("議事録の作成を開始しました。完了すると下に表示されます。")
+
+    display_jobs_auto_refresh()
 
     # チャット履歴を表示
     for role, message in st.session_state.get("message_history", []):
@@ -390,17 +742,36 @@ def main():
         st.chat_message("user").markdown(user_input)
 
         with st.chat_message("assistant"):
-            response_placeholder = st.empty()
-            response_text = ""
-            for token in get_llm_response(user_input):
-                response_text += token
-                response_placeholder.markdown(response_text)
+            prompt = with_todo_context_if_enabled(user_input)
+            if st.session_state.compare_mode and st.session_state.compare_models:
+                response_text = compare_models_response(prompt, st.session_state.compare_models)
+            else:
+                response_placeholder = st.empty()
+                turn = TurnMetrics(st.session_state.model_name)
+                coalescer = new_coalescer(
+                    lambda text: turn.render(response_placeholder.markdown, text)
+                )
+                error = None
+                route = {}
+                try:
+                    for token in turn.wrap(get_llm_response(prompt, trace=turn.mark, route=route)):
+                        coalescer.push(token)
+                except Exception as e:
+                    error = e
+                    st.error(f"応答エラー: {e}")
+                response_text = coalescer.close()
+                if route.get("hedged"):
+                    turn.model = route["model"]
+                    st.caption(f"予備モデル {route['model']} が応答しました")
+                st.session_state.last_turn_metrics = turn.finish(error)
+                get_metrics_store().add(st.session_state.last_turn_metrics)
 
         # チャット履歴に追加
         st.session_state.message_history.append(("user", user_input))
         st.session_state.message_history.append(("assistant", response_text))
 
     calc_and_display_costs()
+    display_metrics_sidebar()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,119 @@
+"""
+ai_chat_app.py の起動時間（import 時間）の計測
+
+python -X importtime で ai_chat_app を新しいプロセスで import し、
+合計時間とトップレベルのパッケージごとの時間を表示します。
+プロバイダの SDK（openai / anthropic / google.genai / google.generativeai）が起動時に
+読み込まれていないかも確認します（google.protobuf は Streamlit が使うので対象外）。
+
+実行例:
+    python bench_startup.py                    # 計測して表示
+    python bench_startup.py --save-baseline    # 結果を bench_startup_baseline.json に保存
+    python bench_startup.py --check            # 基準より遅い、または SDK を読み込んでいたら終了コード1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULE = os.environ.get("BENCH_STARTUP_MODULE", "ai_chat_app")
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_startup_baseline.json")
+PROVIDER_SDKS = ("openai", "anthropic", "google.genai", "google.generativeai")
+TOLERANCE = 1.2  # 基準の何倍まで許すか
+
+
+def import_times(module):
+    """新しいプロセスで module を import し、
+    (合計マイクロ秒, {直接 import したパッケージ: 累計マイクロ秒}, 読み込まれた全モジュール名) を返す"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # 見出し行
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative)))
+
+    # 子は親より先に出力されるので、module の行からさかのぼって直下（深さ1）の行を集める
+    index = max(i for i, (depth, name, _) in enumerate(entries) if depth == 0 and name == module)
+    total = entries[index][2]
+    packages = {}
+    loaded = set()
+    for depth, name, cumulative in reversed(entries[:index]):
+        if depth == 0:
+            break
+        top = name.split(".")[0]
+        loaded.add(name)
+        if depth == 1:
+            packages[top] = packages.get(top, 0) + cumulative
+    return total, packages, loaded
+
+
+def is_loaded(package, loaded):
+    """package（またはその下のモジュール）が loaded に含まれているか"""
+    return any(name == package or name.startswith(package + ".") for name in loaded)
+
+
+def measure(module, repeat):
+    runs = [import_times(module) for _ in range(repeat)]
+    names = set().union(*(packages for _, packages, _ in runs))
+    packages = {name: statistics.median(p.get(name, 0) for _, p, _ in runs) for name in names}
+    loaded = set().union(*(loaded for _, _, loaded in runs))
+    return {
+        "module": module,
+        "total_ms": round(statistics.median(total for total, _, _ in runs) / 1000, 1),
+        "packages_ms": {k: round(v / 1000, 1) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])},
+        "loaded": sorted({name.split(".")[0] for name in loaded}),
+        "provider_sdks": [sdk for sdk in PROVIDER_SDKS if is_loaded(sdk, loaded)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ai_chat_app の起動時間の計測")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数（中央値を使う）")
+    parser.add_argument("--top", type=int, default=15, help="表示するパッケージ数")
+    parser.add_argument("--save-baseline", action="store_true", help="結果を基準として保存")
+    parser.add_argument("--check", action="store_true", help="基準と比較して遅くなっていたら失敗")
+    args = parser.parse_args()
+
+    try:
+        result = measure(MODULE, args.repeat)
+    except RuntimeError as e:
+        print(f"{MODULE} を import できませんでした: {e}")
+        sys.exit(2)
+    print(f"{MODULE}: {result['total_ms']} ms")
+    for name, ms in list(result["packages_ms"].items())[:args.top]:
+        print(f"  {name:<24} {ms:8.1f} ms")
+
+    loaded_sdks = result["provider_sdks"]
+    if loaded_sdks:
+        print(f"⚠️ 起動時にプロバイダの SDK を読み込んでいます: {', '.join(loaded_sdks)}")
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"基準を保存しました: {BASELINE_FILE}")
+
+    if args.check:
+        failed = bool(loaded_sdks)
+        if os.path.exists(BASELINE_FILE):
+            with open(BASELINE_FILE, encoding="utf-8") as f:
+                baseline = json.load(f)
+            limit = baseline["total_ms"] * TOLERANCE
+            print(f"基準: {baseline['total_ms']} ms（上限 {limit:.1f} ms）")
+            failed = failed or result["total_ms"] > limit
+        sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+文字起こしエンジンの速度比較
+
+同じ音声ファイルを各エンジンで文字起こしし、リアルタイム係数（RTF = 処理時間 / 音声の長さ）を表示します。
+RTF が 1 より小さければ実時間より速く処理できています。
+
+実行例:
+    python bench_transcribe.py meeting.wav --backends openai local
+    LOCAL_WHISPER_MODEL=base python bench_transcribe.py meeting.mp3 --backends local --json
+"""
+import argparse
+import json
+import os
+import time
+
+from meeting_transcribe import BACKENDS, audio_duration, transcribe_with_backend
+
+
+def run_benchmark(path, backends):
+    with open(path, "rb") as f:
+        audio_bytes = f.read()
+    filename = os.path.basename(path)
+    duration = audio_duration(audio_bytes, filename)
+
+    results = []
+    for backend in backends:
+        start = time.perf_counter()
+        error = None
+        text = ""
+        try:
+            text = transcribe_with_backend(audio_bytes, filename, backend)
+        except Exception as e:
+            error = str(e)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "backend": backend,
+            "audio_sec": duration,
+            "elapsed_sec": round(elapsed, 2),
+            "rtf": round(elapsed / duration, 3) if duration and not error else None,
+            "chars": len(text),
+            "error": error,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文字起こしエンジンの速度比較")
+    parser.add_argument("audio", help="音声ファイル")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.audio, args.backends)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+        return
+    for r in results:
+        rtf = f"{r['rtf']:.3f}" if r["rtf"] is not None else "-"
+        line = f"{r['backend']:>8}: {r['elapsed_sec']:8.2f}s  RTF {rtf}  {r['chars']} 文字"
+        if r["error"]:
+            line += f"  エラー: {r['error']}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+複数モデルへの同時送信（比較モード）
+
+同じ入力を複数のモデルへスレッドで同時に送り、届いた順に (model, token) を返します。
+全体の待ち時間は各モデルの合計ではなく、一番遅いモデルの時間になります。
+Streamlit の描画はメインスレッドで行う必要があるため、ワーカーはキューに積むだけです。
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_providers import stream_response
+
+
+def new_stats():
+    return {"ttft": None, "elapsed": None, "chunks": 0, "text": "", "error": None}
+
+
+def tokens_per_sec(stat):
+    """最初のトークン以降の生成速度（チャンク/秒）"""
+    if stat["ttft"] is None or stat["elapsed"] is None:
+        return 0.0
+    duration = stat["elapsed"] - stat["ttft"]
+    return stat["chunks"] / duration if duration > 0 else float(stat["chunks"])
+
+
+def _pump(model, user_input, options, events, stat, cancel, stream_fn):
+    start = time.perf_counter()
+    try:
+        for token in stream_fn(model, user_input, **options):
+            if cancel.is_set():
+                break
+            if stat["ttft"] is None:
+                stat["ttft"] = time.perf_counter() - start
+            stat["chunks"] += 1
+            stat["text"] += token
+            events.put((model, token))
+    except Exception as e:
+        stat["error"] = str(e)
+    finally:
+        stat["elapsed"] = time.perf_counter() - start
+        events.put((model, None))
+
+
+def compare_stream(models, user_input, options_for=None, stats=None, stream_fn=stream_response):
+    """複数モデルへ同時に送り、(model, token) を到着順に返すジェネレータ
+
+    options_for: model -> stream_fn に渡す追加オプション
+    stream_fn: (model, user_input, **options) -> トークンのイテレータ（既定は stream_response）
+    stats: 渡した dict にモデルごとの計測値（ttft, elapsed, chunks, text, error）を書き込む
+    各モデルの終了時には (model, None) を返します。
+    """
+    if stats is None:
+        stats = {}
+    for model in models:
+        stats[model] = new_stats()
+    if not models:
+        return
+
+    events = queue.Queue()
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=len(models))
+    try:
+        for model in models:
+            options = options_for(model) if options_for else {}
+            pool.submit(_pump, model, user_input, options, events, stats[model], cancel, stream_fn)
+
+        remaining = len(models)
+        while remaining:
+            model, token = events.get()
+            if token is None:
+                remaining -= 1
+            yield model, token
+    finally:
+        # 途中で打ち切られた場合も残りのワーカーを止める
+        cancel.set()
+        pool.shutdown(wait=False)
@@ -0,0 +1,231 @@
+"""
+チャット履歴の保存先（SQLite）
+
+会話の一覧（conversations）と本文（messages）を別テーブルに分け、
+サイドバーには一覧だけをページ単位で読み込み、本文は開いたときに読み込みます。
+共有リンク用の圧縮済み会話（shares）も同じファイルに保存します。
+会話の id は AUTOINCREMENT で、削除した会話の id を再利用しません（ベクトルインデックスの削除済みIDと衝突しない）。
+全文検索は FTS5（使えれば trigram トークナイザで日本語の部分一致に対応）を使い、
+FTS5 が無い環境では LIKE 検索に切り替えます。
+
+会話には持ち主（owner。Streamlit ではセッションID）を記録し、一覧・検索・読み込み・削除は
+持ち主の会話だけを対象にします。owner=None は全員分（ベクトルインデックスの同期など内部用）です。
+"""
+import sqlite3
+import threading
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL,
+    model TEXT,
+    created_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id INTEGER NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_owner ON conversations(owner, id);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages(conversation_id, seq);
+CREATE TABLE IF NOT EXISTS shares (
+    key TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at TEXT NOT NULL
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id'{tokenizer}
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+SUMMARY_COLUMNS = "c.id, c.title, c.model, c.created_at, c.message_count"
+
+
+def _owner_filter(owner, column="c.owner"):
+    """owner で絞り込む WHERE 句の条件とパラメータ（None なら絞り込まない）"""
+    if owner is None:
+        return "1 = 1", ()
+    return f"{column} = ?", (owner,)
+
+
+def _summary(row):
+    return {
+        "id": row[0],
+        "title": row[1],
+        "model": row[2],
+        "created_at": row[3],
+        "message_count": row[4],
+    }
+
+
+class HistoryStore:
+    """会話履歴の保存・一覧・検索（スレッドセーフ。st.cache_resource で共有する想定）"""
+
+    def __init__(self, path="chat_history.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+        self.fts = self._init_fts()
+        self.conn.commit()
+
+    def _migrate(self):
+        """owner 列が無い古いファイルに列を足す（既存の会話は誰の一覧にも出ない）"""
+        columns = [r[1] for r in self.conn.execute("PRAGMA table_info(conversations)")]
+        if columns and "owner" not in columns:
+            self.conn.execute("ALTER TABLE conversations ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+
+    def _init_fts(self):
+        """FTS5 の全文検索テーブルを作る。作れなければ None（LIKE 検索）"""
+        for tokenizer in (", tokenize='trigram'", ""):
+            try:
+                self.conn.executescript(FTS_SCHEMA.format(tokenizer=tokenizer))
+                return "trigram" if tokenizer else "unicode61"
+            except sqlite3.OperationalError:
+                continue
+        return None
+
+    # ---------------------------
+    # 保存・読み込み
+    # ---------------------------
+    def save_conversation(self, owner, title, model, messages, created_at=None):
+        """会話を保存して id を返す。messages は (role, content) のリスト"""
+        created_at = created_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO conversations (owner, title, model, created_at, message_count) VALUES (?, ?, ?, ?, ?)",
+                (owner, title, model, created_at, len(messages)),
+            )
+            conversation_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO messages (conversation_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(conversation_id, seq, role, content) for seq, (role, content) in enumerate(messages)],
+            )
+        return conversation_id
+
+    def load_conversation(self, conversation_id, owner=None):
+        """会話の情報と本文を返す（無い・持ち主が違うときは None）"""
+        where, params = _owner_filter(owner)
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM conversations c WHERE c.id = ? AND {where}",
+                (conversation_id, *params),
+            ).fetchone()
+            if row is None:
+                return None
+            messages = self.conn.execute(
+                "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq",
+                (conversation_id,),
+            ).fetchall()
+        conversation = _summary(row)
+        conversation["messages"] = [(role, content) for role, content in messages]
+        return conversation
+
+    def delete_conversation(self, conversation_id, owner=None):
+        """削除できたら True（無い・持ち主が違うときは False）"""
+        where, params = _owner_filter(owner, "owner")
+        with self.lock, self.conn:
+            cur = self.conn.execute(f"DELETE FROM conversations WHERE id = ? AND {where}", (conversation_id, *params))
+        return cur.rowcount > 0
+
+    # ---------------------------
+    # 一覧・検索（本文は読み込まない）
+    # ---------------------------
+    def count(self, owner=None):
+        where, params = _owner_filter(owner)
+        with self.lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM conversations c WHERE {where}", params).fetchone()[0]
+
+    def list_conversations(self, owner=None, limit=10, offset=0):
+        """新しい順に1ページ分の会話一覧を返す"""
+        where, params = _owner_filter(owner)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM conversations c WHERE {where} ORDER BY c.id DESC LIMIT ? OFFSET ?",
+                (*params, limit, offset),
+            ).fetchall()
+        return [_summary(r) for r in rows]
+
+    def conversation_ids(self, owner=None):
+        """会話の id（古い順）。ベクトルインデックスの同期と、意味検索の絞り込み用"""
+        where, params = _owner_filter(owner)
+        with self.lock:
+            return [r[0] for r in self.conn.execute(f"SELECT c.id FROM conversations c WHERE {where} ORDER BY c.id", params)]
+
+    def get_summaries(self, conversation_ids, owner=None):
+        """指定した id の会話一覧を、渡した順番のまま返す（削除済み・持ち主が違うものは除く）"""
+        if not conversation_ids:
+            return []
+        placeholders = ", ".join("?" for _ in conversation_ids)
+        where, params = _owner_filter(owner)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT {SUMMARY_COLUMNS} FROM conversations c WHERE c.id IN ({placeholders}) AND {where}",
+                [*conversation_ids, *params],
+            ).fetchall()
+        by_id = {r[0]: _summary(r) for r in rows}
+        return [by_id[cid] for cid in conversation_ids if cid in by_id]
+
+    def search(self, query, owner=None, limit=20):
+        """本文にキーワードを含む会話を新しい順に返す"""
+        query = query.strip()
+        if not query:
+            return []
+        # trigram は3文字未満の語を検索できないので LIKE にする
+        where, owner_params = _owner_filter(owner)
+        use_fts = self.fts and not (self.fts == "trigram" and len(query) < 3)
+        if use_fts:
+            phrase = '"' + query.replace('"', '""') + '"'
+            sql = (
+                f"SELECT {SUMMARY_COLUMNS} FROM conversations c WHERE c.id IN ("
+                " SELECT m.conversation_id FROM messages_fts f JOIN messages m ON m.id = f.rowid"
+                f" WHERE messages_fts MATCH ?) AND {where} ORDER BY c.id DESC LIMIT ?"
+            )
+            params = (phrase, *owner_params, limit)
+        else:
+            pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            sql = (
+                f"SELECT {SUMMARY_COLUMNS} FROM conversations c WHERE c.id IN ("
+                " SELECT conversation_id FROM messages WHERE content LIKE ? ESCAPE '\\')"
+                f" AND {where} ORDER BY c.id DESC LIMIT ?"
+            )
+            params = (pattern, *owner_params, limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [_summary(r) for r in rows]
+
+    # ---------------------------
+    # 共有リンク（chat_share から利用）
+    # ---------------------------
+    def put_share(self, key, codec, data):
+        """同じ内容は同じキーになるので、既にあれば何もしない"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO shares (key, codec, data, created_at) VALUES (?, ?, ?, ?)",
+                (key, codec, data, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+
+    def get_share(self, key):
+        """(codec, data) を返す（無ければ None）"""
+        with self.lock:
+            row = self.conn.execute("SELECT codec, data FROM shares WHERE key = ?", (key,)).fetchone()
+        return (row[0], row[1]) if row else None
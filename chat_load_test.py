@@ -0,0 +1,145 @@
+"""
+チャットアプリのオフライン負荷試験
+
+llm_providers のモックプロバイダを使い、複数の擬似セッションを同時に動かして
+ストリーミング・描画・履歴保存の処理量を計測します。ネットワークもAPIキーも不要です。
+
+実行例:
+    python chat_load_test.py --sessions 20 --turns 5 --tokens-per-sec 200 --latency 0.1
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chat_render import RenderCoalescer, RENDER_MODES
+from llm_providers import stream_response
+from llm_scheduler import RequestScheduler
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+class FakePlaceholder:
+    """st.empty() の代わり。markdown の呼び出し回数と描画文字数だけ数える"""
+
+    def __init__(self):
+        self.renders = 0
+        self.rendered_chars = 0
+
+    def markdown(self, text):
+        self.renders += 1
+        self.rendered_chars += len(text)
+
+
+def run_session(session_no, args):
+    """1セッション分のチャットを実行して計測値を返す"""
+    message_history = [("system", "You are a helpful assistant.")]
+    chat_histories = []
+    result = {"ttft": [], "turn": [], "tokens": 0, "errors": 0, "renders": 0, "rendered_chars": 0}
+
+    for turn in range(args.turns):
+        user_input = f"session {session_no} turn {turn}"
+        placeholder = FakePlaceholder()
+        coalescer = RenderCoalescer(placeholder.markdown, mode=args.render_mode, fps=args.render_fps)
+        start = time.perf_counter()
+        first = None
+        try:
+            options = dict(
+                tokens_per_sec=args.tokens_per_sec,
+                latency=args.latency,
+                error_rate=args.error_rate,
+                max_tokens=args.max_tokens,
+                seed=None if args.seed is None else args.seed + session_no * 1000 + turn,
+            )
+            if args.scheduler:
+                stream = args.scheduler.stream(
+                    "mock", user_input, f"session-{session_no}",
+                    lambda: stream_response("mock", user_input, **options)
+                )
+            else:
+                stream = stream_response("mock", user_input, **options)
+            for token in stream:
+                if first is None:
+                    first = time.perf_counter() - start
+                result["tokens"] += 1
+                coalescer.push(token)
+        except Exception:
+            result["errors"] += 1
+        response_text = coalescer.close()
+        result["turn"].append(time.perf_counter() - start)
+        if first is not None:
+            result["ttft"].append(first)
+        result["renders"] += placeholder.renders
+        result["rendered_chars"] += placeholder.rendered_chars
+
+        message_history.append(("user", user_input))
+        message_history.append(("assistant", response_text))
+        # save_chat_history と同じ保存処理
+        chat_histories.insert(0, {"title": user_input[:30], "messages": message_history.copy()})
+        chat_histories = chat_histories[:50]
+
+    return result
+
+
+def run_load_test(args):
+    args.scheduler = None
+    if args.rpm or args.tpm:
+        limits = {"mock": {"rpm": args.rpm or 10_000, "tpm": args.tpm or 10_000_000}}
+        args.scheduler = RequestScheduler(limits)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        results = list(pool.map(lambda n: run_session(n, args), range(args.sessions)))
+    wall = time.perf_counter() - start
+
+    ttft = sorted(v for r in results for v in r["ttft"])
+    turn = sorted(v for r in results for v in r["turn"])
+    tokens = sum(r["tokens"] for r in results)
+    return {
+        "sessions": args.sessions,
+        "turns": args.sessions * args.turns,
+        "wall_sec": round(wall, 3),
+        "tokens": tokens,
+        "tokens_per_sec": round(tokens / wall, 1) if wall else 0.0,
+        "errors": sum(r["errors"] for r in results),
+        "renders": sum(r["renders"] for r in results),
+        "rendered_chars": sum(r["rendered_chars"] for r in results),
+        "ttft_p50": round(percentile(ttft, 50), 4),
+        "ttft_p95": round(percentile(ttft, 95), 4),
+        "turn_p50": round(percentile(turn, 50), 4),
+        "turn_p95": round(percentile(turn, 95), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="チャットアプリのオフライン負荷試験")
+    parser.add_argument("--sessions", type=int, default=10, help="同時セッション数")
+    parser.add_argument("--turns", type=int, default=3, help="セッションあたりの会話回数")
+    parser.add_argument("--tokens-per-sec", type=float, default=100.0, help="モックの生成速度")
+    parser.add_argument("--latency", type=float, default=0.2, help="最初のトークンまでの遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラー率 (0〜1)")
+    parser.add_argument("--max-tokens", type=int, default=200, help="1応答の最大トークン数")
+    parser.add_argument("--render-mode", choices=RENDER_MODES, default="token", help="描画タイミング")
+    parser.add_argument("--render-fps", type=float, default=10.0, help="最大描画回数（回/秒）")
+    parser.add_argument("--rpm", type=int, default=0, help="スケジューラを通す場合のリクエスト/分の上限")
+    parser.add_argument("--tpm", type=int, default=0, help="スケジューラを通す場合のトークン/分の上限")
+    parser.add_argument("--seed", type=int, default=None, help="乱数シード（再現用）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力")
+    args = parser.parse_args()
+
+    report = run_load_test(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        for key, value in report.items():
+            print(f"{key:>16}: {value}")
+
+
+if __name__ == '__main__':
+    main()
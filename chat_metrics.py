@@ -0,0 +1,235 @@
+"""
+チャット1往復ごとのレイテンシ計測
+
+クライアント生成・リクエスト送信・最初のトークン（TTFT）・生成速度・Streamlit描画時間を
+記録し、モデルごとに集計します。JSON Lines と Prometheus テキスト形式で書き出せます。
+
+使い方:
+    turn = TurnMetrics(model)
+    for token in turn.wrap(stream_response(model, text, trace=turn.mark)):
+        turn.render(placeholder.markdown, text_so_far)
+    store.add(turn.finish())
+"""
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+def _label_value(value):
+    """Prometheus のラベル値のエスケープ（\\ " 改行）"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+
+class TurnMetrics:
+    """1往復分の計測"""
+
+    def __init__(self, model, mode="single"):
+        self.model = model
+        self.mode = mode
+        self.start = time.perf_counter()
+        self.marks = {}
+        self.chunks = 0
+        self.chars = 0
+        self.render_sec = 0.0
+        self.render_calls = 0
+
+    def mark(self, name):
+        """開始からの経過秒を記録（同じ名前は最初の1回だけ）"""
+        self.marks.setdefault(name, time.perf_counter() - self.start)
+
+    def wrap(self, stream):
+        """プロバイダのストリームを包んで TTFT とトークン数を数える"""
+        for token in stream:
+            self.mark("first_token")
+            self.chunks += 1
+            self.chars += len(token)
+            yield token
+        self.mark("last_token")
+
+    def render(self, fn, *args, **kwargs):
+        """描画処理の時間を計測して実行"""
+        t = time.perf_counter()
+        fn(*args, **kwargs)
+        self.render_sec += time.perf_counter() - t
+        self.render_calls += 1
+
+    def finish(self, error=None):
+        total = time.perf_counter() - self.start
+        ttft = self.marks.get("first_token")
+        last = self.marks.get("last_token", total)
+        generation = last - ttft if ttft is not None else 0.0
+        return {
+            "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "model": self.model,
+            "mode": self.mode,
+            "client_sec": self.marks.get("client_created"),
+            "request_sec": self.marks.get("request_sent"),
+            "ttft_sec": ttft,
+            "total_sec": total,
+            "chunks": self.chunks,
+            "chars": self.chars,
+            "chunks_per_sec": self.chunks / generation if generation > 0 else None,
+            "render_sec": self.render_sec,
+            "render_calls": self.render_calls,
+            "error": str(error) if error else None,
+        }
+
+
+def record_from_compare(model, stat):
+    """chat_compare の計測値を TurnMetrics.finish と同じ形にする"""
+    ttft = stat.get("ttft")
+    total = stat.get("elapsed") or 0.0
+    generation = total - ttft if ttft is not None else 0.0
+    return {
+        "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "model": model,
+        "mode": "compare",
+        "client_sec": None,
+        "request_sec": None,
+        "ttft_sec": ttft,
+        "total_sec": total,
+        "chunks": stat.get("chunks", 0),
+        "chars": len(stat.get("text", "")),
+        "chunks_per_sec": stat.get("chunks", 0) / generation if generation > 0 else None,
+        "render_sec": None,
+        "render_calls": None,
+        "error": stat.get("error"),
+    }
+
+
+class MetricsStore:
+    """プロセス全体で共有する計測結果（st.cache_resource で保持）
+
+    jsonl_path を指定すると1往復ごとに追記、prom_path を指定すると
+    Prometheus の textfile collector 用ファイルを毎回書き直します。
+    records は直近 maxlen 件だけ持つので、counter（往復数・エラー数・TTFT の合計と件数）は
+    totals に起動からの累計として別に数えます（古い記録が消えても減らない）。
+    """
+
+    def __init__(self, maxlen=2000, jsonl_path=None, prom_path=None):
+        self.records = deque(maxlen=maxlen)
+        self.totals = {}  # model -> {"turns", "errors", "ttft_sum", "ttft_count"}
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # ファイルへの書き出し（to_prometheus が self.lock を使うので別）
+
+    def add(self, record):
+        """記録を追加する。ファイルへの書き出しに失敗しても例外は出さない（チャットを止めない）"""
+        with self.lock:
+            self.records.append(record)
+            total = self.totals.setdefault(
+                record["model"], {"turns": 0, "errors": 0, "ttft_sum": 0.0, "ttft_count": 0}
+            )
+            total["turns"] += 1
+            if record["error"]:
+                total["errors"] += 1
+            elif record["ttft_sec"] is not None:
+                total["ttft_sum"] += record["ttft_sec"]
+                total["ttft_count"] += 1
+            if self.jsonl_path:
+                try:
+                    with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    print(f"計測結果の書き出しエラー: {e}")
+        if self.prom_path:
+            try:
+                self.write_prometheus(self.prom_path)
+            except OSError as e:
+                print(f"計測結果の書き出しエラー: {e}")
+
+    def summary(self):
+        """モデルごとの集計"""
+        with self.lock:
+            records = list(self.records)
+        by_model = {}
+        for r in records:
+            by_model.setdefault(r["model"], []).append(r)
+
+        result = {}
+        for model, rows in by_model.items():
+            ok = [r for r in rows if not r["error"]]
+            ttft = sorted(r["ttft_sec"] for r in ok if r["ttft_sec"] is not None)
+            rates = [r["chunks_per_sec"] for r in ok if r["chunks_per_sec"]]
+            renders = [r["render_sec"] for r in ok if r["render_sec"] is not None]
+            result[model] = {
+                "turns": len(rows),
+                "errors": len(rows) - len(ok),
+                "ttft_p50": _percentile(ttft, 50),
+                "ttft_p95": _percentile(ttft, 95),
+                "ttft_sum": sum(ttft),
+                "ttft_count": len(ttft),
+                "chunks_per_sec": statistics.mean(rates) if rates else None,
+                "render_sec": statistics.mean(renders) if renders else None,
+                "total_sec": statistics.mean(r["total_sec"] for r in ok) if ok else None,
+            }
+        return result
+
+    def to_jsonl(self):
+        with self.lock:
+            return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self.records)
+
+    def to_prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text, values):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                if value is None:
+                    continue
+                label_str = ",".join(f'{k}="{_label_value(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_str}}} {value:.6g}")
+
+        summary = self.summary()
+        with self.lock:
+            totals = {m: dict(t) for m, t in self.totals.items()}
+        metric("chat_turns_total", "counter", "Chat turns per model.",
+               [({"model": m}, t["turns"]) for m, t in totals.items()])
+        metric("chat_turn_errors_total", "counter", "Failed chat turns per model.",
+               [({"model": m}, t["errors"]) for m, t in totals.items()])
+        ttft_values = []
+        for m, s in summary.items():
+            ttft_values.append(({"model": m, "quantile": "0.5"}, s["ttft_p50"]))
+            ttft_values.append(({"model": m, "quantile": "0.95"}, s["ttft_p95"]))
+        metric("chat_ttft_seconds", "summary", "Time to first token.", ttft_values)
+        lines.extend(f'chat_ttft_seconds_sum{{model="{_label_value(m)}"}} {t["ttft_sum"]:.6g}' for m, t in totals.items())
+        lines.extend(f'chat_ttft_seconds_count{{model="{_label_value(m)}"}} {t["ttft_count"]}' for m, t in totals.items())
+        metric("chat_chunks_per_second", "gauge", "Mean streamed chunks per second after the first token.",
+               [({"model": m}, s["chunks_per_sec"]) for m, s in summary.items()])
+        metric("chat_render_seconds", "gauge", "Mean Streamlit render time per turn.",
+               [({"model": m}, s["render_sec"]) for m, s in summary.items()])
+        metric("chat_turn_seconds", "gauge", "Mean total time per turn.",
+               [({"model": m}, s["total_sec"]) for m, s in summary.items()])
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """書き込み途中のファイルを読まれないよう一時ファイル経由で置き換える
+        （一時ファイルは毎回別の名前にし、同時に書き出すセッションどうしで取り合わない）"""
+        with self.write_lock:
+            text = self.to_prometheus()  # ロック内で作り、古い内容で新しい内容を上書きしない
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + ".")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp, path)
+            except BaseException:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+                raise
@@ -0,0 +1,61 @@
+"""
+ストリーミング中の描画間引き
+
+トークンごとに placeholder.markdown を呼ぶと、速いモデルでは1秒に数百回の再描画と
+ブラウザへの送信が発生します。RenderCoalescer はトークンをためておき、
+一定のフレームレート、または文の区切りでだけ描画します。
+
+mode:
+    "frame"    : 1/fps 秒ごとに描画
+    "sentence" : 文の区切り（。！？ や改行）で描画。ただし max_delay 秒以上は待たない
+    "token"    : 従来どおりトークンごとに描画
+"""
+import time
+
+RENDER_MODES = ("frame", "sentence", "token")
+SENTENCE_ENDS = ("。", "！", "？", "!", "?", ".", "\n")
+
+
+class RenderCoalescer:
+    def __init__(self, render, mode="frame", fps=10, max_delay=0.5):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"未対応の描画モードです: {mode}")
+        self.render = render
+        self.mode = mode
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        self.max_delay = max_delay
+        self.text = ""
+        self.pending = False
+        self.flushes = 0
+        self.last_flush = time.monotonic()
+
+    def push(self, token):
+        """トークンを追加し、必要なら描画する"""
+        self.text += token
+        self.pending = True
+        if self.mode == "token":
+            self.flush()
+            return
+
+        elapsed = time.monotonic() - self.last_flush
+        if self.mode == "frame":
+            if elapsed >= self.interval:
+                self.flush()
+        elif elapsed >= self.max_delay or (
+            elapsed >= self.interval and token.rstrip(" ").endswith(SENTENCE_ENDS)
+        ):
+            self.flush()
+
+    def flush(self):
+        """ためているテキストを描画"""
+        if not self.pending:
+            return
+        self.render(self.text)
+        self.pending = False
+        self.flushes += 1
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """ストリーム終了時に残りを描画してテキストを返す"""
+        self.flush()
+        return self.text
@@ -0,0 +1,94 @@
+"""
+会話共有リンクの作成と復元
+
+会話は圧縮してハッシュをキーに保存し（内容アドレス方式）、URL には短いキーだけを載せます。
+小さな会話は保存せず、圧縮した本文をそのまま URL に入れます。
+
+    ?s=<キー>     : サーバー側に保存した会話
+    ?c=<圧縮本文> : URL に埋め込んだ会話（zlib + base64url）
+"""
+import base64
+import hashlib
+import json
+import zlib
+
+# これ以下の長さなら URL に埋め込む（base64 後の文字数）
+INLINE_LIMIT = 512
+KEY_LENGTH = 16
+# ?c= は誰でも作れるので、展開後の大きさに上限を付ける（圧縮爆弾対策）
+MAX_INLINE_BYTES = 64 * 1024
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def serialize(message_history):
+    """キーが内容だけで決まるよう、区切りを固定した JSON にする"""
+    return json.dumps(message_history, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def compress(data):
+    """zstandard があれば zstd、無ければ zlib で圧縮して (codec, bytes) を返す"""
+    try:
+        import zstandard
+        return "zstd", zstandard.ZstdCompressor(level=19).compress(data)
+    except ImportError:
+        return "zlib", zlib.compress(data, 9)
+
+
+def decompress(codec, data):
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"未対応の圧縮形式です: {codec}")
+
+
+def inflate_limited(data, max_bytes=MAX_INLINE_BYTES):
+    """zlib を max_bytes までだけ展開する。それを超える・途中で切れているものは ValueError"""
+    d = zlib.decompressobj()
+    out = d.decompress(data, max_bytes)
+    if d.unconsumed_tail or not d.eof:
+        raise ValueError("共有リンクの会話が大きすぎるか、壊れています")
+    return out
+
+
+def share_key(data):
+    """会話の内容から決まる短いキー"""
+    return _b64encode(hashlib.sha256(data).digest())[:KEY_LENGTH]
+
+
+def create_share_params(message_history, store, inline_limit=INLINE_LIMIT):
+    """共有 URL のクエリパラメータを返す。小さい会話は埋め込み、大きい会話は保存する"""
+    data = serialize(message_history)
+    inline = _b64encode(zlib.compress(data, 9))
+    if len(inline) <= inline_limit:
+        return {"c": inline}
+
+    key = share_key(data)
+    codec, blob = compress(data)
+    store.put_share(key, codec, blob)
+    return {"s": key}
+
+
+def load_shared(params, store):
+    """クエリパラメータから会話を復元（見つからなければ None）"""
+    if "c" in params:
+        # 正しいリンクは INLINE_LIMIT 文字以下（それより長いものは作らない）
+        if len(params["c"]) > INLINE_LIMIT:
+            raise ValueError("共有リンクが長すぎます")
+        data = inflate_limited(_b64decode(params["c"]))
+    elif "s" in params:
+        found = store.get_share(params["s"])
+        if found is None:
+            return None
+        data = decompress(*found)
+    else:
+        return None
+    return [tuple(m) for m in json.loads(data.decode("utf-8"))]
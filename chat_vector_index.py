@@ -0,0 +1,249 @@
+"""
+チャット履歴の意味検索（ローカルのベクトルインデックス）
+
+会話ごとに本文を埋め込みベクトルにして、ファイルに追記していきます。
+  - vectors.f32 : float32 の行列（1行 = 1会話、L2 正規化済み）。np.memmap で読む
+  - ids.i64     : 各行の会話ID
+  - deleted.i64 : 削除された会話ID（検索時に除外）
+削除した会話のIDがもう一度使われたとき（古い履歴ファイルでは SQLite が最大の id を再利用する）は、
+新しい行を追記して削除済みから外し、古い行は stale として検索から除外します。
+  - meta.json   : 埋め込みモデル名と次元数（変わったら作り直す）
+検索は行列とクエリの内積（コサイン類似度）を取り、argpartition で上位 k 件だけ並べ替えます。
+
+埋め込みは sentence-transformers があればローカルの小さいモデル（CPU で動作）を使い、
+無ければ文字 n-gram のハッシュで作るベクトルで代用します（追加のダウンロード不要）。
+"""
+import json
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+INDEX_DIR = os.path.join(".cache", "chat_vectors")
+EMBED_MODEL = os.environ.get("LOCAL_EMBED_MODEL", "intfloat/multilingual-e5-small")
+HASH_DIM = 512
+MAX_CHARS = 2000  # 1会話から埋め込みに使う文字数
+
+
+# ---------------------------
+# 埋め込み
+# ---------------------------
+class HashingEmbedder:
+    """文字 1〜3-gram をハッシュして足し合わせる簡易ベクトル（日本語でも分かち書き不要）"""
+
+    def __init__(self, dim=HASH_DIM, ngrams=(1, 2, 3)):
+        self.dim = dim
+        self.ngrams = ngrams
+        self.name = f"hashing-{dim}"
+
+    def _embed_one(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        text = text.lower()
+        for n in self.ngrams:
+            for i in range(len(text) - n + 1):
+                h = zlib.crc32(text[i:i + n].encode("utf-8"))
+                vec[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        return vec
+
+    def embed(self, texts, query=False):
+        return _normalize(np.stack([self._embed_one(t) for t in texts]))
+
+
+class SentenceTransformerEmbedder:
+    """sentence-transformers のローカルモデル（e5 系は query: / passage: を付ける）"""
+
+    def __init__(self, model_name=EMBED_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+        self.e5 = "e5" in model_name
+
+    def embed(self, texts, query=False):
+        if self.e5:
+            prefix = "query: " if query else "passage: "
+            texts = [prefix + t for t in texts]
+        vectors = self.model.encode(texts, batch_size=32, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+def get_embedder():
+    """sentence-transformers があればそれを、無ければハッシュ埋め込みを返す"""
+    try:
+        return SentenceTransformerEmbedder()
+    except Exception:
+        return HashingEmbedder()
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def conversation_text(messages):
+    """埋め込みに使う本文（system 以外を先頭から MAX_CHARS 文字）"""
+    text = "\n".join(content for role, content in messages if role != "system")
+    return text[:MAX_CHARS]
+
+
+# ---------------------------
+# インデックス
+# ---------------------------
+class VectorIndex:
+    """追記型のベクトルインデックス（スレッドセーフ。st.cache_resource で共有する想定）"""
+
+    def __init__(self, embedder, index_dir=INDEX_DIR):
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self.index_dir = index_dir
+        self.vectors_path = os.path.join(index_dir, "vectors.f32")
+        self.ids_path = os.path.join(index_dir, "ids.i64")
+        self.deleted_path = os.path.join(index_dir, "deleted.i64")
+        self.lock = threading.Lock()
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        os.makedirs(index_dir, exist_ok=True)
+        self._check_meta()
+        self._load()
+
+    def _check_meta(self):
+        """埋め込みモデルが変わっていたら古いベクトルを捨てる"""
+        meta_path = os.path.join(self.index_dir, "meta.json")
+        meta = {"embedder": self.embedder.name, "dim": self.dim}
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                if json.load(f) == meta:
+                    return
+        for path in (self.vectors_path, self.ids_path, self.deleted_path):
+            if os.path.exists(path):
+                os.remove(path)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def _load(self):
+        self.ids = np.fromfile(self.ids_path, dtype=np.int64) if os.path.exists(self.ids_path) else np.zeros(0, np.int64)
+        rows = len(self.ids)
+        # 書き込み途中で終了した場合に備えて、ids と vectors の短い方に合わせる
+        if os.path.exists(self.vectors_path):
+            rows = min(rows, os.path.getsize(self.vectors_path) // (4 * self.dim))
+        self.ids = self.ids[:rows]
+        self.matrix = self._map(rows)
+        self.row_of = {int(i): r for r, i in enumerate(self.ids)}
+        # 同じIDが複数行あるときは最後の行が有効（それより前の行は検索しない）
+        self.stale = [r for r, i in enumerate(self.ids) if self.row_of[int(i)] != r]
+        deleted = np.fromfile(self.deleted_path, dtype=np.int64) if os.path.exists(self.deleted_path) else []
+        self.deleted = {int(i) for i in deleted}
+
+    def _map(self, rows):
+        return (
+            np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            if rows else np.zeros((0, self.dim), np.float32)
+        )
+
+    def __len__(self):
+        return len(self.row_of) - len(self.deleted & self.row_of.keys())
+
+    def __contains__(self, conversation_id):
+        return conversation_id in self.row_of
+
+    # ---------------------------
+    # 追加・削除
+    # ---------------------------
+    def _needs(self, conversation_id):
+        """まだ無い、または削除済み（IDが再利用された）なら追加が必要"""
+        return conversation_id not in self.row_of or conversation_id in self.deleted
+
+    def add(self, items):
+        """items: (会話ID, 本文) のリスト。埋め込んでファイルに追記する"""
+        items = [(cid, text) for cid, text in items if self._needs(cid) and text]
+        if not items:
+            return
+        vectors = self.embedder.embed([text for _, text in items])
+        ids = np.array([cid for cid, _ in items], dtype=np.int64)
+        with self.lock:
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors.astype(np.float32).tobytes())
+            with open(self.ids_path, "ab") as f:
+                f.write(ids.tobytes())
+            # ファイル全体を読み直さず、追記した分だけ ids と row_of を更新する
+            start = len(self.ids)
+            for r, (cid, _) in enumerate(items, start=start):
+                old = self.row_of.get(cid)
+                if old is not None:
+                    self.stale.append(old)
+                self.row_of[cid] = r
+            self.ids = np.concatenate([self.ids, ids])
+            self.matrix = self._map(len(self.ids))
+            revived = self.deleted.intersection(ids.tolist())
+            if revived:
+                self.deleted -= revived
+                self._write_deleted()
+
+    def _write_deleted(self):
+        tmp = self.deleted_path + ".tmp"
+        np.array(sorted(self.deleted), dtype=np.int64).tofile(tmp)
+        os.replace(tmp, self.deleted_path)
+
+    def add_async(self, conversation_id, messages):
+        """保存直後にバックグラウンドでインデックスに追加"""
+        return self.worker.submit(self.add, [(conversation_id, conversation_text(messages))])
+
+    def remove(self, conversation_id):
+        with self.lock:
+            if conversation_id in self.row_of and conversation_id not in self.deleted:
+                with open(self.deleted_path, "ab") as f:
+                    f.write(np.array([conversation_id], dtype=np.int64).tobytes())
+                self.deleted.add(conversation_id)
+
+    def sync_async(self, store, batch_size=64):
+        """まだインデックスに無い会話をバックグラウンドでまとめて追加"""
+
+        def sync():
+            missing = [cid for cid in store.conversation_ids() if self._needs(cid)]
+            for start in range(0, len(missing), batch_size):
+                batch = []
+                for cid in missing[start:start + batch_size]:
+                    conversation = store.load_conversation(cid)
+                    if conversation:
+                        batch.append((cid, conversation_text(conversation["messages"])))
+                self.add(batch)
+
+        return self.worker.submit(sync)
+
+    # ---------------------------
+    # 検索
+    # ---------------------------
+    def _top_k(self, query_vector, k, exclude=(), only=None):
+        with self.lock:
+            matrix, ids, deleted, stale = self.matrix, self.ids, set(self.deleted), list(self.stale)
+        if not len(ids):
+            return []
+        scores = np.asarray(matrix @ query_vector)
+        if stale:
+            scores[stale] = -np.inf
+        skip = deleted.union(exclude)
+        if skip:
+            scores[np.isin(ids, list(skip))] = -np.inf
+        if only is not None:
+            scores[~np.isin(ids, list(only))] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[r]), float(scores[r])) for r in top if np.isfinite(scores[r])]
+
+    def search(self, query, k=10, only=None):
+        """意味の近い会話を (会話ID, 類似度) のリストで返す（only を渡すとその会話IDの中から）"""
+        if not query.strip():
+            return []
+        return self._top_k(self.embedder.embed([query], query=True)[0], k, only=only)
+
+    def similar(self, conversation_id, k=10, only=None):
+        """指定した会話に似た会話を返す（自分自身は除く）"""
+        with self.lock:
+            row = self.row_of.get(conversation_id)
+            if row is None:
+                return []
+            vector = np.array(self.matrix[row])
+        return self._top_k(vector, k, exclude={conversation_id}, only=only)
@@ -0,0 +1,159 @@
+"""
+「次にやること」「期限切れ」「今週が期限」をすぐに引くための索引
+
+未完了のタスクだけを、
+  - 優先度→期限 の順に並べたリスト（次にやること）
+  - 期限の順に並べたリスト（期限切れ・今週）
+の2本の整列済みリスト（SortedList）で持ち、問い合わせは先頭から k 件、または bisect で
+切り出した範囲を返すだけです。
+保存されているタスクの並び順は変えません（ソートしてファイルを書き直す必要はありません）。
+
+1本の list に insort / del すると、位置は bisect で O(log n) で見つかっても後ろの要素を
+ずらすのに O(n) かかります。SortedList は LOAD 件前後の小さなリスト（バケット）に分けて持つので、
+追加・削除でずらすのはそのバケットの中（最大 2*LOAD 件）だけです。バケットの一覧（n/LOAD 件）を
+直すのは、バケットを2つに分けるときと空になったバケットを消すときだけです。
+"""
+import datetime
+from bisect import bisect_left, insort
+from itertools import count, islice
+
+NO_DUE = datetime.date.max.toordinal()
+
+
+def week_end(today):
+    """today を含む週の日曜日"""
+    return today + datetime.timedelta(days=6 - today.weekday())
+
+
+class SortedList:
+    """重複しない値を整列した状態で持つ（バケットに分けたリスト）"""
+
+    LOAD = 256
+
+    def __init__(self):
+        self.buckets = []   # それぞれ整列済みで、バケットどうしも順に並ぶ
+        self.maxes = []     # 各バケットの最後（最大）の値
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            yield from bucket
+
+    def add(self, value):
+        self.size += 1
+        if not self.buckets:
+            self.buckets.append([value])
+            self.maxes.append(value)
+            return
+        i = min(bisect_left(self.maxes, value), len(self.maxes) - 1)
+        bucket = self.buckets[i]
+        insort(bucket, value)
+        self.maxes[i] = bucket[-1]
+        if len(bucket) > 2 * self.LOAD:
+            self.buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self.maxes[i:i + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+
+    def remove(self, value):
+        """value を取り除く（無ければ ValueError）"""
+        i = bisect_left(self.maxes, value)
+        bucket = self.buckets[i] if i < len(self.buckets) else []
+        j = bisect_left(bucket, value)
+        if j == len(bucket) or bucket[j] != value:
+            raise ValueError(f"{value!r} がありません")
+        del bucket[j]
+        self.size -= 1
+        if bucket:
+            self.maxes[i] = bucket[-1]
+        else:
+            del self.buckets[i]
+            del self.maxes[i]
+
+    def head(self, n):
+        """先頭から n 件"""
+        return list(islice(self, n))
+
+    def between(self, lo, hi):
+        """lo 以上 hi 未満の値（bisect_left で比べる）"""
+        result = []
+        i = bisect_left(self.maxes, lo)
+        if i == len(self.buckets):
+            return result
+        j = bisect_left(self.buckets[i], lo)
+        for bucket in self.buckets[i:]:
+            end = bisect_left(bucket, hi)
+            result.extend(bucket[j:end])
+            if end < len(bucket):
+                break
+            j = 0
+        return result
+
+
+class Agenda:
+    def __init__(self, todos=()):
+        self.by_priority = SortedList()   # (prio, 期限の序数, 連番)
+        self.by_due = SortedList()        # (期限の序数, 連番)
+        self.keys = {}          # id(task) -> (優先度キー, 期限キー)
+        self.tasks = {}         # 連番 -> task
+        self.seq = count()
+        for t in todos:
+            self.add(t)
+
+    def __len__(self):
+        return len(self.by_priority)
+
+    # ---------------------------
+    # 更新（タスクを変更したら update を呼ぶ）
+    # ---------------------------
+    def add(self, task):
+        if task.done or id(task) in self.keys:
+            return
+        n = next(self.seq)
+        due = task.dl.toordinal() if task.dl else NO_DUE
+        prio_key = (task.prio, due, n)
+        due_key = (due, n) if task.dl else None
+        self.by_priority.add(prio_key)
+        if due_key:
+            self.by_due.add(due_key)
+        self.keys[id(task)] = (prio_key, due_key)
+        self.tasks[n] = task
+
+    def remove(self, task):
+        keys = self.keys.pop(id(task), None)
+        if keys is None:
+            return
+        prio_key, due_key = keys
+        self.by_priority.remove(prio_key)
+        if due_key:
+            self.by_due.remove(due_key)
+        del self.tasks[prio_key[2]]
+
+    def update(self, task):
+        """優先度・期限・状態を変えたタスクを並べ直す"""
+        self.remove(task)
+        self.add(task)
+
+    # ---------------------------
+    # 問い合わせ
+    # ---------------------------
+    def next_up(self, n=5):
+        """優先度が高く期限の近い順に n 件"""
+        return [self.tasks[key[2]] for key in self.by_priority.head(n)]
+
+    def overdue(self, today=None):
+        """期限が今日より前のもの（期限の古い順）"""
+        today = today or datetime.date.today()
+        keys = self.by_due.between((), (today.toordinal(),))
+        return [self.tasks[key[1]] for key in keys]
+
+    def due_between(self, start, end):
+        """期限が start 以上 end 以下のもの（期限の近い順）"""
+        keys = self.by_due.between((start.toordinal(),), (end.toordinal() + 1,))
+        return [self.tasks[key[1]] for key in keys]
+
+    def due_this_week(self, today=None):
+        """今日から今週の日曜日までが期限のもの"""
+        today = today or datetime.date.today()
+        return self.due_between(today, week_end(today))
@@ -0,0 +1,373 @@
+"""
+タスクのバイナリ保存形式（mmap で開き、完了・優先度・期限の変更はその場で数バイト書き換えるだけ）
+
+<名前>.tdb        ヘッダ＋固定長レコード（1件 44 バイト）
+<名前>.tdb.<世代>.heap  タイトル・カテゴリ・作成日時の UTF-8 文字列を並べたもの（追記のみ）
+
+レコード: 優先度(1) 状態(1) 予備(2) 期限の序数(4, 期限なしは 0)
+          タイトル・カテゴリ・作成日時それぞれの (ヒープ内の位置(8), 長さ(4))
+テキスト形式（todo_list.txt）では1件完了にするだけでもファイル全体を書き直しますが、
+この形式では状態の1バイトを書き換えるだけです。開くときも mmap するだけなので、
+100 万件でもタスクを取り出すまではほとんど時間がかかりません。
+
+全体を書き直すときは新しい世代のヒープを作り、ヘッダの世代番号を書き換えた .tdb を
+os.replace で置き換えるので、途中で落ちても古い内容か新しい内容のどちらかが残ります。
+
+変換:
+    python todo_binstore.py todo_list.txt todo_list.tdb
+    python todo_binstore.py todo_list.tdb todo_list.json
+"""
+import argparse
+import datetime
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from todo_model import Task, STATUS_DONE, STATUS_TODO, parse_prio
+from todo_store import ConflictError, atomic_write, file_lock, file_signature, parse_lines
+
+MAGIC = b"TODB"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHQI12x")         # マジック, 形式, レコード長, 件数, ヒープの世代
+RECORD = struct.Struct("<BBxxiQIQIQI")      # 優先度, 状態, 期限, (位置, 長さ)×3
+DL = struct.Struct("<i")
+DL_OFFSET = 4
+NONE_LEN = 0xFFFFFFFF                       # 作成日時が None
+STATUS_CODES = {STATUS_TODO: 0, STATUS_DONE: 1}
+STATUSES = {code: status for status, code in STATUS_CODES.items()}
+INITIAL_CAPACITY = 64
+
+
+def heap_path(path, generation):
+    return f"{path}.{generation}.heap"
+
+
+class HeapBuilder:
+    """ヒープに並べる文字列（同じ文字列は1回だけ書く）"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.refs = {}
+
+    def put(self, text):
+        if text is None:
+            return 0, NONE_LEN
+        ref = self.refs.get(text)
+        if ref is None:
+            raw = text.encode("utf-8")
+            ref = (len(self.data), len(raw))
+            self.data += raw
+            self.refs[text] = ref
+        return ref
+
+
+def pack_record(task, put):
+    """Task を1件分のレコードの値にする（文字列は put でヒープに追加して位置を得る）"""
+    return (
+        parse_prio(task.prio),
+        STATUS_CODES.get(task.status, 0),
+        task.dl.toordinal() if task.dl else 0,
+        *put(task.title),
+        *put(task.cat),
+        *put(task.created_at),
+    )
+
+
+def _write_file(path, data):
+    """一時ファイルに書いて fsync し、os.replace で置き換える（バイナリ用）"""
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _read_generation(path):
+    try:
+        with open(path, "rb") as f:
+            _, _, _, _, generation = HEADER.unpack(f.read(HEADER.size))
+        return generation
+    except (FileNotFoundError, struct.error):
+        return 0
+
+
+def write_tasks(path, tasks):
+    """tasks で path を作り直す（ヒープも詰め直す）"""
+    old_generation = _read_generation(path)
+    generation = old_generation + 1
+    heap = HeapBuilder()
+    records = bytearray(HEADER.size + RECORD.size * max(len(tasks), INITIAL_CAPACITY))
+    HEADER.pack_into(records, 0, MAGIC, FORMAT_VERSION, RECORD.size, len(tasks), generation)
+    for i, task in enumerate(tasks):
+        RECORD.pack_into(records, HEADER.size + i * RECORD.size, *pack_record(task, heap.put))
+
+    # 新しいヒープを書いてから .tdb を置き換える（置き換えた時点で新しい内容になる）
+    _write_file(heap_path(path, generation), bytes(heap.data))
+    _write_file(path, bytes(records))
+    if old_generation:
+        try:
+            os.remove(heap_path(path, old_generation))
+        except OSError:
+            pass  # 無い、または Windows で他のプロセスが開いている
+
+
+class BinTaskFile:
+    """.tdb を mmap で開いて1件ずつ読み書きする（with で使うと閉じ忘れがない）"""
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            write_tasks(path, [])
+        self.path = path
+        self.heap_file = None
+        self.heap_map = None
+        self.file = open(path, "r+b")
+        self.records = mmap.mmap(self.file.fileno(), 0)
+        magic, version, record_size, self.count, self.generation = HEADER.unpack_from(self.records, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"{path} はタスクのバイナリ形式ではありません")
+        self.heap_file = open(heap_path(path, self.generation), "r+b")
+        self.heap_size = os.fstat(self.heap_file.fileno()).st_size
+        self.refs = {}  # 追記した文字列の位置（カテゴリなどを使い回す）
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.heap_map is not None:
+            self.heap_map.close()
+            self.heap_map = None
+        if self.heap_file is not None:
+            self.heap_file.close()
+        self.records.close()
+        self.file.close()
+
+    def flush(self):
+        self.records.flush()
+        self.heap_file.flush()
+
+    # ---------------------------
+    # 読み込み
+    # ---------------------------
+    def _offset(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return HEADER.size + i * RECORD.size
+
+    def _string(self, offset, length):
+        if length == NONE_LEN:
+            return None
+        if length == 0:
+            return ""
+        if self.heap_map is None or offset + length > len(self.heap_map):
+            # 追記でヒープが伸びたら開き直す
+            if self.heap_map is not None:
+                self.heap_map.close()
+            self.heap_map = mmap.mmap(self.heap_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.heap_map[offset:offset + length].decode("utf-8")
+
+    def _task(self, values):
+        prio, status, dl, title_off, title_len, cat_off, cat_len, created_off, created_len = values
+        return Task(
+            self._string(title_off, title_len),
+            self._string(cat_off, cat_len),
+            prio,
+            datetime.date.fromordinal(dl) if dl else None,
+            STATUSES.get(status, STATUS_TODO),
+            self._string(created_off, created_len),
+        )
+
+    def __getitem__(self, i):
+        return self._task(RECORD.unpack_from(self.records, self._offset(i)))
+
+    def __iter__(self):
+        end = HEADER.size + self.count * RECORD.size
+        for values in RECORD.iter_unpack(self.records[HEADER.size:end]):
+            yield self._task(values)
+
+    def tasks(self):
+        return list(self)
+
+    # ---------------------------
+    # その場での書き換え
+    # ---------------------------
+    def set_status(self, i, status):
+        """状態の1バイトだけ書き換える"""
+        self.records[self._offset(i) + 1] = STATUS_CODES.get(status, 0)
+
+    def set_prio(self, i, prio):
+        self.records[self._offset(i)] = parse_prio(prio)
+
+    def set_dl(self, i, dl):
+        DL.pack_into(self.records, self._offset(i) + DL_OFFSET, dl.toordinal() if dl else 0)
+
+    def _put_string(self, text):
+        if text is None:
+            return 0, NONE_LEN
+        ref = self.refs.get(text)
+        if ref is None:
+            raw = text.encode("utf-8")
+            self.heap_file.seek(self.heap_size)
+            self.heap_file.write(raw)
+            ref = (self.heap_size, len(raw))
+            self.heap_size += len(raw)
+            self.refs[text] = ref
+        return ref
+
+    def _put_if_changed(self, text, offset, length):
+        """文字列が変わっていなければ今の位置をそのまま使う（ヒープに追記しない）"""
+        if self._string(offset, length) == text:
+            return offset, length
+        return self._put_string(text)
+
+    def write(self, i, task):
+        """i 件目を task の内容にする。文字列が変わったときだけヒープに追記"""
+        offset = self._offset(i)
+        old = RECORD.unpack_from(self.records, offset)
+        title = self._put_if_changed(task.title, old[3], old[4])
+        cat = self._put_if_changed(task.cat, old[5], old[6])
+        created = self._put_if_changed(task.created_at, old[7], old[8])
+        self.heap_file.flush()
+        RECORD.pack_into(self.records, offset, parse_prio(task.prio), STATUS_CODES.get(task.status, 0),
+                         task.dl.toordinal() if task.dl else 0, *title, *cat, *created)
+
+    def append(self, task):
+        end = HEADER.size + (self.count + 1) * RECORD.size
+        if end > len(self.records):
+            # 容量を倍にして開き直す
+            self.records.flush()
+            self.records.close()
+            self.file.truncate(HEADER.size + 2 * max(self.count, INITIAL_CAPACITY) * RECORD.size)
+            self.records = mmap.mmap(self.file.fileno(), 0)
+        self.count += 1
+        values = pack_record(task, self._put_string)
+        self.heap_file.flush()
+        RECORD.pack_into(self.records, end - RECORD.size, *values)
+        self._write_count()
+
+    def delete(self, rows):
+        """rows（0 始まり）を削除して後ろを詰める（ヒープの文字列は残る。詰めるのは write_tasks）"""
+        remove = sorted(set(i for i in rows if 0 <= i < self.count))
+        if not remove:
+            return
+        dest = HEADER.size + remove[0] * RECORD.size
+        for n, i in enumerate(remove):
+            start = i + 1
+            stop = remove[n + 1] if n + 1 < len(remove) else self.count
+            size = (stop - start) * RECORD.size
+            if size:
+                self.records.move(dest, HEADER.size + start * RECORD.size, size)
+                dest += size
+        self.count -= len(remove)
+        self._write_count()
+
+    def _write_count(self):
+        HEADER.pack_into(self.records, 0, MAGIC, FORMAT_VERSION, RECORD.size, self.count, self.generation)
+
+
+# ---------------------------
+# TodoStore と同じ使い方のストア
+# ---------------------------
+class BinTodoStore:
+    """todo_store.TodoStore と同じ load / changed / refresh / save に加えて、
+    save_rows で変更した行だけをその場で書き換える"""
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+        self.skipped = []
+
+    def changed(self):
+        return file_signature(self.path) != self.signature
+
+    def load(self):
+        with file_lock(self.path, shared=True):
+            self.signature = file_signature(self.path)
+            if self.signature is None:
+                return []
+            with BinTaskFile(self.path) as f:
+                return f.tasks()
+
+    def refresh(self):
+        return self.load() if self.changed() else None
+
+    def save(self, todos):
+        """全体を書き直す。読み込んだ後に他から書き換えられていたら ConflictError"""
+        with file_lock(self.path):
+            if self.changed():
+                raise ConflictError(f"{self.path} は他のプロセスによって更新されています")
+            write_tasks(self.path, todos)
+            self.signature = file_signature(self.path)
+
+    def save_rows(self, todos, rows):
+        """rows（0 始まり）の行だけをその場で書き換える（件数が変わる操作は save を使う）"""
+        with file_lock(self.path):
+            if self.changed():
+                raise ConflictError(f"{self.path} は他のプロセスによって更新されています")
+            with BinTaskFile(self.path) as f:
+                if len(f) != len(todos):
+                    raise ConflictError(f"{self.path} の件数が一致しません")
+                for i in rows:
+                    f.write(i, todos[i])
+                f.flush()
+            self.signature = file_signature(self.path)
+
+
+# ---------------------------
+# テキスト・JSON との変換
+# ---------------------------
+def read_any(path):
+    """拡張子（.tdb / .json / それ以外はテキスト）に合わせて読み込む"""
+    if path.endswith(".tdb"):
+        with BinTaskFile(path) as f:
+            return f.tasks()
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return [Task.from_dict(d) for d in json.load(f) if isinstance(d, dict)]
+        todos, skipped = parse_lines(f)
+    for line, e in skipped:
+        print(f"読み込み中にエラー: {line} ({e})")
+    return todos
+
+
+def write_any(path, tasks):
+    """拡張子に合わせて書き出す（JSON は GitHub 版の todo_list.json と同じ形）"""
+    if path.endswith(".tdb"):
+        write_tasks(path, tasks)
+    elif path.endswith(".json"):
+        atomic_write(path, json.dumps([t.to_dict() for t in tasks], ensure_ascii=False, indent=2))
+    else:
+        atomic_write(path, "".join(t.to_line() + "\n" for t in tasks))
+
+
+def convert(src, dst):
+    tasks = read_any(src)
+    write_any(dst, tasks)
+    return len(tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="タスクファイルの形式変換（.txt / .json / .tdb）")
+    parser.add_argument("src", help="変換元（例: todo_list.txt）")
+    parser.add_argument("dst", help="変換先（例: todo_list.tdb）")
+    args = parser.parse_args()
+    print(f"{convert(args.src, args.dst)} 件を {args.dst} に書き出しました。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+日本の祝日と営業日（土日祝を除く日）の計算
+
+祝日は「国民の祝日に関する法律」の決まり（ハッピーマンデー、春分・秋分の計算式、振替休日、
+国民の休日、2019〜2021年などの特例）から MIN_YEAR〜MAX_YEAR の分をまとめて計算し、
+日付の序数（date.toordinal()）の整列済みリストにしておきます。判定や範囲の取り出しは bisect です。
+春分・秋分の日は官報で前年に発表されるもので、ここでは通常使われる近似式で求めています。
+
+営業日の計算は「ある日より前の営業日の数」を
+  平日の数（7日ごとに5日）− その日より前の平日の祝日の数（bisect）
+で O(log n) で求め、その差で件数を数えます。たくさんのタスクをまとめて計算するときは、
+numpy があれば np.busday_count / np.busday_offset に祝日の配列を渡して一度に計算します。
+
+期限の入力には YYYY-MM-DD のほかに、+3（3日後）、+3営業日、今日、明日 も使えます（parse_due）。
+"""
+import datetime
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+
+from todo_model import parse_date
+
+MIN_YEAR = 1955
+MAX_YEAR = 2099
+WEEKDAY_NAMES = "月火水木金土日"
+
+# 一度きりの祝日（皇室の行事など）
+SPECIAL_HOLIDAYS = {
+    datetime.date(1959, 4, 10): "皇太子明仁親王の結婚の儀",
+    datetime.date(1989, 2, 24): "昭和天皇の大喪の礼",
+    datetime.date(1990, 11, 12): "即位礼正殿の儀",
+    datetime.date(1993, 6, 9): "皇太子徳仁親王の結婚の儀",
+    datetime.date(2019, 5, 1): "天皇の即位の日",
+    datetime.date(2019, 10, 22): "即位礼正殿の儀",
+}
+# 東京オリンピック・パラリンピックに合わせて移した祝日
+MOVED_HOLIDAYS = {
+    2020: {"海の日": (7, 23), "スポーツの日": (7, 24), "山の日": (8, 10)},
+    2021: {"海の日": (7, 22), "スポーツの日": (7, 23), "山の日": (8, 8)},
+}
+SUBSTITUTE_START = datetime.date(1973, 4, 12)   # 振替休日ができた日
+CITIZENS_START = datetime.date(1985, 12, 27)    # 国民の休日ができた日
+
+
+# ---------------------------
+# 祝日の計算（1年分）
+# ---------------------------
+def nth_monday(year, month, n):
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(7 - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def equinox_days(year):
+    """(春分の日, 秋分の日) の日にち。1年は約 365.2422 日なので、その端数の積み重なりを
+    うるう年の数（4年ごとに1日）で戻して求める。
+    うるう年の数は基準年からの年数を4で割った近似で、うるう年の判定（100年・400年の例外）は使わない
+    （1955〜2099年の範囲では 2000年がうるう年なので結果は同じ）"""
+    if year < 1980:
+        # 負の数も 0 に向かって切り捨てる式（// だと1日ずれる）
+        leap_days = int((year - 1983) / 4)
+        return (int(20.8357 + 0.242194 * (year - 1980) - leap_days),
+                int(23.2588 + 0.242194 * (year - 1980) - leap_days))
+    leap_days = (year - 1980) // 4
+    return (int(20.8431 + 0.242194 * (year - 1980) - leap_days),
+            int(23.2488 + 0.242194 * (year - 1980) - leap_days))
+
+
+def national_holidays(year):
+    """その年の国民の祝日 {date: 名前}（振替休日・国民の休日を除く）"""
+    days = {}
+
+    def add(month, day, name):
+        days[datetime.date(year, month, day)] = name
+
+    moved = MOVED_HOLIDAYS.get(year, {})
+    vernal, autumnal = equinox_days(year)
+
+    add(1, 1, "元日")
+    if year >= 2000:
+        days[nth_monday(year, 1, 2)] = "成人の日"
+    else:
+        add(1, 15, "成人の日")
+    if year >= 1967:
+        add(2, 11, "建国記念の日")
+    if year >= 2020:
+        add(2, 23, "天皇誕生日")
+    add(3, vernal, "春分の日")
+    if year >= 2007:
+        add(4, 29, "昭和の日")
+    elif year >= 1989:
+        add(4, 29, "みどりの日")
+    else:
+        add(4, 29, "天皇誕生日")
+    add(5, 3, "憲法記念日")
+    if year >= 2007:
+        add(5, 4, "みどりの日")
+    add(5, 5, "こどもの日")
+    if "海の日" in moved:
+        add(*moved["海の日"], "海の日")
+    elif year >= 2003:
+        days[nth_monday(year, 7, 3)] = "海の日"
+    elif year >= 1996:
+        add(7, 20, "海の日")
+    if "山の日" in moved:
+        add(*moved["山の日"], "山の日")
+    elif year >= 2016:
+        add(8, 11, "山の日")
+    if year >= 2003:
+        days[nth_monday(year, 9, 3)] = "敬老の日"
+    elif year >= 1966:
+        add(9, 15, "敬老の日")
+    add(9, autumnal, "秋分の日")
+    if "スポーツの日" in moved:
+        add(*moved["スポーツの日"], "スポーツの日")
+    elif year >= 2000:
+        days[nth_monday(year, 10, 2)] = "スポーツの日" if year >= 2020 else "体育の日"
+    elif year >= 1966:
+        add(10, 10, "体育の日")
+    add(11, 3, "文化の日")
+    add(11, 23, "勤労感謝の日")
+    if 1989 <= year <= 2018:
+        add(12, 23, "天皇誕生日")
+    for day, name in SPECIAL_HOLIDAYS.items():
+        if day.year == year:
+            days[day] = name
+    return days
+
+
+def holidays_of_year(year):
+    """その年の休日 {date: 名前}（振替休日・国民の休日を含む）"""
+    national = national_holidays(year)
+    days = dict(national)
+    one = datetime.timedelta(days=1)
+
+    # 国民の休日: 前後が祝日にはさまれた平日（日曜を除く）
+    for day in national:
+        between = day + one
+        if between >= CITIZENS_START and between not in national and between + one in national \
+                and between.weekday() != 6:
+            days[between] = "国民の休日"
+
+    # 振替休日: 祝日が日曜なら次の休日でない日（2006年までは翌日の月曜のみ）
+    for day in sorted(national):
+        if day.weekday() != 6 or day < SUBSTITUTE_START:
+            continue
+        substitute = day + one
+        if year >= 2007:
+            while substitute in days:
+                substitute += one
+        if substitute not in days:
+            days[substitute] = "振替休日"
+    return days
+
+
+@lru_cache(maxsize=None)
+def _tables():
+    """MIN_YEAR〜MAX_YEAR の祝日表（最初に使うときに一度だけ作る）
+    (全ての祝日の序数, 平日の祝日の序数, 序数→名前)"""
+    names = {}
+    for year in range(MIN_YEAR, MAX_YEAR + 1):
+        for day, name in holidays_of_year(year).items():
+            names[day.toordinal()] = name
+    ordinals = sorted(names)
+    weekday_ordinals = [o for o in ordinals if (o - 1) % 7 < 5]  # 序数 1（西暦1年1月1日）は月曜
+    return ordinals, weekday_ordinals, names
+
+
+# ---------------------------
+# 祝日の問い合わせ
+# ---------------------------
+def holiday_name(day):
+    """祝日ならその名前、でなければ None"""
+    return _tables()[2].get(day.toordinal())
+
+
+def is_holiday(day):
+    return day.toordinal() in _tables()[2]
+
+
+def holidays_between(start, end):
+    """start〜end（両端含む）の祝日 [(date, 名前)]"""
+    ordinals, _, names = _tables()
+    lo = bisect_left(ordinals, start.toordinal())
+    hi = bisect_right(ordinals, end.toordinal())
+    return [(datetime.date.fromordinal(o), names[o]) for o in ordinals[lo:hi]]
+
+
+def is_business_day(day):
+    return day.weekday() < 5 and not is_holiday(day)
+
+
+# ---------------------------
+# 営業日の計算
+# ---------------------------
+def _business_days_before(ordinal):
+    """序数 ordinal の日より前の営業日の数（西暦1年1月1日から）"""
+    weeks, rest = divmod(ordinal - 1, 7)
+    return weeks * 5 + min(rest, 5) - bisect_left(_tables()[1], ordinal)
+
+
+def count_business_days(start, end):
+    """start 以上 end 未満の営業日の数（end が前なら負の数）"""
+    return _business_days_before(end.toordinal()) - _business_days_before(start.toordinal())
+
+
+def add_business_days(day, n):
+    """day から n 営業日後（n が負なら前）の日。day が営業日でなければ次の営業日から数える"""
+    ordinal = day.toordinal()
+    target = _business_days_before(ordinal) + n   # 何番目の営業日か（0 始まり）
+    # 「その日までの営業日の数 > target」となる最初の日を二分探索する
+    margin = 2 * abs(n) + 30
+    lo, hi = ordinal - margin, ordinal + margin
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _business_days_before(mid + 1) > target:
+            hi = mid
+        else:
+            lo = mid + 1
+    return datetime.date.fromordinal(lo)
+
+
+def business_days_overdue(dl, today=None):
+    """期限の翌日から今日までの営業日の数（期限が今日以降なら 0）"""
+    today = today or datetime.date.today()
+    if dl is None or dl >= today:
+        return 0
+    one = datetime.timedelta(days=1)
+    return count_business_days(dl + one, today + one)
+
+
+# ---------------------------
+# まとめて計算（numpy があれば np.busday_* を使う）
+# ---------------------------
+@lru_cache(maxsize=None)
+def _holiday_array():
+    import numpy as np
+
+    return np.array([datetime.date.fromordinal(o) for o in _tables()[1]], dtype="datetime64[D]")
+
+
+def _numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    return np
+
+
+def busday_counts(starts, ends):
+    """count_business_days を組ごとにまとめて計算したリスト"""
+    np = _numpy()
+    if np is None or not starts:
+        return [count_business_days(s, e) for s, e in zip(starts, ends)]
+    counts = np.busday_count(np.array(starts, dtype="datetime64[D]"), np.array(ends, dtype="datetime64[D]"),
+                             holidays=_holiday_array())
+    return counts.tolist()
+
+
+def busday_offsets(days, n):
+    """add_business_days(day, n) を全ての day についてまとめて計算したリスト"""
+    np = _numpy()
+    if np is None or not days:
+        return [add_business_days(day, n) for day in days]
+    result = np.busday_offset(np.array(days, dtype="datetime64[D]"), n, roll="forward", holidays=_holiday_array())
+    return result.astype(object).tolist()
+
+
+def overdue_business_days(tasks, today=None):
+    """タスクごとの「営業日で何日期限を過ぎたか」（未完了で期限切れのもの以外は 0）"""
+    today = today or datetime.date.today()
+    one = datetime.timedelta(days=1)
+    rows = [i for i, t in enumerate(tasks) if t.is_overdue(today)]
+    result = [0] * len(tasks)
+    counts = busday_counts([tasks[i].dl + one for i in rows], [today + one] * len(rows))
+    for i, count in zip(rows, counts):
+        result[i] = count
+    return result
+
+
+# ---------------------------
+# 期限の入力
+# ---------------------------
+def parse_due(text, today=None):
+    """期限の入力を date にする（空なら None）。
+    YYYY-MM-DD / +N（N日後） / +N営業日 / 今日 / 明日。読めなければ ValueError"""
+    text = text.strip()
+    today = today or datetime.date.today()
+    if not text:
+        return None
+    if text == "今日":
+        return today
+    if text == "明日":
+        return today + datetime.timedelta(days=1)
+    if text.startswith("+"):
+        body = text[1:]
+        if body.endswith("営業日") and body[:-3].isdigit():
+            return add_business_days(today, int(body[:-3]))
+        if body.endswith("日"):
+            body = body[:-1]
+        if body.isdigit():
+            return today + datetime.timedelta(days=int(body))
+    day = parse_date(text)
+    if day is None:
+        raise ValueError(f"期限の形式が不正です: {text}（YYYY-MM-DD / +3 / +3営業日 / 今日 / 明日）")
+    return day
+
+
+def day_note(day):
+    """期限が土日・祝日なら注意書き（営業日なら None）"""
+    name = holiday_name(day)
+    if name:
+        return f"{day} は祝日（{name}）です"
+    if day.weekday() >= 5:
+        return f"{day} は{WEEKDAY_NAMES[day.weekday()]}曜日です"
+    return None
@@ -0,0 +1,220 @@
+"""
+タスク操作の取り消し（undo）・やり直し（redo）
+
+リスト全体をコピーして履歴にすると1回ごとに全件分のメモリを使うので、
+操作ごとに「何をどう変えたか」だけを記録します。
+  - DeleteOp / InsertOp: 消した（足した）行の位置と Task（オブジェクトへの参照だけ）
+  - UpdateOp: 変えた Task と、変更前・変更後の項目の値
+  - ReorderOp: 並び替え前後の並び（並び替えは全件が動くので全件分の参照を持つ）
+  - Batch: 1回の保存でまとめて行った複数の操作
+取り消しは記録の逆をたどるだけなので、1万件の一括削除も元の位置に差し戻す1回の処理で済みます。
+
+履歴は Task オブジェクトを直接指すので、ファイルの読み直しなどで todos を作り直したら clear() すること。
+"""
+from collections import deque
+from contextlib import contextmanager
+
+HISTORY_DEPTH = 50
+
+
+def snapshot(task):
+    """Task の全項目の値"""
+    return tuple(getattr(task, name) for name in task.__slots__)
+
+
+def restore(task, values):
+    for name, value in zip(task.__slots__, values):
+        setattr(task, name, value)
+
+
+def _remove_rows(todos, rows, tasks, agenda):
+    """rows（昇順）の行を取り除く"""
+    if agenda is not None:
+        for t in tasks:
+            agenda.remove(t)
+    remove = set(rows)
+    todos[:] = [t for i, t in enumerate(todos) if i not in remove]
+
+
+def _insert_rows(todos, rows, tasks, agenda):
+    """tasks を rows（昇順・挿入後の位置）に差し込む"""
+    merged = []
+    rest = iter(todos)
+    for row, task in zip(rows, tasks):
+        while len(merged) < row:
+            merged.append(next(rest))
+        merged.append(task)
+    merged.extend(rest)
+    todos[:] = merged
+    if agenda is not None:
+        for t in tasks:
+            agenda.add(t)
+
+
+class DeleteOp:
+    def __init__(self, label, rows, tasks):
+        self.label = label
+        self.rows = rows
+        self.tasks = tasks
+
+    def apply(self, todos, agenda=None):
+        _remove_rows(todos, self.rows, self.tasks, agenda)
+
+    def revert(self, todos, agenda=None):
+        _insert_rows(todos, self.rows, self.tasks, agenda)
+
+
+class InsertOp(DeleteOp):
+    apply = DeleteOp.revert
+    revert = DeleteOp.apply
+
+
+class UpdateOp:
+    def __init__(self, label, tasks, before, after):
+        self.label = label
+        self.tasks = tasks
+        self.before = before
+        self.after = after
+
+    def _set(self, values, agenda):
+        for t, v in zip(self.tasks, values):
+            restore(t, v)
+            if agenda is not None:
+                agenda.update(t)
+
+    def apply(self, todos, agenda=None):
+        self._set(self.after, agenda)
+
+    def revert(self, todos, agenda=None):
+        self._set(self.before, agenda)
+
+
+class ReorderOp:
+    def __init__(self, label, before, after):
+        self.label = label
+        self.before = before
+        self.after = after
+
+    def apply(self, todos, agenda=None):
+        todos[:] = self.after
+
+    def revert(self, todos, agenda=None):
+        todos[:] = self.before
+
+
+class Batch:
+    def __init__(self, label, ops):
+        self.label = label
+        self.ops = ops
+
+    def apply(self, todos, agenda=None):
+        for op in self.ops:
+            op.apply(todos, agenda)
+
+    def revert(self, todos, agenda=None):
+        for op in reversed(self.ops):
+            op.revert(todos, agenda)
+
+
+class History:
+    def __init__(self, depth=HISTORY_DEPTH):
+        self.undo_stack = deque(maxlen=depth)
+        self.redo_stack = deque(maxlen=depth)
+        self.pending = None  # batch() の中で記録した操作
+
+    @property
+    def undo_label(self):
+        return self.undo_stack[-1].label if self.undo_stack else None
+
+    @property
+    def redo_label(self):
+        return self.redo_stack[-1].label if self.redo_stack else None
+
+    def push(self, op):
+        if self.pending is not None:
+            self.pending.append(op)
+            return
+        self.undo_stack.append(op)
+        self.redo_stack.clear()
+
+    def drop(self, *ops):
+        """保存に失敗したなどで、最後に記録した ops をなかったことにする"""
+        for op in reversed(ops):
+            if self.undo_stack and self.undo_stack[-1] is op:
+                self.undo_stack.pop()
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+
+    # ---------------------------
+    # 取り消し・やり直し（どちらも op を返す。無ければ None）
+    # ---------------------------
+    def undo(self, todos, agenda=None):
+        if not self.undo_stack:
+            return None
+        op = self.undo_stack.pop()
+        op.revert(todos, agenda)
+        self.redo_stack.append(op)
+        return op
+
+    def redo(self, todos, agenda=None):
+        if not self.redo_stack:
+            return None
+        op = self.redo_stack.pop()
+        op.apply(todos, agenda)
+        self.undo_stack.append(op)
+        return op
+
+    # ---------------------------
+    # 記録しながら操作する
+    # ---------------------------
+    def delete(self, todos, rows, label, agenda=None):
+        """rows（0 始まり）を削除して記録"""
+        rows = sorted(set(i for i in rows if 0 <= i < len(todos)))
+        op = DeleteOp(label, rows, [todos[i] for i in rows])
+        op.apply(todos, agenda)
+        self.push(op)
+        return op
+
+    def insert(self, todos, tasks, label, agenda=None):
+        """tasks を末尾に追加して記録"""
+        op = InsertOp(label, list(range(len(todos), len(todos) + len(tasks))), list(tasks))
+        op.apply(todos, agenda)
+        self.push(op)
+        return op
+
+    # updating / reordering は記録した操作を入れるリストを返す（drop に渡せる）
+    @contextmanager
+    def updating(self, tasks, label):
+        """with の中で tasks の項目を書き換えると、変わったものだけを記録する"""
+        tasks = list(tasks)
+        before = [snapshot(t) for t in tasks]
+        recorded = []
+        yield recorded
+        changed = [(t, b, snapshot(t)) for t, b in zip(tasks, before)]
+        changed = [c for c in changed if c[1] != c[2]]
+        if changed:
+            recorded.append(UpdateOp(label, [c[0] for c in changed], [c[1] for c in changed], [c[2] for c in changed]))
+            self.push(recorded[0])
+
+    @contextmanager
+    def reordering(self, todos, label):
+        """with の中で todos を並び替えると、前後の並びを記録する"""
+        before = list(todos)
+        recorded = []
+        yield recorded
+        if any(a is not b for a, b in zip(before, todos)):
+            recorded.append(ReorderOp(label, before, list(todos)))
+            self.push(recorded[0])
+
+    @contextmanager
+    def batch(self, label):
+        """with の中で記録した操作を1つの取り消し単位にする"""
+        self.pending = []
+        try:
+            yield
+        finally:
+            ops, self.pending = self.pending, None
+        if ops:
+            self.push(Batch(label, ops))
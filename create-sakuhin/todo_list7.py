@@ -1,15 +1,27 @@
 import os 
+import sys
 import datetime
 import unicodedata
 
+from todo_model import Task, PRIORITY_LABELS, STATUS_DONE, NO_DATE, parse_date
+from todo_query import QueryError, TaskIndex, compile_query, is_index_list, parse_index_list
+from todo_agenda import Agenda
+from todo_store import TodoStore, ConflictError
+from todo_binstore import BinTodoStore
+from todo_calendar import day_note, holiday_name, overdue_business_days, parse_due
+from todo_history import Batch, History, HISTORY_DEPTH
+from todo_recur import MAX_MISSED, WEEKDAYS, Rule, RuleStore, UntilOp, materialize, occurrences, parse_rule
+
 TODO_FILE = 'todo_list.txt'
+# TODO_BIN_FILE=todo_list.tdb のように指定すると、バイナリ形式（todo_binstore.py）で保存する
+TODO_BIN_FILE = os.environ.get("TODO_BIN_FILE")
+# 取り消せる操作の数（TODO_HISTORY_DEPTH=100 のように変更できる）
+TODO_HISTORY_DEPTH = int(os.environ.get("TODO_HISTORY_DEPTH", HISTORY_DEPTH))
 COLORS = {"仕事": "\033[94m", "勉強": "\033[95m", "買い物": "\033[93m", "未分類": "\033[0m"}
 COLOR_DONE = "\033[92m"
 COLOR_OVERDUE = "\033[91m"
 RESET_COLOR = "\033[0m"
 
-PRIORITY_LABELS = {1: "緊急", 2: "高", 3: "中", 4: "低"}
-
 # ---------------------------
 # Unicode幅計算（絵文字対応）
 # ---------------------------
@@ -35,47 +47,73 @@ def pad_status(s, width=10):
 # ---------------------------
 # ファイル読み書き
 # ---------------------------
+# 同じファイルを他の CLI や Streamlit アプリと共有するので、書き込みはロック＋一時ファイル経由
+store = BinTodoStore(TODO_BIN_FILE) if TODO_BIN_FILE else TodoStore(TODO_FILE)
+
 def load():
     todos = []
-    if os.path.exists(TODO_FILE):
-        try:
-            with open(TODO_FILE, encoding='utf-8') as f:
-                for l in f:
-                    try:
-                        t = l.strip().split("|")
-                        if len(t) < 5:
-                            continue
-                        todos.append({
-                            "title": t[0],
-                            "cat": t[1],
-                            "prio": int(t[2]),
-                            "dl": t[3] if t[3] != "None" else None,
-                            "status": t[4]
-                        })
-                    except Exception as e:
-                        print(f"読み込み中にエラー: {l.strip()} ({e})")
-        except Exception as e:
-            print(f"ファイル読み込みエラー: {e}")
+    try:
+        todos = store.load()
+        for line, e in store.skipped:
+            print(f"読み込み中にエラー: {line} ({e})")
+    except Exception as e:
+        print(f"ファイル読み込みエラー: {e}")
     return todos
 
-def save(todos):
+def save(todos, rows=None):
+    """rows（0 始まりの行番号）を渡すと、バイナリ形式ではその行だけをその場で書き換える。
+    保存できたら True"""
+    global task_index
+    task_index = None  # 変更したので検索用の索引は次の検索で作り直す
     try:
-        with open(TODO_FILE, 'w', encoding='utf-8') as f:
-            for t in todos:
-                f.write("|".join([t['title'], t['cat'], str(t['prio']), str(t['dl']), t['status']]) + "\n")
+        if rows is None:
+            store.save(todos)
+        else:
+            store.save_rows(todos, rows)
+        return True
+    except ConflictError:
+        # 他で更新された内容を上書きしないよう、読み直してから操作をやり直してもらう
+        reload(todos)
+        raise ConflictError("他の画面でファイルが更新されていたため保存しませんでした。"
+                            "最新の内容を読み込んだので、もう一度実行してください。")
     except Exception as e:
         print(f"ファイル保存エラー: {e}")
+        return False
+
+def reload(todos):
+    """ファイルの内容で todos を置き換え、索引も作り直す（履歴は古いタスクを指すので消す）"""
+    global agenda, task_index
+    todos[:] = load()
+    agenda = Agenda(todos)
+    task_index = None
+    history.clear()
+
+# ---------------------------
+# 検索式（索引は変更・保存するまで使い回す）
+# ---------------------------
+task_index = None
+
+def select(todos, text):
+    """検索式に合うタスクの行番号（0 始まり）"""
+    global task_index
+    if task_index is None or task_index.todos is not todos:
+        task_index = TaskIndex(todos)
+    return task_index.select(compile_query(text))
 
 # ---------------------------
 # 日付チェック
 # ---------------------------
-def validate_date(date_str):
+def validate_date(date_str, warn_holiday=True):
+    """期限の入力（YYYY-MM-DD / +3 / +3営業日 / 今日 / 明日）を date にする。不正なら None"""
     try:
-        datetime.datetime.strptime(date_str, "%Y-%m-%d")
-        return True
+        day = parse_due(date_str)
     except ValueError:
-        print("⚠️ 日付形式が不正です（YYYY-MM-DD 形式で入力してください）")
-        return False
+        print("⚠️ 日付形式が不正です（YYYY-MM-DD / +3 / +3営業日 / 今日 / 明日 で入力してください）")
+        return None
+    note = day_note(day) if day and warn_holiday else None
+    if note:
+        print(f"ℹ️ 期限の {note}")
+    return day
 
 # ---------------------------
 # タスク表示
@@ -88,10 +126,11 @@ def display_todos(todos, indices=None):
         return
 
     try:
+        late = overdue_business_days(display_list, today)
         max_idx_width = max(len(str(i)) for i in range(len(todos))) + 1
-        max_title_width = max(max(str_width_unicode(t['title']) for t in todos), 20)
-        max_cat_width = max(max(str_width_unicode(t['cat']) for t in todos), 10)
-        max_dl_width = max(max(str_width_unicode(t['dl'] if t['dl'] else "----------") for t in todos), 10)
+        max_title_width = max(max(str_width_unicode(t.title) for t in todos), 20)
+        max_cat_width = max(max(str_width_unicode(t.cat) for t in todos), 10)
+        max_dl_width = max(max(str_width_unicode(t.dl_str or NO_DATE) for t in todos), 10)
         max_prio_width = 6
         status_width = 10
 
@@ -104,30 +143,24 @@ def display_todos(todos, indices=None):
         for i, t in enumerate(display_list):
             idx = indices[i] if indices else i
             status_icon = "[未]"
-            color = COLORS.get(t['cat'], "")
-            if t['status'] == "完":
+            color = COLORS.get(t.cat, "")
+            if t.done:
                 status_icon = "[完]"
                 color = COLOR_DONE
-            elif t['dl'] and t['status'] != "完":
-                try:
-                    dl_date = datetime.datetime.strptime(t['dl'], "%Y-%m-%d").date()
-                    if dl_date < today:
-                        status_icon = "[超過]"
-                        color = COLOR_OVERDUE
-                except:
-                    pass
-
-            idx_str = pad_right_unicode(f"{idx}:", max_idx_width)
+            elif t.is_overdue(today):
+                status_icon = f"[超過{late[i]}]" if late[i] else "[超過]"
+                color = COLOR_OVERDUE
+
+            idx_str = pad_right_unicode(f"{idx + 1}:", max_idx_width)
             status_str = pad_status(status_icon, status_width)
-            title_str = pad_right_unicode(t['title'], max_title_width)
-            cat_str = pad_right_unicode(t['cat'], max_cat_width)
-            prio_label = PRIORITY_LABELS.get(t['prio'], "中")
-            prio_str = pad_right_unicode(prio_label, max_prio_width)
-            dl_str = pad_right_unicode(t['dl'] if t['dl'] else "----------", max_dl_width)
+            title_str = pad_right_unicode(t.title, max_title_width)
+            cat_str = pad_right_unicode(t.cat, max_cat_width)
+            prio_str = pad_right_unicode(t.prio_label, max_prio_width)
+            dl_str = pad_right_unicode(t.dl_str or NO_DATE, max_dl_width)
 
             print(f"{color}{idx_str} {status_str} {title_str} {cat_str} {prio_str} {dl_str}{RESET_COLOR}")
 
-        incomplete_count = sum(1 for t in todos if t['status'] != "完")
+        incomplete_count = sum(1 for t in todos if not t.done)
         print(f"\n📋 未完了タスク数: {incomplete_count}/{len(todos)}")
     except Exception as e:
         print(f"タスク表示エラー: {e}")
@@ -137,7 +170,7 @@ def display_todos(todos, indices=None):
 # ---------------------------
 def add(todos):
     try:
-        print("入力例：買い物に行く,私用,3,2025-10-10")
+        print("入力例：買い物に行く,私用,3,2025-10-10（期限は +3 で3日後、+3営業日 で土日祝を除いた3日後）")
         line = input("タスク名(複数;区切り),カテゴリ,優先度(1:緊急 2:高 3:中 4:低),期限: ").strip()
         if not line:
             print("入力が空です。")
@@ -152,16 +185,15 @@ def add(todos):
         if len(parts) > 3 and parts[3]:
             date_input = parts[3]
             while True:
-                if validate_date(date_input):
-                    dl = date_input
+                dl = validate_date(date_input)
+                if dl:
                     break
-                date_input = input("再入力してください (YYYY-MM-DD または Enterでスキップ): ").strip()
+                date_input = input("再入力してください (YYYY-MM-DD / +3 / +3営業日 または Enterでスキップ): ").strip()
                 if not date_input:
                     dl = None
                     break
 
-        for t in titles:
-            todos.append({"title": t, "cat": cat, "prio": prio, "dl": dl, "status": "未"})
+        history.insert(todos, [Task(t, cat, prio, dl) for t in titles], f"追加（{len(titles)}件）", agenda)
         save(todos)
         print(f"{len(titles)}件のタスクを追加しました。")
     except Exception as e:
@@ -174,7 +206,7 @@ def import_from_file(todos):
             print("ファイルが見つかりません。")
             return
 
-        added_count = 0
+        tasks = []
         with open(file_path, 'r', encoding='utf-8') as f:
             for line in f:
                 line = line.strip()
@@ -186,13 +218,13 @@ def import_from_file(todos):
                     continue
                 cat = parts[1] if len(parts) > 1 and parts[1] else "未分類"
                 prio = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() and 1 <= int(parts[2]) <= 4 else 3
-                dl = parts[3] if len(parts) > 3 and validate_date(parts[3]) else None
+                dl = validate_date(parts[3], warn_holiday=False) if len(parts) > 3 and parts[3] else None
 
-                todos.append({"title": title, "cat": cat, "prio": prio, "dl": dl, "status": "未"})
-                added_count += 1
+                tasks.append(Task(title, cat, prio, dl))
 
+        history.insert(todos, tasks, f"まとめて追加（{len(tasks)}件）", agenda)
         save(todos)
-        print(f"{added_count}件のタスクをファイルから登録しました。")
+        print(f"{len(tasks)}件のタスクをファイルから登録しました。")
     except Exception as e:
         print(f"ファイル登録エラー: {e}")
 
@@ -207,27 +239,14 @@ def sort_todos(todos):
         sort_count += 1
         if sort_count % 2 == 0:
             # 偶数回目は期限順
-            def key_dl(x):
-                if x['dl']:
-                    try:
-                        return datetime.datetime.strptime(x['dl'], "%Y-%m-%d").date()
-                    except:
-                        pass
-                return datetime.date.max
-            todos.sort(key=key_dl)
+            with history.reordering(todos, "期限順のソート"):
+                todos.sort(key=lambda x: x.dl or datetime.date.max)
             save(todos)
             print("期限順に並び替えました。")
         else:
             # 奇数回目は優先度+期限
-            def key_prio_dl(x):
-                dl = datetime.date.max
-                if x['dl']:
-                    try:
-                        dl = datetime.datetime.strptime(x['dl'], "%Y-%m-%d").date()
-                    except:
-                        pass
-                return (x['prio'], dl)
-            todos.sort(key=key_prio_dl)
+            with history.reordering(todos, "優先度と期限のソート"):
+                todos.sort(key=lambda x: (x.prio, x.dl or datetime.date.max))
             save(todos)
             print("タスクを優先度と期限で並び替えました。")
 
@@ -241,10 +260,11 @@ def show(todos):
         print("タスクはありません。")
         return
     try:
+        late = overdue_business_days(todos, today)
         max_idx_width = len(str(len(todos))) + 1
-        max_title_width = max(max(str_width_unicode(t['title']) for t in todos), 20)
-        max_cat_width = max(max(str_width_unicode(t['cat']) for t in todos), 10)
-        max_dl_width = max(max(str_width_unicode(t['dl'] if t['dl'] else "----------") for t in todos), 10)
+        max_title_width = max(max(str_width_unicode(t.title) for t in todos), 20)
+        max_cat_width = max(max(str_width_unicode(t.cat) for t in todos), 10)
+        max_dl_width = max(max(str_width_unicode(t.dl_str or NO_DATE) for t in todos), 10)
         max_prio_width = 6
         status_width = 10
 
@@ -256,76 +276,79 @@ def show(todos):
 
         for i, t in enumerate(todos, start=1):
             status_icon = "[未]"
-            color = COLORS.get(t['cat'], "")
-            if t['status'] == "完":
+            color = COLORS.get(t.cat, "")
+            if t.done:
                 status_icon = "[完]"
                 color = COLOR_DONE
-            elif t['dl'] and t['status'] != "完":
-                try:
-                    dl_date = datetime.datetime.strptime(t['dl'], "%Y-%m-%d").date()
-                    if dl_date < today:
-                        status_icon = "[超過]"
-                        color = COLOR_OVERDUE
-                except:
-                    pass
+            elif t.is_overdue(today):
+                status_icon = f"[超過{late[i - 1]}]" if late[i - 1] else "[超過]"
+                color = COLOR_OVERDUE
 
             idx_str = pad_right_unicode(f"{i}:", max_idx_width)
             status_str = pad_status(status_icon, status_width)
-            title_str = pad_right_unicode(t['title'], max_title_width)
-            cat_str = pad_right_unicode(t['cat'], max_cat_width)
-            prio_label = PRIORITY_LABELS.get(t['prio'], "中")
-            prio_str = pad_right_unicode(prio_label, max_prio_width)
-            dl_str = pad_right_unicode(t['dl'] if t['dl'] else "----------", max_dl_width)
+            title_str = pad_right_unicode(t.title, max_title_width)
+            cat_str = pad_right_unicode(t.cat, max_cat_width)
+            prio_str = pad_right_unicode(t.prio_label, max_prio_width)
+            dl_str = pad_right_unicode(t.dl_str or NO_DATE, max_dl_width)
 
             print(f"{color}{idx_str} {status_str} {title_str} {cat_str} {prio_str} {dl_str}{RESET_COLOR}")
 
-        incomplete_count = sum(1 for t in todos if t['status'] != "完")
+        incomplete_count = sum(1 for t in todos if not t.done)
         print(f"\n📋 未完了タスク数: {incomplete_count}/{len(todos)}")
     except Exception as e:
         print(f"タスク表示エラー: {e}")
 
+# ---------------------------
+# 対象の指定（番号または検索式）
+# ---------------------------
+def select_targets(todos, action):
+    """
+    操作対象を番号（1,3-5,8）か検索式（cat:仕事 prio<=2 overdue など）で受け取り、
+    1 ベースの番号のリストを返す。検索式のときは件数を見せて確認する。
+    """
+    raw = input(f"{action}するNoを複数指定、または検索式を入力してください（例: 1,3-5,8 / cat:仕事 overdue）: ").strip()
+    if not raw:
+        print("入力が空です。")
+        return []
+    if is_index_list(raw):
+        return parse_index_list(raw, len(todos))
+
+    try:
+        found = select(todos, raw)
+    except QueryError as e:
+        print(f"検索式エラー: {e}")
+        return []
+    if not found:
+        return []
+    display_todos(todos, indices=found)
+    answer = input(f"{len(found)} 件を{action}します。よろしいですか？(y/N): ").strip().lower()
+    if answer != "y":
+        print("中止しました。")
+        return []
+    return [i + 1 for i in found]
+
 # ---------------------------
 # 追加: 複数削除対応関数
 # ---------------------------
 def delete_multi(todos):
     """
-    複数削除（範囲・複数指定対応）
+    複数削除（範囲・複数指定・検索式対応）
     入力例:
       1,3,5
       2-4
       1,3-5,8
-    入力は 1 ベース。無効な番号は無視されます。
+      status:完 cat:買い物
+    番号は 1 ベース。無効な番号は無視されます。
     """
     try:
         show(todos)
-        raw = input("削除するNoを複数指定してください（例: 1,3-5,8）: ").strip()
-        if not raw:
-            print("入力が空です。")
-            return
-
-        to_delete = set()
-        for part in raw.split(","):
-            part = part.strip()
-            if not part:
-                continue
-            if "-" in part:
-                bounds = part.split("-")
-                if len(bounds) == 2 and bounds[0].strip().isdigit() and bounds[1].strip().isdigit():
-                    start = int(bounds[0].strip())
-                    end = int(bounds[1].strip())
-                    if start <= end:
-                        to_delete.update(range(start, end + 1))
-            elif part.isdigit():
-                to_delete.add(int(part))
-
-        # 有効な1ベース番号に限定
-        valid = [i for i in to_delete if 1 <= i <= len(todos)]
+        valid = select_targets(todos, "削除")
         if not valid:
             print("削除対象が見つかりません。")
             return
 
-        for i in sorted(valid, reverse=True):
-            todos.pop(i - 1)
+        # 後ろから pop すると1件ごとに詰め直すので、残すものだけで作り直す（消したタスクと位置は履歴に残る）
+        history.delete(todos, [i - 1 for i in valid], f"削除（{len(valid)}件）", agenda)
 
         save(todos)
         print(f"{len(valid)} 件のタスクを削除しました。")
@@ -338,44 +361,27 @@ def delete_multi(todos):
 # ---------------------------
 def complete_multi(todos):
     """
-    複数完了（範囲・複数指定対応）
+    複数完了（範囲・複数指定・検索式対応）
     入力例:
       1,3,5
       2-4
       1,3-5,8
-    入力は 1 ベース。無効な番号は無視されます。
+      cat:仕事 overdue
+    番号は 1 ベース。無効な番号は無視されます。
     """
     try:
         show(todos)
-        raw = input("完了にするNoを複数指定してください（例: 1,3-5,8）: ").strip()
-        if not raw:
-            print("入力が空です。")
-            return
-
-        to_complete = set()
-        for part in raw.split(","):
-            part = part.strip()
-            if not part:
-                continue
-            if "-" in part:
-                bounds = part.split("-")
-                if len(bounds) == 2 and bounds[0].strip().isdigit() and bounds[1].strip().isdigit():
-                    start = int(bounds[0].strip())
-                    end = int(bounds[1].strip())
-                    if start <= end:
-                        to_complete.update(range(start, end + 1))
-            elif part.isdigit():
-                to_complete.add(int(part))
-
-        valid = [i for i in to_complete if 1 <= i <= len(todos)]
+        valid = select_targets(todos, "完了に")
         if not valid:
             print("完了対象が見つかりません。")
             return
 
-        for i in sorted(valid):
-            todos[i - 1]['status'] = "完"
+        with history.updating([todos[i - 1] for i in valid], f"完了（{len(valid)}件）"):
+            for i in sorted(valid):
+                todos[i - 1].status = STATUS_DONE
+                agenda.update(todos[i - 1])
 
-        save(todos)
+        save(todos, rows=[i - 1 for i in valid])
         print(f"{len(valid)} 件のタスクを完了にしました。")
         show(todos)
     except Exception as e:
@@ -386,78 +392,256 @@ def complete_multi(todos):
 # ---------------------------
 def update_multi(todos):
     """
-    複数更新（範囲・複数指定対応）
+    複数更新（範囲・複数指定・検索式対応）
     各タスクごとに順に更新入力を求めます。Enterでその項目をスキップできます。
+    対象が多いときは、カテゴリ・優先度・期限をまとめて同じ値にすることもできます。
     入力例（タスク選択）:
       1,3-5,8
-    入力は 1 ベース。無効な番号は無視されます。
+      cat:仕事 prio>=3
+    番号は 1 ベース。無効な番号は無視されます。
     """
     try:
         show(todos)
-        raw = input("更新するNoを複数指定してください（例: 1,3-5,8）: ").strip()
-        if not raw:
-            print("入力が空です。")
-            return
-
-        to_update = set()
-        for part in raw.split(","):
-            part = part.strip()
-            if not part:
-                continue
-            if "-" in part:
-                bounds = part.split("-")
-                if len(bounds) == 2 and bounds[0].strip().isdigit() and bounds[1].strip().isdigit():
-                    start = int(bounds[0].strip())
-                    end = int(bounds[1].strip())
-                    if start <= end:
-                        to_update.update(range(start, end + 1))
-            elif part.isdigit():
-                to_update.add(int(part))
-
-        valid = sorted(i for i in to_update if 1 <= i <= len(todos))
+        valid = select_targets(todos, "更新")
         if not valid:
             print("更新対象が見つかりません。")
             return
 
+        if len(valid) > 1 and input("全件をまとめて同じ内容に更新しますか？(y/N): ").strip().lower() == "y":
+            update_bulk(todos, valid)
+            return
+
         updated_count = 0
+        with history.updating([todos[i - 1] for i in valid], f"更新（{len(valid)}件）"):
+            for i in valid:
+                t = todos[i - 1]
+                print(f"\n--- No {i} の更新 ---")
+                print(f"現在のタイトル: {t.title}")
+                new_title = input(f"新タイトル（Enterで保持）: ").strip()
+                if new_title:
+                    t.title = new_title
+
+                print(f"現在のカテゴリ: {t.cat}")
+                new_cat = input(f"新カテゴリ（Enterで保持）: ").strip()
+                if new_cat:
+                    t.cat = sys.intern(new_cat)
+
+                print(f"現在の優先度: {t.prio}")
+                new_pr = input(f"新優先度(1-4、Enterで保持）: ").strip()
+                if new_pr.isdigit() and 1 <= int(new_pr) <= 4:
+                    t.prio = int(new_pr)
+
+                print(f"現在の期限: {t.dl_str or 'なし'}")
+                new_dl = input(f"新期限(YYYY-MM-DD / +3 / +3営業日、Enterで保持）: ").strip()
+                if new_dl:
+                    day = validate_date(new_dl)
+                    if day:
+                        t.dl = day
+                    else:
+                        print("期限は保存されませんでした（形式不正）。")
+
+                agenda.update(t)
+                updated_count += 1
+
+        save(todos, rows=[i - 1 for i in valid])
+        print(f"\n{updated_count} 件のタスクを更新しました。")
+        show(todos)
+    except Exception as e:
+        print(f"複数更新エラー: {e}")
+
+def update_bulk(todos, valid):
+    """選んだタスクのカテゴリ・優先度・期限をまとめて同じ値にする"""
+    new_cat = input("新カテゴリ（Enterで保持）: ").strip()
+    new_pr = input("新優先度(1-4、Enterで保持）: ").strip()
+    new_dl = input("新期限(YYYY-MM-DD / +3 / +3営業日、Enterで保持）: ").strip()
+    dl = validate_date(new_dl) if new_dl else None
+    if new_dl and dl is None:
+        print("期限は保存されませんでした（形式不正）。")
+
+    with history.updating([todos[i - 1] for i in valid], f"まとめて更新（{len(valid)}件）"):
         for i in valid:
             t = todos[i - 1]
-            print(f"\n--- No {i} の更新 ---")
-            print(f"現在のタイトル: {t['title']}")
-            new_title = input(f"新タイトル（Enterで保持）: ").strip()
-            if new_title:
-                t['title'] = new_title
-
-            print(f"現在のカテゴリ: {t['cat']}")
-            new_cat = input(f"新カテゴリ（Enterで保持）: ").strip()
             if new_cat:
-                t['cat'] = new_cat
-
-            print(f"現在の優先度: {t['prio']}")
-            new_pr = input(f"新優先度(1-4、Enterで保持）: ").strip()
+                t.cat = sys.intern(new_cat)
             if new_pr.isdigit() and 1 <= int(new_pr) <= 4:
-                t['prio'] = int(new_pr)
+                t.prio = int(new_pr)
+            if dl:
+                t.dl = dl
+            agenda.update(t)
 
-            print(f"現在の期限: {t['dl'] or 'なし'}")
-            new_dl = input(f"新期限(YYYY-MM-DD、Enterで保持）: ").strip()
-            if new_dl:
-                if validate_date(new_dl):
-                    t['dl'] = new_dl
-                else:
-                    print("期限は保存されませんでした（形式不正）。")
+    save(todos, rows=[i - 1 for i in valid])
+    print(f"\n{len(valid)} 件のタスクを更新しました。")
+    show(todos)
 
-            updated_count += 1
+# ---------------------------
+# 取り消し・やり直し
+# ---------------------------
+history = History(TODO_HISTORY_DEPTH)
 
-        save(todos)
-        print(f"\n{updated_count} 件のタスクを更新しました。")
-        show(todos)
-    except Exception as e:
-        print(f"複数更新エラー: {e}")
+def save_history_op(todos, op):
+    """取り消し・やり直した結果を保存する（予定の完了なら、ルールの書き出し済みの日も保存する）"""
+    ops = op.ops if isinstance(op, Batch) else [op]
+    rules_changed = any(isinstance(o, UntilOp) for o in ops)
+    try:
+        saved = save(todos)
+    except ConflictError:
+        if rules_changed:
+            rules[:] = rule_store.load()  # 戻した書き出し済みの日もファイルの内容に戻す
+        raise
+    if saved and rules_changed:
+        save_rules()
+
+def undo(todos):
+    op = history.undo(todos, agenda)
+    if op is None:
+        print("取り消せる操作はありません。")
+        return
+    save_history_op(todos, op)
+    print(f"「{op.label}」を取り消しました。")
+    show(todos)
+
+def redo(todos):
+    op = history.redo(todos, agenda)
+    if op is None:
+        print("やり直せる操作はありません。")
+        return
+    save_history_op(todos, op)
+    print(f"「{op.label}」をやり直しました。")
+    show(todos)
+
+# ---------------------------
+# 次にやること・期限切れ・今週（並び替えずに索引から表示）
+# ---------------------------
+agenda = Agenda()
+
+def show_tasks(todos, tasks, empty_message):
+    if not tasks:
+        print(empty_message)
+        return
+    positions = {id(t): i for i, t in enumerate(todos)}
+    display_todos(todos, indices=[positions[id(t)] for t in tasks])
+
+def next_up(todos):
+    raw = input("表示する件数（Enterで5件）: ").strip()
+    n = int(raw) if raw.isdigit() and int(raw) > 0 else 5
+    show_tasks(todos, agenda.next_up(n), "未完了のタスクはありません。")
+
+def overdue(todos):
+    tasks = agenda.overdue()
+    show_tasks(todos, tasks, "期限切れのタスクはありません。")
+    if tasks:
+        late = overdue_business_days(tasks)
+        print(f"⏰ 営業日（土日祝を除く）での遅れ: 最大 {max(late)} 日 / 合計 {sum(late)} 日")
+
+def this_week(todos):
+    show_tasks(todos, agenda.due_this_week(), "今週が期限のタスクはありません。")
+
+# ---------------------------
+# 繰り返しタスク（ルールだけを todo_rules.txt に保存し、予定は表示する期間の分だけ作る）
+# ---------------------------
+rule_store = RuleStore()
+rules = []
+
+def save_rules():
+    """ルールを保存する。他の画面で更新されていたら読み直して ConflictError"""
+    try:
+        rule_store.save(rules)
+    except ConflictError:
+        rules[:] = rule_store.load()
+        raise ConflictError("他の画面で繰り返しルールが更新されていたため保存しませんでした。"
+                            "最新の内容を読み込んだので、もう一度実行してください。")
+
+def recurring(todos):
+    """繰り返しルールの一覧・追加・削除"""
+    for i, r in enumerate(rules, start=1):
+        print(f"{i}: {r.title} [{r.cat}] {PRIORITY_LABELS[r.prio]} {r.label}（{r.start} から）")
+    if not rules:
+        print("繰り返しタスクはありません。")
+    print("入力例：週報,仕事,2,毎週:金,2025-10-03 ／ 削除は -番号")
+    raw = input("追加: タイトル,カテゴリ,優先度,繰り返し(毎日/毎週:月,水/毎月:15/平日),開始日（Enterで戻る）: ").strip()
+    if not raw:
+        return
+    if raw.startswith("-") and raw[1:].isdigit():
+        n = int(raw[1:])
+        if not 1 <= n <= len(rules):
+            print("番号が範囲外です。")
+            return
+        removed = rules.pop(n - 1)
+        save_rules()
+        print(f"「{removed.title}」の繰り返しを削除しました。")
+        return
+
+    parts = [p.strip() for p in raw.split(",")]
+    if len(parts) < 4 or not parts[0]:
+        print("タイトル・カテゴリ・優先度・繰り返しを入力してください。")
+        return
+    # 毎週:月,水 のように曜日を , で区切った場合は4項目目以降を曜日としてつなぐ
+    rule_parts = parts[3:]
+    start = None
+    if rule_parts and parse_date(rule_parts[-1]):
+        start = rule_parts.pop()
+    try:
+        kind, weekdays, day = parse_rule(",".join(rule_parts))
+    except ValueError as e:
+        print(e)
+        return
+    rule = Rule(parts[0], parts[1], parts[2], kind, weekdays, day, start)
+    rules.append(rule)
+    save_rules()
+    print(f"「{rule.title}」を{rule.label}の繰り返しとして登録しました。")
+
+def upcoming(todos):
+    """これからの予定を表示し、選んだ予定を完了にしてタスクとして書き出す"""
+    raw = input("何日先まで表示しますか（Enterで14日）: ").strip()
+    days = int(raw) if raw.isdigit() else 14
+    today = datetime.date.today()
+    window = list(occurrences(rules, today, today + datetime.timedelta(days=days)))
+    if not window:
+        print("予定はありません。")
+        return
+    for i, (day, r) in enumerate(window, start=1):
+        name = holiday_name(day)
+        print(f"{i}: {day}({WEEKDAYS[day.weekday()]}{'・' + name if name else ''}) {r.title} [{r.cat}] {r.label}")
+
+    raw = input("完了にする番号（Enterでスキップ）: ").strip()
+    if not raw.isdigit() or not 1 <= int(raw) <= len(window):
+        return
+    day, rule = window[int(raw) - 1]
+    missed = len(rule.missed(day))
+    limit = 0
+    if missed:
+        print(f"{day} より前にまだ追加していない予定が {missed} 件あります。")
+        if missed > MAX_MISSED:
+            print(f"追加する場合は新しい {MAX_MISSED} 件だけを追加します。")
+        if input("未完了のタスクとして追加しますか（y/N）: ").strip().lower() == "y":
+            limit = MAX_MISSED
+    tasks = materialize(rule, day, limit)
+    label = f"繰り返し「{rule.title}」{day} の完了"
+    op = history.insert(todos, tasks, label, agenda)
+    # 書き出し済みの日はタスクを保存できてから進める
+    # （ConflictError なら save が読み直すので、ルールは変えないまま終わる）
+    if not save(todos):
+        op.revert(todos, agenda)
+        history.drop(op)
+        return
+    # 取り消したときに前の書き出し済みの日に戻せるよう、タスクの追加と1つの操作として記録する
+    until_op = UntilOp(label, rules, rule.key, rule.until, day)
+    until_op.apply()
+    history.drop(op)
+    history.push(Batch(label, [op, until_op]))
+    try:
+        save_rules()
+    except ConflictError:
+        # タスクは保存済みなので、読み直したルールにも書き出し済みの日を付け直して保存する
+        until_op.apply()
+        save_rules()
+    if len(tasks) > 1:
+        print(f"それより前の予定 {len(tasks) - 1} 件を未完了のタスクとして追加しました。")
+    print(f"{day} の「{rule.title}」を完了にしました。")
 
 # ---------------------------
 # メインループ
 # ---------------------------
-todos = load()
 cmds = {
     "追加": add,
     "表示": show,
@@ -466,31 +650,57 @@ cmds = {
     "完了": complete_multi,
     "ソート": sort_todos,
     "検索": None,
-    "まとめて追加": import_from_file
+    "まとめて追加": import_from_file,
+    "次": next_up,
+    "超過": overdue,
+    "今週": this_week,
+    "取消": undo,
+    "やり直し": redo,
+    "繰り返し": recurring,
+    "予定": upcoming,
 }
 
 # search wrapper to match earlier name
 def search(todos):
+    """キーワード、または検索式（cat:仕事 prio<=2 overdue status:未 "会議" など）で検索"""
     try:
-        kw = input("検索キーワード: ")
-        found = [i for i, t in enumerate(todos) if kw in t['title'] or kw in t['cat']]
+        kw = input("検索キーワード または 検索式: ").strip()
+        if not kw:
+            print("入力が空です。")
+            return
+        found = select(todos, kw)
         if found:
             display_todos(todos, indices=found)
         else:
             print("該当タスクはありません。")
+    except QueryError as e:
+        print(f"検索式エラー: {e}")
     except Exception as e:
         print(f"検索エラー: {e}")
 
 cmds["検索"] = search
 
-while True:
-    try:
-        c = input("コマンド(追加,表示,削除,更新,完了,ソート,検索,まとめて追加,終了): ").strip()
-        if c == "終了":
-            break
-        elif c in cmds:
-            cmds[c](todos)
-        else:
-            print("無効なコマンドです。")
-    except Exception as e:
-        print(f"予期せぬエラー: {e}")
+def main():
+    todos = []
+    reload(todos)
+    rules[:] = rule_store.load()
+    while True:
+        try:
+            c = input("コマンド(追加,表示,削除,更新,完了,ソート,検索,まとめて追加,次,超過,今週,取消,やり直し,繰り返し,予定,終了): ").strip()
+            if c == "終了":
+                break
+            elif c in cmds:
+                # 他の画面で変更されていたときだけ読み直す（stat で判定）
+                if store.changed():
+                    reload(todos)
+                    print("（ファイルの変更を読み込みました）")
+                if rule_store.changed():
+                    rules[:] = rule_store.load()
+                cmds[c](todos)
+            else:
+                print("無効なコマンドです。")
+        except Exception as e:
+            print(f"予期せぬエラー: {e}")
+
+if __name__ == '__main__':
+    main()
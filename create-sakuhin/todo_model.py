@@ -0,0 +1,169 @@
+"""
+タスクのデータ型（CLI・Web アプリ共通）
+
+タスクは1件ずつ dict にすると、キー文字列とハッシュ表の分だけメモリを使います。
+Task は __slots__ で項目を固定し、カテゴリ・状態は sys.intern で同じ文字列を共有、
+期限は date、優先度は int で持ちます。
+ファイルや GitHub との読み書き（保存形式との変換）は from_* / to_* だけで行います。
+
+大量のタスクをまとめて扱うとき（絞り込み・集計など）は、列ごとの配列で持つ TaskTable を使います。
+"""
+import datetime
+import sys
+from array import array
+
+PRIORITY_LABELS = {1: "緊急", 2: "高", 3: "中", 4: "低"}
+DEFAULT_CAT = "未分類"
+DEFAULT_PRIO = 3
+STATUS_TODO = sys.intern("未")
+STATUS_DONE = sys.intern("完")
+DATE_FORMAT = "%Y-%m-%d"
+NO_DATE = "----------"
+
+
+def parse_date(value):
+    """'YYYY-MM-DD' を date にする（空・'None'・不正な値は None）"""
+    if isinstance(value, datetime.date):
+        return value
+    if not value or value == "None":
+        return None
+    try:
+        return datetime.datetime.strptime(value, DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+def parse_prio(value):
+    """1〜4 以外は 3（中）"""
+    try:
+        prio = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PRIO
+    return prio if prio in PRIORITY_LABELS else DEFAULT_PRIO
+
+
+class Task:
+    __slots__ = ("title", "cat", "prio", "dl", "status", "created_at")
+
+    def __init__(self, title, cat=DEFAULT_CAT, prio=DEFAULT_PRIO, dl=None, status=STATUS_TODO, created_at=None):
+        self.title = title
+        self.cat = sys.intern(cat or DEFAULT_CAT)
+        self.prio = parse_prio(prio)
+        self.dl = parse_date(dl)
+        self.status = sys.intern(status or STATUS_TODO)
+        self.created_at = created_at
+
+    def __repr__(self):
+        return (f"Task({self.title!r}, cat={self.cat!r}, prio={self.prio}, "
+                f"dl={self.dl_str!r}, status={self.status!r})")
+
+    def __eq__(self, other):
+        if not isinstance(other, Task):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    # ---------------------------
+    # 表示用
+    # ---------------------------
+    @property
+    def dl_str(self):
+        """期限の文字列（無ければ None）"""
+        return self.dl.strftime(DATE_FORMAT) if self.dl else None
+
+    @property
+    def prio_label(self):
+        return PRIORITY_LABELS.get(self.prio, "中")
+
+    @property
+    def done(self):
+        return self.status == STATUS_DONE
+
+    def is_overdue(self, today=None):
+        return not self.done and self.dl is not None and self.dl < (today or datetime.date.today())
+
+    # ---------------------------
+    # 保存形式との変換
+    # ---------------------------
+    @classmethod
+    def from_dict(cls, d):
+        """todo_list.json の1件から作る（欠けた項目は既定値）"""
+        return cls(
+            d.get("title", ""),
+            d.get("cat"),
+            d.get("prio"),
+            d.get("dl"),
+            d.get("status"),
+            d.get("created_at"),
+        )
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "cat": self.cat,
+            "prio": self.prio,
+            "dl": self.dl_str,
+            "status": self.status,
+            "created_at": self.created_at,
+        }
+
+    @classmethod
+    def from_line(cls, line):
+        """todo_list.txt の1行（タイトル|カテゴリ|優先度|期限|状態）から作る。項目が足りなければ None"""
+        parts = line.rstrip("\r\n").split("|")
+        if len(parts) < 5:
+            return None
+        return cls(parts[0], parts[1], int(parts[2]), parts[3], parts[4])
+
+    def to_line(self):
+        return "|".join([self.title, self.cat, str(self.prio), str(self.dl_str), self.status])
+
+
+class TaskTable:
+    """タスクを列ごとの配列で持つ（件数が多いときの一括処理用）
+
+    期限は date.toordinal() の整数（期限なしは 0）、優先度は1バイト整数で持つので、
+    1件あたり数バイト＋タイトル文字列で済みます。
+    """
+
+    def __init__(self):
+        self.titles = []
+        self.cats = []
+        self.prios = array("b")
+        self.dls = array("l")
+        self.statuses = []
+        self.created_ats = []
+
+    def __len__(self):
+        return len(self.titles)
+
+    def append(self, task):
+        self.titles.append(task.title)
+        self.cats.append(task.cat)
+        self.prios.append(task.prio)
+        self.dls.append(task.dl.toordinal() if task.dl else 0)
+        self.statuses.append(task.status)
+        self.created_ats.append(task.created_at)
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        table = cls()
+        for task in tasks:
+            table.append(task)
+        return table
+
+    def task(self, i):
+        dl = self.dls[i]
+        return Task(self.titles[i], self.cats[i], self.prios[i],
+                    datetime.date.fromordinal(dl) if dl else None,
+                    self.statuses[i], self.created_ats[i])
+
+    def tasks(self):
+        return [self.task(i) for i in range(len(self))]
+
+    def overdue(self, today=None):
+        """期限切れ（未完了）の行番号"""
+        today = (today or datetime.date.today()).toordinal()
+        return [i for i, (dl, status) in enumerate(zip(self.dls, self.statuses))
+                if dl and dl < today and status != STATUS_DONE]
@@ -0,0 +1,175 @@
+"""
+タスクの絞り込み用の簡単な検索式
+
+例:
+    cat:仕事 prio<=2 overdue status:未 "会議"
+    cat:仕事,勉強 -status:完 dl<=2025-12-31
+    買い物
+
+書ける条件（スペース区切りですべて AND、先頭に - を付けると否定）:
+    cat:カテゴリ        カテゴリが一致（, 区切りでいずれか）
+    status:未 / status:完
+    prio:2  prio<=2  prio>3 など（= < <= > >=）
+    dl<2025-12-31 など  期限の比較（today も使える。期限なしのタスクは一致しない）
+    overdue             期限切れ（未完了で期限が今日より前）
+    nodl                期限なし
+    キーワード / "空白を含む語"  タイトルかカテゴリに含む
+
+compile_query で一度だけ解析して Query にし、TaskIndex（カテゴリ・状態・優先度ごとの行番号の集合）
+で候補を絞ってから残りの条件を調べます。
+TaskIndex を作るのは全件を1回なめるのと同じくらいかかるので、検索のたびに作らないこと。
+タスクを変更していない間は同じ TaskIndex を使い回し、変更（保存）したら作り直します。
+"""
+import datetime
+import re
+import shlex
+
+from todo_model import PRIORITY_LABELS, parse_date
+
+COMPARE_RE = re.compile(r"^(prio|dl)(<=|>=|=|<|>|:)(.+)$")
+OPS = {
+    "=": lambda a, b: a == b,
+    ":": lambda a, b: a == b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+INDEX_LIST_RE = re.compile(r"^[\d\s,\-]+$")
+
+
+class QueryError(ValueError):
+    pass
+
+
+class Query:
+    """解析済みの検索式。indexed に索引で絞れる条件、checks に1件ずつ調べる条件を持つ"""
+
+    def __init__(self, text):
+        self.text = text
+        self.indexed = []   # (列名, 値の集合, 否定か)
+        self.checks = []    # task -> bool
+
+    def __call__(self, task):
+        """1件のタスクが条件に合うか（索引を使わない場合）"""
+        for column, values, negate in self.indexed:
+            if (getattr(task, column) in values) == negate:
+                return False
+        return all(check(task) for check in self.checks)
+
+
+def _date_value(value):
+    if value == "today":
+        return datetime.date.today()
+    parsed = parse_date(value)
+    if parsed is None:
+        raise QueryError(f"日付の形式が不正です: {value}（YYYY-MM-DD または today）")
+    return parsed
+
+
+def _compile_term(query, term):
+    negate = term.startswith("-") and len(term) > 1
+    if negate:
+        term = term[1:]
+
+    def add_check(check):
+        query.checks.append((lambda t: not check(t)) if negate else check)
+
+    if term.startswith("cat:"):
+        values = {v for v in term[4:].split(",") if v}
+        if not values:
+            raise QueryError("cat: の後にカテゴリを書いてください")
+        query.indexed.append(("cat", values, negate))
+    elif term.startswith("status:"):
+        query.indexed.append(("status", {term[7:]}, negate))
+    elif term == "overdue":
+        add_check(lambda t: t.is_overdue())
+    elif term == "nodl":
+        add_check(lambda t: t.dl is None)
+    elif COMPARE_RE.match(term):
+        field, op, value = COMPARE_RE.match(term).groups()
+        compare = OPS[op]
+        if field == "prio":
+            if not value.isdigit():
+                raise QueryError(f"優先度は数字で書いてください: {term}")
+            target = int(value)
+            # 優先度は 1〜4 しかないので、該当する値の集合にして索引で引く
+            query.indexed.append(("prio", {p for p in PRIORITY_LABELS if compare(p, target)}, negate))
+        else:
+            target = _date_value(value)
+            add_check(lambda t: t.dl is not None and compare(t.dl, target))
+    else:
+        keyword = term.lower()
+        add_check(lambda t: keyword in t.title.lower() or keyword in t.cat.lower())
+
+
+def compile_query(text):
+    """検索式を Query にする。書き方が不正なら QueryError"""
+    try:
+        terms = shlex.split(text)
+    except ValueError as e:
+        raise QueryError(f"検索式を解析できません: {e}")
+    if not terms:
+        raise QueryError("検索式が空です")
+    query = Query(text)
+    for term in terms:
+        _compile_term(query, term)
+    return query
+
+
+class TaskIndex:
+    """カテゴリ・状態・優先度ごとの行番号の集合（作った時点の todos に対して有効）"""
+
+    COLUMNS = ("cat", "status", "prio")
+
+    def __init__(self, todos):
+        self.todos = todos
+        self.columns = {column: {} for column in self.COLUMNS}
+        for i, t in enumerate(todos):
+            for column in self.COLUMNS:
+                self.columns[column].setdefault(getattr(t, column), set()).add(i)
+
+    def _rows(self, column, values):
+        rows = set()
+        for value in values:
+            rows |= self.columns[column].get(value, set())
+        return rows
+
+    def select(self, query):
+        """条件に合うタスクの行番号（0 始まり、昇順）"""
+        candidates = None
+        for column, values, negate in query.indexed:
+            rows = self._rows(column, values)
+            if negate:
+                base = candidates if candidates is not None else set(range(len(self.todos)))
+                candidates = base - rows
+            else:
+                candidates = rows if candidates is None else candidates & rows
+            if not candidates:
+                return []
+        rows = sorted(candidates) if candidates is not None else range(len(self.todos))
+        checks = query.checks
+        return [i for i in rows if all(check(self.todos[i]) for check in checks)]
+
+
+def parse_index_list(raw, count):
+    """'1,3-5,8' 形式の番号（1 始まり）を有効な範囲に絞って昇順で返す"""
+    numbers = set()
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            bounds = part.split("-")
+            if len(bounds) == 2 and bounds[0].strip().isdigit() and bounds[1].strip().isdigit():
+                start = int(bounds[0].strip())
+                end = int(bounds[1].strip())
+                if start <= end:
+                    numbers.update(range(start, end + 1))
+        elif part.isdigit():
+            numbers.add(int(part))
+    return sorted(i for i in numbers if 1 <= i <= count)
+
+
+def is_index_list(raw):
+    return bool(INDEX_LIST_RE.match(raw))
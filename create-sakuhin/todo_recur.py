@@ -0,0 +1,249 @@
+"""
+繰り返しタスク（毎日・毎週○曜日・毎月○日・平日）
+
+ルールだけを todo_rules.txt に保存し、先の予定は保存しません（件数はルールの数だけ）。
+表示するときに、見ている期間の分だけジェネレータで日付を作ります。
+予定を完了にしたときだけ、その日の分を普通のタスク（完了）として todo_list.txt に書き出し、
+それより前のまだ書き出していない予定は未完了のタスクとして書き出します（materialize）。
+長く放っておいたルールで大量のタスクができないよう、未完了にする分は新しい MAX_MISSED 件までです。
+ルールには「どの日まで書き出したか」だけを持つので、それ以前の予定は二度と出てきません。
+書き出し済みの日はタスクを保存できてから進めます（呼び出し側で rule.until を書き換えて保存）。
+取り消し・やり直しのときは UntilOp に記録した前後の値に戻します。
+
+todo_rules.txt は RuleStore で読み書きし、todo_list.txt（TodoStore）と同じく、読み込んだ後に
+他のプロセスが書き換えていたら ConflictError にして上書きしません。
+
+ルールの書き方:
+    毎日
+    毎週:月,水,金   （毎週月水金 でも可）
+    毎月:15         （毎月15日 でも可。月末を超える日はその月の末日）
+    平日            （土日・祝日を除く。祝日は todo_calendar の祝日表）
+
+todo_rules.txt の1行: タイトル|カテゴリ|優先度|ルール|開始日|書き出し済みの日
+    週報|仕事|2|weekly:4|2025-10-01|2025-10-24
+"""
+import calendar
+import datetime
+import heapq
+import re
+
+from todo_calendar import is_business_day
+from todo_model import Task, DEFAULT_CAT, STATUS_DONE, STATUS_TODO, parse_date, parse_prio
+from todo_store import ConflictError, atomic_write, file_lock, file_signature
+
+RULES_FILE = "todo_rules.txt"
+MAX_MISSED = 31  # 完了にした日より前の予定を未完了のタスクにする最大件数
+WEEKDAYS = "月火水木金土日"
+MONTHLY_RE = re.compile(r"^毎月:?(\d{1,2})日?$")
+WEEKLY_RE = re.compile(r"^毎週:?([月火水木金土日,、・ ]+)$")
+
+
+class Rule:
+    __slots__ = ("title", "cat", "prio", "kind", "weekdays", "day", "start", "until")
+
+    def __init__(self, title, cat, prio, kind, weekdays=(), day=None, start=None, until=None):
+        self.title = title
+        self.cat = cat or DEFAULT_CAT
+        self.prio = parse_prio(prio)
+        self.kind = kind
+        self.weekdays = tuple(sorted(set(weekdays)))
+        self.day = day
+        self.start = parse_date(start) or datetime.date.today()
+        self.until = parse_date(until)
+
+    def __repr__(self):
+        return f"Rule({self.title!r}, {self.label})"
+
+    @property
+    def label(self):
+        if self.kind == "daily":
+            return "毎日"
+        if self.kind == "weekly":
+            return "毎週" + "・".join(WEEKDAYS[w] for w in self.weekdays)
+        if self.kind == "monthly":
+            return f"毎月{self.day}日"
+        return "平日"
+
+    # ---------------------------
+    # 予定の日付（必要な分だけ作る）
+    # ---------------------------
+    def first_pending(self):
+        """まだ書き出していない最初の日"""
+        if self.until is None:
+            return self.start
+        return max(self.start, self.until + datetime.timedelta(days=1))
+
+    def dates(self, start, end):
+        """start〜end（両端含む）の予定日を順に返すジェネレータ（書き出し済みの日は除く）"""
+        day = max(start, self.first_pending())
+        if self.kind == "monthly":
+            yield from self._monthly(day, end)
+            return
+        one = datetime.timedelta(days=1)
+        while day <= end:
+            if self.kind == "daily" or \
+                    (self.kind == "weekly" and day.weekday() in self.weekdays) or \
+                    (self.kind == "business" and is_business_day(day)):
+                yield day
+            day += one
+
+    def _monthly(self, start, end):
+        year, month = start.year, start.month
+        while True:
+            last = calendar.monthrange(year, month)[1]
+            day = datetime.date(year, month, min(self.day, last))
+            if day > end:
+                return
+            if day >= start:
+                yield day
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    def missed(self, day):
+        """day より前のまだ書き出していない予定日のリスト"""
+        return list(self.dates(self.first_pending(), day - datetime.timedelta(days=1)))
+
+    def occurrence(self, day, status=STATUS_TODO):
+        return Task(self.title, self.cat, self.prio, day, status)
+
+    # ---------------------------
+    # 保存形式との変換
+    # ---------------------------
+    @property
+    def key(self):
+        """読み直した後でも同じルールを探せるよう、書き出し済みの日以外の項目"""
+        return (self.title, self.cat, self.prio, self.rule_text, self.start)
+
+    @property
+    def rule_text(self):
+        if self.kind == "weekly":
+            return "weekly:" + ",".join(str(w) for w in self.weekdays)
+        if self.kind == "monthly":
+            return f"monthly:{self.day}"
+        return self.kind
+
+    def to_line(self):
+        until = self.until.strftime("%Y-%m-%d") if self.until else "None"
+        return "|".join([self.title, self.cat, str(self.prio), self.rule_text,
+                         self.start.strftime("%Y-%m-%d"), until])
+
+    @classmethod
+    def from_line(cls, line):
+        parts = line.rstrip("\r\n").split("|")
+        if len(parts) < 6:
+            return None
+        kind, weekdays, day = parse_rule(parts[3])
+        return cls(parts[0], parts[1], parts[2], kind, weekdays, day, parts[4], parts[5])
+
+
+def parse_rule(text):
+    """ルールの文字列を (種類, 曜日のタプル, 日) にする。書き方が不正なら ValueError"""
+    text = text.strip()
+    if text in ("daily", "毎日"):
+        return "daily", (), None
+    if text in ("business", "平日"):
+        return "business", (), None
+    if text.startswith("weekly:"):
+        weekdays = tuple(int(w) for w in text[7:].split(",") if w)
+        if weekdays and all(0 <= w <= 6 for w in weekdays):
+            return "weekly", weekdays, None
+    elif text.startswith("monthly:") and text[8:].isdigit():
+        day = int(text[8:])
+        if 1 <= day <= 31:
+            return "monthly", (), day
+    elif WEEKLY_RE.match(text):
+        weekdays = tuple(WEEKDAYS.index(ch) for ch in WEEKLY_RE.match(text).group(1) if ch in WEEKDAYS)
+        if weekdays:
+            return "weekly", weekdays, None
+    elif MONTHLY_RE.match(text):
+        day = int(MONTHLY_RE.match(text).group(1))
+        if 1 <= day <= 31:
+            return "monthly", (), day
+    raise ValueError(f"繰り返しの書き方が不正です: {text}（毎日 / 毎週:月,水 / 毎月:15 / 平日）")
+
+
+# ---------------------------
+# 複数のルールの予定
+# ---------------------------
+def _tagged(i, rule, start, end):
+    for day in rule.dates(start, end):
+        yield day, i, rule
+
+
+def occurrences(rules, start, end):
+    """start〜end の全ルールの予定を日付順に (日付, ルール) で返すジェネレータ"""
+    streams = [_tagged(i, rule, start, end) for i, rule in enumerate(rules)]
+    for day, _, rule in heapq.merge(*streams):
+        yield day, rule
+
+
+def materialize(rule, day, missed_limit=MAX_MISSED):
+    """day の予定を完了にするためのタスクを作る。
+    day より前のまだ書き出していない予定は、新しいものから missed_limit 件までを未完了のタスクにする。
+    rule は変えない（タスクを保存できたら rule.until = day にして保存すること）"""
+    if day < rule.first_pending():
+        raise ValueError(f"{day} の予定は書き出し済みです")
+    missed = rule.missed(day)[-missed_limit:] if missed_limit > 0 else []
+    tasks = [rule.occurrence(d) for d in missed]
+    tasks.append(rule.occurrence(day, STATUS_DONE))
+    return tasks
+
+
+class UntilOp:
+    """ルールの書き出し済みの日の変更（todo_history の操作と同じく apply / revert できる）。
+    ルールは読み直されることがあるので、rules（読み直しても同じリスト）から key で探して書き換える"""
+
+    def __init__(self, label, rules, key, before, after):
+        self.label = label
+        self.rules = rules
+        self.key = key
+        self.before = before
+        self.after = after
+
+    def _set(self, until):
+        for r in self.rules:
+            if r.key == self.key:
+                r.until = until
+
+    def apply(self, todos=None, agenda=None):
+        self._set(self.after)
+
+    def revert(self, todos=None, agenda=None):
+        self._set(self.before)
+
+
+# ---------------------------
+# 読み書き
+# ---------------------------
+class RuleStore:
+    def __init__(self, path=RULES_FILE):
+        self.path = path
+        self.signature = None
+
+    def changed(self):
+        """前回の読み込み・保存の後にファイルが変わったか（stat だけで判定）"""
+        return file_signature(self.path) != self.signature
+
+    def load(self):
+        rules = []
+        with file_lock(self.path, shared=True):
+            self.signature = file_signature(self.path)
+            if self.signature is None:
+                return rules
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rule = Rule.from_line(line.strip())
+                        if rule is not None:
+                            rules.append(rule)
+                    except ValueError as e:
+                        print(f"繰り返しの読み込み中にエラー: {line.strip()} ({e})")
+        return rules
+
+    def save(self, rules):
+        """保存する。読み込んだ後に他から書き換えられていたら ConflictError"""
+        text = "".join(r.to_line() + "\n" for r in rules)
+        with file_lock(self.path):
+            if self.changed():
+                raise ConflictError(f"{self.path} は他のプロセスによって更新されています")
+            atomic_write(self.path, text)
+            self.signature = file_signature(self.path)
@@ -0,0 +1,129 @@
+"""
+todo_list.txt の読み書き（CLI と Streamlit アプリで同じファイルを安全に共有する）
+
+- 書き込みは同じフォルダの一時ファイルに書いて fsync してから os.replace で置き換えるので、
+  途中で落ちてもファイルが途中までしか書かれていない状態にはなりません。
+- 書き込み中は <ファイル名>.lock を排他ロック（Linux/macOS は fcntl、Windows は msvcrt）します。
+- 読み込んだときの (inode, 更新時刻, サイズ) を覚えておき、変わったときだけ読み直します。
+- 保存時に他のプロセスが先に書き換えていたら ConflictError にして、上書きしません。
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+from todo_model import Task
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class ConflictError(RuntimeError):
+    """読み込んだ後に他のプロセスがファイルを書き換えていた"""
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """path + '.lock' に対するアドバイザリロック"""
+    with open(path + ".lock", "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            # msvcrt には共有ロックが無いので常に排他
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def file_signature(path):
+    """ファイルの (inode, 更新時刻, サイズ)。無ければ None"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def atomic_write(path, text):
+    """一時ファイルに書いて fsync し、os.replace で置き換える"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # 置き換え（ディレクトリの更新）もディスクに書き出す
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def parse_lines(lines):
+    """(タスクのリスト, 読めなかった行と理由のリスト)"""
+    todos = []
+    skipped = []
+    for line in lines:
+        try:
+            t = Task.from_line(line.strip())
+            if t is not None:
+                todos.append(t)
+        except Exception as e:
+            skipped.append((line.strip(), e))
+    return todos, skipped
+
+
+class TodoStore:
+    def __init__(self, path):
+        self.path = path
+        self.signature = None
+        self.skipped = []
+
+    def changed(self):
+        """前回の読み込み・保存の後にファイルが変わったか（stat だけで判定）"""
+        return file_signature(self.path) != self.signature
+
+    def load(self):
+        """ファイル全体を読み込む"""
+        with file_lock(self.path, shared=True):
+            self.signature = file_signature(self.path)
+            if self.signature is None:
+                todos, self.skipped = [], []
+            else:
+                with open(self.path, encoding="utf-8") as f:
+                    todos, self.skipped = parse_lines(f)
+        return todos
+
+    def refresh(self):
+        """変わっていれば読み直したリストを、変わっていなければ None を返す"""
+        return self.load() if self.changed() else None
+
+    def save(self, todos):
+        """保存する。読み込んだ後に他から書き換えられていたら ConflictError"""
+        text = "".join(t.to_line() + "\n" for t in todos)
+        with file_lock(self.path):
+            if self.changed():
+                raise ConflictError(f"{self.path} は他のプロセスによって更新されています")
+            atomic_write(self.path, text)
+            self.signature = file_signature(self.path)
+
+    def save_rows(self, todos, rows):
+        """変更した行だけを保存（テキスト形式は行単位で書き換えられないので全体を保存する）"""
+        self.save(todos)
@@ -0,0 +1,307 @@
+"""
+TODO ファイルの変更を見張って、変わった行だけを開いている画面に届ける
+
+- FileWatcher: Linux では inotify（ctypes で libc を直接呼ぶ）、使えなければ一定間隔で stat して
+  ファイルの変更を検出し、コールバックを呼びます。
+- ChangeFeed: 最新の行（文字列）とバージョン番号、直近の差分を持ちます。
+  各セッションは自分のバージョン以降の差分だけを受け取り、手元のタスクの該当行だけを置き換えます。
+  差分が古すぎて残っていなければ全体を読み直します。
+- LocalTodoFeed: todo_list.txt 用（TodoStore で読み書きし、FileWatcher で変更を検出）
+- GitHubPoller: GitHub の contents API を ETag 付きで定期的に問い合わせる（変わっていなければ 304）
+"""
+import base64
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import threading
+from collections import deque
+from difflib import SequenceMatcher
+
+from todo_model import Task
+from todo_store import ConflictError, TodoStore, file_signature
+
+POLL_INTERVAL = 1.0
+GITHUB_POLL_INTERVAL = 15.0
+HISTORY = 100
+
+# inotify のイベント（<sys/inotify.h>）
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+
+# ---------------------------
+# 差分
+# ---------------------------
+def diff_rows(old, new):
+    """old を new にするための置き換え [(開始, 終了, 新しい行のリスト)]（後ろから順に適用する）"""
+    # 前後の一致部分を先に除くと、1行だけの変更は SequenceMatcher を使わずに済む
+    start = 0
+    while start < len(old) and start < len(new) and old[start] == new[start]:
+        start += 1
+    end_old, end_new = len(old), len(new)
+    while end_old > start and end_new > start and old[end_old - 1] == new[end_new - 1]:
+        end_old -= 1
+        end_new -= 1
+    if start == end_old and start == end_new:
+        return []
+    if start == end_old or start == end_new:
+        return [(start, end_old, new[start:end_new])]
+
+    matcher = SequenceMatcher(None, old[start:end_old], new[start:end_new], autojunk=False)
+    changes = [
+        (start + i1, start + i2, new[start + j1:start + j2])
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"
+    ]
+    return changes[::-1]
+
+
+def apply_diff(todos, changes, decode, agenda=None):
+    """todos の該当行だけを置き換える（agenda を渡すと索引も更新）"""
+    for i1, i2, rows in changes:
+        new_tasks = [decode(row) for row in rows]
+        if agenda is not None:
+            for t in todos[i1:i2]:
+                agenda.remove(t)
+            for t in new_tasks:
+                agenda.add(t)
+        todos[i1:i2] = new_tasks
+
+
+class ChangeFeed:
+    """最新の行とバージョンごとの差分（st.cache_resource で全セッションが共有する想定）"""
+
+    def __init__(self, rows=(), history=HISTORY):
+        self.lock = threading.Lock()
+        self.rows = list(rows)
+        self.version = 0
+        self.history = deque(maxlen=history)  # (version, changes)
+
+    def publish(self, rows):
+        """新しい行を反映する。変わっていれば差分を記録してバージョンを上げる"""
+        with self.lock:
+            self._publish(list(rows))
+
+    def _publish(self, rows):
+        changes = diff_rows(self.rows, rows)
+        if not changes:
+            return
+        self.rows = rows
+        self.version += 1
+        self.history.append((self.version, changes))
+
+    def snapshot(self):
+        with self.lock:
+            return self.version, list(self.rows)
+
+    def changes_since(self, version):
+        """(最新バージョン, 差分のリスト)。差分が残っていなければ (最新バージョン, None)"""
+        with self.lock:
+            if version == self.version:
+                return version, []
+            if not self.history or self.history[0][0] > version + 1 or version > self.version:
+                return self.version, None
+            return self.version, [c for v, c in self.history if v > version]
+
+    def sync(self, todos, version, decode, agenda=None):
+        """version 時点の todos を最新にして (新しいバージョン, 全体を読み直したか) を返す
+        （全体を読み直したときは agenda を作り直すこと）"""
+        latest, changes = self.changes_since(version)
+        if changes is None:
+            _, rows = self.snapshot()
+            todos[:] = [decode(row) for row in rows]
+            return latest, True
+        for change in changes:
+            apply_diff(todos, change, decode, agenda)
+        return latest, False
+
+
+# ---------------------------
+# ファイルの監視
+# ---------------------------
+class FileWatcher:
+    """path の変更で on_change() を呼ぶ。inotify が使えなければ stat のポーリング"""
+
+    def __init__(self, path, on_change, interval=POLL_INTERVAL):
+        self.path = os.path.abspath(path)
+        self.on_change = on_change
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.fd = self._init_inotify()
+        self.mode = "inotify" if self.fd is not None else "polling"
+        target = self._run_inotify if self.fd is not None else self._run_polling
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+
+    def _init_inotify(self):
+        if not hasattr(os, "O_NONBLOCK"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            return None
+        if fd < 0:
+            return None
+        # 保存は一時ファイルからの rename なので、ファイルではなくフォルダを見張る
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+
+    def _run_inotify(self):
+        name = os.path.basename(self.path).encode()
+        try:
+            while not self.stopped.is_set():
+                ready, _, _ = select.select([self.fd], [], [], self.interval)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                if name in self._event_names(data):
+                    self._notify()
+        finally:
+            os.close(self.fd)
+
+    @staticmethod
+    def _event_names(data):
+        names = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            names.add(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+        return names
+
+    def _run_polling(self):
+        signature = file_signature(self.path)
+        while not self.stopped.wait(self.interval):
+            current = file_signature(self.path)
+            if current != signature:
+                signature = current
+                self._notify()
+
+    def _notify(self):
+        try:
+            self.on_change()
+        except Exception as e:
+            print(f"TODO ファイルの読み込みエラー: {e}")
+
+    def stop(self):
+        self.stopped.set()
+
+
+class LocalTodoFeed(ChangeFeed):
+    """todo_list.txt を見張り、変わった行を各セッションに届ける"""
+
+    def __init__(self, path, history=HISTORY):
+        self.store = TodoStore(path)
+        super().__init__([t.to_line() for t in self.store.load()], history)
+        self.watcher = FileWatcher(path, self.reload)
+
+    @staticmethod
+    def decode(row):
+        return Task.from_line(row)
+
+    def reload(self):
+        """ファイルが変わっていれば読み直して差分を記録"""
+        with self.lock:
+            fresh = self.store.refresh()
+            if fresh is not None:
+                self._publish([t.to_line() for t in fresh])
+
+    def save(self, todos, version):
+        """version の内容をもとに変更した todos を保存して新しいバージョンを返す。
+        その後に他で更新されていたら ConflictError"""
+        with self.lock:
+            fresh = self.store.refresh()
+            if fresh is not None:
+                self._publish([t.to_line() for t in fresh])
+            if version != self.version:
+                raise ConflictError(f"{self.store.path} は他の画面で更新されています")
+            self.store.save(todos)
+            self._publish([t.to_line() for t in todos])
+            return self.version
+
+
+# ---------------------------
+# GitHub の監視
+# ---------------------------
+class GitHubPoller(ChangeFeed):
+    """GitHub の contents API を ETag 付きで定期的に確認する（変更が無ければ 304 で本文なし）"""
+
+    def __init__(self, url, headers, interval=GITHUB_POLL_INTERVAL, history=HISTORY):
+        super().__init__((), history)
+        self.url = url
+        self.headers = dict(headers)
+        self.interval = interval
+        self.etag = None
+        self.sha = None
+        self.error = None
+        self.stopped = threading.Event()
+        self.poll()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def encode(task):
+        return json.dumps(task.to_dict(), ensure_ascii=False, sort_keys=True)
+
+    @staticmethod
+    def decode(row):
+        return Task.from_dict(json.loads(row))
+
+    def poll(self):
+        """1回問い合わせる。変わっていれば差分を記録して True"""
+        import requests  # Streamlit 版でしか使わないので、ここで読み込む
+
+        headers = dict(self.headers)
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        try:
+            r = requests.get(self.url, headers=headers, timeout=20)
+        except Exception as e:
+            self.error = str(e)
+            return False
+        if r.status_code == 304:
+            self.error = None
+            return False
+        if r.status_code == 404:
+            items, sha = [], None
+        elif r.status_code == 200:
+            j = r.json()
+            sha = j.get("sha")
+            try:
+                items = json.loads(base64.b64decode(j.get("content", "")).decode("utf-8"))
+            except ValueError:
+                items = []
+        else:
+            self.error = f"status={r.status_code}"
+            return False
+        self.error = None
+        self.etag = r.headers.get("ETag")
+        rows = [self.encode(Task.from_dict(d)) for d in items if isinstance(d, dict)] if isinstance(items, list) else []
+        with self.lock:
+            self.sha = sha
+            before = self.version
+            self._publish(rows)
+            return self.version != before
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        self.stopped.set()
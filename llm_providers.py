@@ -0,0 +1,147 @@
+"""
+LLMプロバイダの登録と呼び出し
+
+ai_chat_app.py の get_llm_response から利用します。
+モデル名の先頭（gpt / claude / gemini / mock）でプロバイダを選び、
+トークンを1つずつ返すジェネレータを返します。
+Streamlit に依存しないので、負荷試験スクリプト（chat_load_test.py）からも使えます。
+"""
+import os
+import random
+import time
+
+GEMINI_MODEL = "models/gemini-2.5-flash"
+
+# ローカルモックの既定値（トークン/秒・最初のトークンまでの遅延・エラー率・最大トークン数）
+MOCK_DEFAULTS = {
+    "tokens_per_sec": 50.0,
+    "latency": 0.3,
+    "error_rate": 0.0,
+    "max_tokens": 200,
+}
+
+MOCK_WORDS = [
+    "こんにちは", "。", "これは", "ローカル", "の", "テスト", "応答", "です", "、",
+    "Streamlit", " ", "の", "描画", "を", "計測", "して", "います", "。\n\n",
+    "- ", "項目", "**", "強調", "**", " `code` ", "Hello", " world", ".", "\n",
+]
+
+
+class ProviderError(RuntimeError):
+    """プロバイダ呼び出しの失敗（HTTPステータス相当の status_code 付き）"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _trace(trace, name):
+    """計測用フック（chat_metrics.TurnMetrics.mark）があれば呼ぶ"""
+    if trace is not None:
+        trace(name)
+
+
+# ===== 各プロバイダ =====
+# trace: "client_created"（クライアント生成後）と "request_sent"（リクエスト送信後）で呼ばれる
+def stream_openai(model, user_input, trace=None, **options):
+    from openai import OpenAI
+
+    client = OpenAI()
+    _trace(trace, "client_created")
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": user_input}],
+        stream=True,
+    )
+    _trace(trace, "request_sent")
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def stream_anthropic(model, user_input, trace=None, **options):
+    import anthropic
+
+    client = anthropic.Anthropic()
+    _trace(trace, "client_created")
+    with client.messages.stream(
+        model=model,
+        max_tokens=1024,
+        messages=[{"role": "user", "content": user_input}],
+    ) as stream:
+        _trace(trace, "request_sent")
+        for text in stream.text_stream:
+            yield text
+
+
+def stream_gemini(model, user_input, api_key=None, trace=None, **options):
+    from google.genai import Client
+
+    client = Client(api_key=api_key or os.environ.get("GOOGLE_API_KEY"))
+    _trace(trace, "client_created")
+    response = client.models.generate_content_stream(
+        model=GEMINI_MODEL,
+        contents=user_input
+    )
+    _trace(trace, "request_sent")
+    for chunk in response:
+        if chunk.text:
+            yield chunk.text
+
+
+def stream_mock(model, user_input, tokens_per_sec=None, latency=None,
+                error_rate=None, max_tokens=None, seed=None, trace=None, **options):
+    """ネットワークを使わずに合成トークンを返すモック
+
+    tokens_per_sec: 1秒あたりのトークン数（0以下なら待ち時間なし）
+    latency: 最初のトークンまでの遅延（秒）
+    error_rate: 0〜1。この確率で途中（または開始前）にエラーを発生させる
+    """
+    tokens_per_sec = MOCK_DEFAULTS["tokens_per_sec"] if tokens_per_sec is None else tokens_per_sec
+    latency = MOCK_DEFAULTS["latency"] if latency is None else latency
+    error_rate = MOCK_DEFAULTS["error_rate"] if error_rate is None else error_rate
+    max_tokens = MOCK_DEFAULTS["max_tokens"] if max_tokens is None else max_tokens
+
+    rng = random.Random(seed)
+    n_tokens = rng.randint(max(1, max_tokens // 2), max(1, max_tokens))
+    fail_at = rng.randint(0, n_tokens - 1) if rng.random() < error_rate else None
+    interval = 1.0 / tokens_per_sec if tokens_per_sec > 0 else 0.0
+
+    _trace(trace, "client_created")
+    _trace(trace, "request_sent")
+    if latency > 0:
+        time.sleep(latency)
+    for i in range(n_tokens):
+        if i == fail_at:
+            status = 429 if rng.random() < 0.5 else 500
+            raise ProviderError(f"mock: 擬似エラー (status={status})", status_code=status)
+        if i and interval:
+            time.sleep(interval)
+        yield rng.choice(MOCK_WORDS)
+
+
+# ===== 登録 =====
+PROVIDERS = {
+    "gpt": stream_openai,
+    "claude": stream_anthropic,
+    "gemini": stream_gemini,
+    "mock": stream_mock,
+}
+
+
+def register_provider(prefix, stream_fn):
+    """モデル名の接頭辞に対応するストリーム関数を登録"""
+    PROVIDERS[prefix] = stream_fn
+
+
+def get_provider(model):
+    """モデル名に対応するストリーム関数を返す"""
+    for prefix, stream_fn in PROVIDERS.items():
+        if model.startswith(prefix):
+            return stream_fn
+    raise ValueError(f"未対応のモデルです: {model}")
+
+
+def stream_response(model, user_input, **options):
+    """モデルに応じたプロバイダでトークンをストリーミング"""
+    return get_provider(model)(model, user_input, **options)
@@ -0,0 +1,219 @@
+"""
+プロバイダの障害・遅延への対策（ヘッジ送信とサーキットブレーカー）
+
+- ヘッジ送信: 主モデルの最初のトークンが hedge_after 秒以内に来なければ（またはエラーなら）
+  予備モデルにも同じリクエストを送り、先に最初のトークンを返した方を採用して、もう片方は止めます。
+- サーキットブレーカー: プロバイダごとに直近のエラー率を記録し、一定以上なら
+  cooldown 秒のあいだ主モデルを使わず最初から予備モデルに送ります。
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+from llm_scheduler import provider_of
+
+HEDGE_AFTER = 3.0
+
+
+class CircuitBreaker:
+    """直近 window 秒のエラー率が error_threshold 以上（min_calls 回以上の呼び出し）で開く"""
+
+    def __init__(self, window=60.0, min_calls=5, error_threshold=0.5, cooldown=30.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.outcomes = deque()
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def _trim(self, now):
+        while self.outcomes and now - self.outcomes[0][0] > self.window:
+            self.outcomes.popleft()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """送ってよいか。half_open のときは試しの1回だけ通す"""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def release(self):
+        """allow() で通したが結果が出なかった（負けて止めた・途中で閉じられた）呼び出しの後始末。
+        試しの1回の枠だけを戻し、成功にも失敗にも数えない"""
+        with self.lock:
+            self.probing = False
+
+    def record(self, ok):
+        with self.lock:
+            now = time.monotonic()
+            if self.opened_at is not None:
+                # 試しの1回の結果で閉じるか開き直すかを決める
+                self.probing = False
+                if ok:
+                    self.opened_at = None
+                    self.outcomes.clear()
+                else:
+                    self.opened_at = now
+                return
+            self.outcomes.append((now, ok))
+            self._trim(now)
+            errors = sum(1 for _, success in self.outcomes if not success)
+            if len(self.outcomes) >= self.min_calls and errors / len(self.outcomes) >= self.error_threshold:
+                self.opened_at = now
+
+
+class _Attempt:
+    """1モデル分のストリームを別スレッドで読み、イベントをキューに積む"""
+
+    def __init__(self, model, open_stream, events):
+        self.model = model
+        self.cancel = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(open_stream, events), daemon=True)
+        self.thread.start()
+
+    def _run(self, open_stream, events):
+        stream = None
+        try:
+            stream = open_stream(self.model)
+            for token in stream:
+                if self.cancel.is_set():
+                    break
+                events.put((self, "token", token))
+            events.put((self, "end", None))
+        except Exception as e:
+            events.put((self, "error", e))
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+
+
+class Router:
+    """プロセス全体で共有（st.cache_resource）。プロバイダごとのブレーカーを持つ"""
+
+    def __init__(self, breaker_options=None):
+        self.breaker_options = breaker_options or {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def breaker(self, model):
+        provider = provider_of(model)
+        with self.lock:
+            if provider not in self.breakers:
+                self.breakers[provider] = CircuitBreaker(**self.breaker_options)
+            return self.breakers[provider]
+
+    def states(self):
+        with self.lock:
+            return {provider: b.state for provider, b in self.breakers.items()}
+
+    def stream(self, primary, open_stream, fallback=None, hedge_after=HEDGE_AFTER, info=None):
+        """primary のストリームを返す。遅い・失敗・ブレーカー開の場合は fallback も使う
+
+        open_stream: model -> トークンのイテレータ
+        info: 渡した dict に採用したモデル（"model"）とヘッジしたか（"hedged"）を書き込む
+        """
+        info = info if info is not None else {}
+        info.update(model=primary, hedged=False)
+        if fallback == primary:
+            fallback = None
+
+        events = queue.Queue()
+        attempts = []
+        admitted = []   # allow() で通した attempt（結果を記録するか release() で枠を戻す）
+        settled = set()
+
+        def start(model, allowed=True):
+            attempt = _Attempt(model, open_stream, events)
+            attempts.append(attempt)
+            if allowed:
+                admitted.append(attempt)
+            if model != primary:
+                info["hedged"] = True
+
+        def settle(attempt, ok):
+            settled.add(attempt)
+            self.breaker(attempt.model).record(ok)
+
+        if self.breaker(primary).allow():
+            start(primary)
+        elif fallback and self.breaker(fallback).allow():
+            start(fallback)
+        else:
+            # どちらも止まっている場合は主モデルで試す
+            start(primary, allowed=False)
+
+        winner = None
+        failed = []
+        hedge_pending = bool(fallback) and attempts[0].model == primary
+        deadline = time.monotonic() + hedge_after
+        try:
+            # 最初のトークンを待つ（ここで勝者を決める）
+            while winner is None:
+                timeout = max(0.0, deadline - time.monotonic()) if hedge_pending else None
+                try:
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    hedge_pending = False
+                    if self.breaker(fallback).allow():
+                        start(fallback)
+                    continue
+
+                if kind == "token":
+                    winner = attempt
+                    info["model"] = attempt.model
+                    yield payload
+                elif kind == "end":
+                    # トークン無しで終わった場合もそのまま採用
+                    winner = attempt
+                    info["model"] = attempt.model
+                    settle(attempt, True)
+                    return
+                else:
+                    settle(attempt, False)
+                    failed.append((attempt, payload))
+                    if hedge_pending and self.breaker(fallback).allow():
+                        hedge_pending = False
+                        start(fallback)
+                    elif len(failed) == len(attempts):
+                        raise payload
+
+            for other in attempts:
+                if other is not winner:
+                    other.cancel.set()
+
+            # 勝者のトークンを流す（負けた方のイベントは捨てる）
+            while True:
+                attempt, kind, payload = events.get()
+                if attempt is not winner:
+                    continue
+                if kind == "token":
+                    yield payload
+                elif kind == "end":
+                    settle(winner, True)
+                    return
+                else:
+                    settle(winner, False)
+                    raise payload
+        finally:
+            for attempt in attempts:
+                attempt.cancel.set()
+            # 負けて止めた・呼び出し側が途中で閉じた attempt は、成功扱いにせず試しの枠だけ戻す
+            for attempt in admitted:
+                if attempt not in settled:
+                    self.breaker(attempt.model).release()
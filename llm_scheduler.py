@@ -0,0 +1,200 @@
+"""
+複数ユーザーで共有する API キーのリクエスト制御
+
+1つのデプロイを複数人で使うと、同じ API キーに同時にリクエストが集中して 429 になります。
+RequestScheduler はプロセス全体で1つだけ作り（st.cache_resource）、
+  - プロバイダごとのトークンバケット（リクエスト/分・トークン/分）で送信ペースを抑え
+  - 待っているセッションを順番に回して（ラウンドロビン）1人が独占しないようにし
+  - 429 / 5xx は最初のトークンを受け取る前ならバックオフして再試行
+します。
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from meeting_minutes import estimate_tokens
+
+# プロバイダごとの上限（LLM_LIMITS 環境変数に同じ形の JSON を入れると上書き）
+DEFAULT_LIMITS = {
+    "gpt": {"rpm": 500, "tpm": 200_000},
+    "claude": {"rpm": 50, "tpm": 40_000},
+    "gemini": {"rpm": 60, "tpm": 1_000_000},
+    "mock": {"rpm": 6_000, "tpm": 10_000_000},
+}
+EXPECTED_OUTPUT_TOKENS = 512
+RETRY_STATUS = (429, 500, 502, 503, 504, 529)
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+
+def load_limits():
+    limits = {k: dict(v) for k, v in DEFAULT_LIMITS.items()}
+    override = os.environ.get("LLM_LIMITS")
+    if override:
+        for provider, values in json.loads(override).items():
+            limits.setdefault(provider, {}).update(values)
+    return limits
+
+
+def provider_of(model):
+    for prefix in DEFAULT_LIMITS:
+        if model.startswith(prefix):
+            return prefix
+    return model
+
+
+def status_of(error):
+    """SDK ごとに異なる例外から HTTP ステータスを取り出す"""
+    for attr in ("status_code", "code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def retry_after(error):
+    """Retry-After ヘッダがあれば秒数を返す"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """1分あたり per_minute 個まで使えるバケット（最大 per_minute 個までためられる）"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """amount 個使えるようになるまでの秒数"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """見積もりとの差を戻す（正なら返却、負なら追加で消費）"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderQueue:
+    """1プロバイダ分のバケットとセッションごとの待ち行列"""
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.rotation = deque()   # 待っているセッションの順番
+        self.waiting = {}         # session_id -> deque of tickets
+
+    def enqueue(self, session_id, ticket):
+        if session_id not in self.waiting:
+            self.waiting[session_id] = deque()
+            self.rotation.append(session_id)
+        self.waiting[session_id].append(ticket)
+
+    def head(self):
+        return self.waiting[self.rotation[0]][0] if self.rotation else None
+
+    def pop_head(self):
+        session_id = self.rotation.popleft()
+        self.waiting[session_id].popleft()
+        if self.waiting[session_id]:
+            # 同じセッションの次のリクエストは他のセッションの後ろに回す
+            self.rotation.append(session_id)
+        else:
+            del self.waiting[session_id]
+
+    def remove(self, session_id, ticket):
+        tickets = self.waiting.get(session_id)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self.waiting[session_id]
+                self.rotation.remove(session_id)
+
+
+class RequestScheduler:
+    def __init__(self, limits=None):
+        self.limits = limits or load_limits()
+        self.queues = {}
+        self.cond = threading.Condition()
+
+    def _queue(self, provider):
+        if provider not in self.queues:
+            limit = self.limits.get(provider, {})
+            self.queues[provider] = ProviderQueue(limit.get("rpm", 60), limit.get("tpm", 100_000))
+        return self.queues[provider]
+
+    def acquire(self, provider, session_id, est_tokens, timeout=None):
+        """順番が来てバケットに空きができるまで待つ。timeout を過ぎたら TimeoutError"""
+        ticket = object()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            queue = self._queue(provider)
+            queue.enqueue(session_id, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if queue.head() is ticket:
+                        wait = max(queue.requests.wait_time(1, now), queue.tokens.wait_time(est_tokens, now))
+                        if wait == 0:
+                            queue.requests.take(1)
+                            queue.tokens.take(est_tokens)
+                            queue.pop_head()
+                            self.cond.notify_all()
+                            return
+                    if deadline is not None:
+                        if now >= deadline:
+                            raise TimeoutError(f"{provider}: 送信待ちがタイムアウトしました")
+                        wait = min(wait or deadline - now, deadline - now)
+                    self.cond.wait(wait)
+            except BaseException:
+                queue.remove(session_id, ticket)
+                self.cond.notify_all()
+                raise
+
+    def settle(self, provider, est_tokens, used_tokens):
+        """実際に使ったトークン数で見積もりを補正"""
+        with self.cond:
+            self._queue(provider).tokens.adjust(est_tokens - used_tokens)
+            self.cond.notify_all()
+
+    def stream(self, model, user_input, session_id, open_stream, max_retries=MAX_RETRIES):
+        """open_stream() のストリームを、順番待ち・流量制限・再試行つきで返す"""
+        provider = provider_of(model)
+        est_tokens = estimate_tokens(user_input) + EXPECTED_OUTPUT_TOKENS
+        for attempt in range(max_retries + 1):
+            self.acquire(provider, session_id, est_tokens)
+            output = ""
+            try:
+                for token in open_stream():
+                    output += token
+                    yield token
+                return
+            except Exception as e:
+                # 途中まで表示した応答はやり直せないので、最初のトークン前だけ再試行する
+                if output or attempt == max_retries or status_of(e) not in RETRY_STATUS:
+                    raise
+                delay = retry_after(e) or min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.8, 1.2))
+            finally:
+                self.settle(provider, est_tokens, estimate_tokens(user_input) + estimate_tokens(output))
@@ -0,0 +1,171 @@
+"""
+文字起こし・議事録生成のバックグラウンド実行
+
+音声を受け取ったらジョブとして SQLite に登録し、別プロセスのワーカーで
+文字起こし → 議事録生成 を行います。結果もジョブに保存されるので、
+ブラウザを再読み込みしてもジョブIDがあれば結果を取り出せます。
+Streamlit のスクリプトはジョブの状態を読むだけなので、処理中も画面は止まりません。
+"""
+import multiprocessing
+import os
+import sqlite3
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+from meeting_minutes import MinutesCache, generate_minutes_mapreduce
+from meeting_transcribe import transcribe_with_backend
+
+JOB_DB = "meeting_jobs.db"
+JOB_DIR = os.path.join(".cache", "jobs")
+MAX_WORKERS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    audio_path TEXT NOT NULL,
+    progress TEXT,
+    transcript TEXT,
+    minutes TEXT,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+"""
+
+JOB_COLUMNS = ("id", "status", "backend", "filename", "audio_path", "progress",
+               "transcript", "minutes", "error", "created_at", "updated_at")
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+@contextmanager
+def _connect(db_path):
+    """with の終わりでコミット（例外ならロールバック）して接続を閉じる"""
+    with closing(sqlite3.connect(db_path, timeout=30)) as conn:
+        conn.execute("PRAGMA journal_mode = WAL")
+        with conn:
+            yield conn
+
+
+def _remove_audio(audio_path):
+    try:
+        os.remove(audio_path)
+    except FileNotFoundError:
+        pass
+
+
+def _update(db_path, job_id, **fields):
+    fields["updated_at"] = _now()
+    assignments = ", ".join(f"{k} = ?" for k in fields)
+    with _connect(db_path) as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+# ---------------------------
+# ワーカー（別プロセスで実行）
+# ---------------------------
+def run_job(db_path, job_id):
+    """ジョブを1件処理する。他のワーカーが先に取っていれば何もしない"""
+    with _connect(db_path) as conn:
+        claimed = conn.execute(
+            "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+            (_now(), job_id),
+        ).rowcount
+        row = conn.execute("SELECT backend, filename, audio_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if not claimed or row is None:
+        return
+    backend, filename, audio_path = row
+
+    try:
+        with open(audio_path, "rb") as f:
+            audio_bytes = f.read()
+        transcript = transcribe_with_backend(
+            audio_bytes, filename, backend,
+            on_progress=lambda done, total: _update(db_path, job_id, progress=f"文字起こし {done}/{total}"),
+        )
+        _update(db_path, job_id, transcript=transcript, progress="議事録を生成中")
+        minutes = generate_minutes_mapreduce(
+            transcript,
+            cache=MinutesCache(),
+            on_progress=lambda done, total: _update(db_path, job_id, progress=f"要約 {done}/{total}"),
+        )
+        _update(db_path, job_id, status="done", minutes=minutes, progress="完了")
+    except Exception as e:
+        _update(db_path, job_id, status="error", error=str(e), progress="エラー")
+    finally:
+        # 失敗したジョブは再実行しないので、成功・失敗どちらでも音声は消す
+        # （途中でプロセスが落ちたときは残り、次の起動時に _resume で再実行される）
+        _remove_audio(audio_path)
+
+
+# ---------------------------
+# キュー（Streamlit 側から利用）
+# ---------------------------
+class JobQueue:
+    """SQLite のジョブ表とプロセスプール（st.cache_resource で共有する想定）"""
+
+    def __init__(self, db_path=JOB_DB, audio_dir=JOB_DIR, max_workers=MAX_WORKERS):
+        self.db_path = db_path
+        self.audio_dir = audio_dir
+        os.makedirs(audio_dir, exist_ok=True)
+        with _connect(db_path) as conn:
+            conn.executescript(SCHEMA)
+        # Streamlit のスレッドを引き継がないよう spawn で起動する
+        self.pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._resume()
+
+    def _resume(self):
+        """前回のプロセス終了時に残っていたジョブを再投入"""
+        with _connect(self.db_path) as conn:
+            conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+            ids = [r[0] for r in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            )]
+        for job_id in ids:
+            self.pool.submit(run_job, self.db_path, job_id)
+
+    def submit(self, audio_bytes, filename, backend="openai"):
+        """音声を保存してジョブを登録し、ジョブIDを返す"""
+        job_id = uuid.uuid4().hex
+        audio_path = os.path.join(self.audio_dir, job_id + os.path.splitext(filename)[1])
+        with open(audio_path, "wb") as f:
+            f.write(audio_bytes)
+        now = _now()
+        with _connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, backend, filename, audio_path, progress, created_at, updated_at)"
+                " VALUES (?, 'queued', ?, ?, ?, '待機中', ?, ?)",
+                (job_id, backend, filename, audio_path, now, now),
+            )
+        self.pool.submit(run_job, self.db_path, job_id)
+        return job_id
+
+    def get(self, job_id):
+        with _connect(self.db_path) as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row else None
+
+    def list_jobs(self, job_ids):
+        """指定したジョブを新しい順に返す（本文は含めない）"""
+        if not job_ids:
+            return []
+        columns = ("id", "status", "filename", "progress", "error", "created_at")
+        placeholders = ", ".join("?" for _ in job_ids)
+        with _connect(self.db_path) as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(columns)} FROM jobs WHERE id IN ({placeholders}) ORDER BY created_at DESC",
+                list(job_ids),
+            ).fetchall()
+        return [dict(zip(columns, r)) for r in rows]
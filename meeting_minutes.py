@@ -0,0 +1,216 @@
+"""
+長い文字起こしからの議事録生成（map-reduce）
+
+文字起こし全体を1つのプロンプトに入れるとコンテキスト長を超えるため、
+  1. トークン数の目安で区間に分割し
+  2. 区間ごとに「議論ポイント・決定事項・アクションアイテム」を並列に抽出（map）
+  3. 抽出結果をまとめて議事録の形式に整える（reduce。多すぎる場合は段階的にまとめる）
+という手順で生成します。各ステップの結果は入力のハッシュでキャッシュするので、
+一部を直して再実行しても変わった区間だけが再計算されます。
+"""
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+MODEL = "gpt-4o"
+SEGMENT_TOKENS = 6000     # 1区間あたりのトークン数の目安
+REDUCE_TOKENS = 12000     # reduce に一度に渡すトークン数の上限
+MAX_WORKERS = 4
+CACHE_DIR = os.path.join(".cache", "minutes")
+
+SYSTEM_PROMPT = "あなたは優秀な議事録作成アシスタントです。"
+
+MINUTES_PROMPT = """
+以下は会議の文字起こしテキストです。これを読みやすい議事録形式にまとめてください。
+
+【要件】
+- 日時、参加者、議題を推測して記載
+- 主要な議論ポイントを箇条書き
+- 決定事項を明確に記載
+- アクションアイテム（誰が何をするか）を整理
+- 次回の予定があれば記載
+
+【文字起こしテキスト】
+{transcript}
+"""
+
+MAP_PROMPT = """
+以下は長い会議の文字起こしの一部です。この部分から次の項目を抽出し、JSONで返してください。
+推測できない項目は空のリストにしてください。
+
+{{"participants": [], "agenda": [], "points": [], "decisions": [], "action_items": [], "next_meeting": []}}
+
+【文字起こしテキスト（一部）】
+{segment}
+"""
+
+MERGE_PROMPT = """
+以下は会議の各部分から抽出したメモ（JSON）です。重複をまとめ、同じ形式のJSON1つに統合してください。
+
+{notes}
+"""
+
+REDUCE_PROMPT = """
+以下は長い会議の文字起こしを部分ごとに整理したメモ（JSON）です。これを読みやすい議事録形式にまとめてください。
+
+【要件】
+- 日時、参加者、議題を推測して記載
+- 主要な議論ポイントを箇条書き
+- 決定事項を明確に記載
+- アクションアイテム（誰が何をするか）を整理
+- 次回の予定があれば記載
+
+【メモ】
+{notes}
+"""
+
+SENTENCE_RE = re.compile(r"(?<=[。！？!?\n])")
+
+
+def estimate_tokens(text):
+    """トークン数の目安（英数字は4文字で1、日本語は1文字で1程度）"""
+    ascii_count = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_count // 4 + (len(text) - ascii_count)
+
+
+def split_segments(transcript, budget=SEGMENT_TOKENS):
+    """文の区切りで、1区間が budget トークン以内になるように分割"""
+    segments = []
+    current, current_tokens = [], 0
+    for sentence in SENTENCE_RE.split(transcript):
+        if not sentence:
+            continue
+        tokens = estimate_tokens(sentence)
+        # 1文だけで予算を超える場合は文字数で切る
+        while tokens > budget:
+            cut = max(1, len(sentence) * budget // tokens)
+            if current:
+                segments.append("".join(current))
+                current, current_tokens = [], 0
+            segments.append(sentence[:cut])
+            sentence = sentence[cut:]
+            tokens = estimate_tokens(sentence)
+        if current and current_tokens + tokens > budget:
+            segments.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+    if current:
+        segments.append("".join(current))
+    return segments
+
+
+class MinutesCache:
+    """プロンプトのハッシュをキーにした応答のキャッシュ（1件1ファイル）"""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)["result"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, result):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"result": result}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+def openai_chat(client=None, model=MODEL):
+    """(prompt, json_mode) -> 応答テキスト を返す関数を作る"""
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI()
+
+    def chat(prompt, json_mode=False):
+        kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            **kwargs
+        )
+        return response.choices[0].message.content
+
+    chat.model = model
+    return chat
+
+
+def _cached_call(chat, cache, prompt, json_mode=False):
+    key = hashlib.sha256(
+        json.dumps([getattr(chat, "model", ""), json_mode, prompt], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    if cache is not None:
+        result = cache.get(key)
+        if result is not None:
+            return result
+    result = chat(prompt, json_mode)
+    if json_mode:
+        result = json.loads(result)
+    if cache is not None:
+        cache.put(key, result)
+    return result
+
+
+def _dump_notes(notes):
+    return json.dumps(notes, ensure_ascii=False, indent=1)
+
+
+def generate_minutes_mapreduce(transcript, chat=None, cache=None, max_workers=MAX_WORKERS,
+                               segment_tokens=SEGMENT_TOKENS, reduce_tokens=REDUCE_TOKENS,
+                               on_progress=None):
+    """文字起こしから議事録を生成
+
+    chat: (prompt, json_mode) -> str。省略時は OpenAI の gpt-4o
+    cache: MinutesCache（None ならキャッシュしない）
+    on_progress: (完了した区間数, 全区間数) -> None。呼び出し元のスレッドで呼ばれる
+    """
+    chat = chat or openai_chat()
+    segments = split_segments(transcript, segment_tokens)
+
+    # 1区間で収まるなら従来どおり1回で生成
+    if len(segments) <= 1:
+        return _cached_call(chat, cache, MINUTES_PROMPT.format(transcript=transcript))
+
+    # map: 区間ごとに並列抽出（区間の位置はプロンプトに入れず、前後の区間が変わってもキャッシュを使えるようにする）
+    prompts = [MAP_PROMPT.format(segment=segment) for segment in segments]
+    notes = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for done, note in enumerate(pool.map(lambda p: _cached_call(chat, cache, p, True), prompts), start=1):
+            notes.append(note)
+            if on_progress:
+                on_progress(done, len(segments))
+
+    # reduce: 多すぎる場合は上限に収まるまで段階的に統合
+    while len(notes) > 1 and estimate_tokens(_dump_notes(notes)) > reduce_tokens:
+        groups, group = [], []
+        for note in notes:
+            if group and estimate_tokens(_dump_notes(group + [note])) > reduce_tokens:
+                groups.append(group)
+                group = []
+            group.append(note)
+        groups.append(group)
+        if len(groups) == len(notes):
+            # 1件ずつでも上限を超える場合はこれ以上まとめられない
+            break
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            notes = list(pool.map(
+                lambda g: _cached_call(chat, cache, MERGE_PROMPT.format(notes=_dump_notes(g)), True),
+                groups
+            ))
+
+    return _cached_call(chat, cache, REDUCE_PROMPT.format(notes=_dump_notes(notes)))
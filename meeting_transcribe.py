@@ -0,0 +1,258 @@
+"""
+長時間の会議音声の分割・並列文字起こし
+
+whisper-1 は1リクエスト25MBまでなので、長い録音は
+  1. 16kHz / モノラル / 16bit の PCM に変換し
+  2. 目標の長さ付近で一番静かな位置（無音）を探して分割（前のチャンクと少し重ねる）
+  3. チャンクを並列に文字起こしし
+  4. 重なり部分の重複を取り除いてつなげる
+という手順で処理します。
+
+mp3 / m4a などのデコードには pydub（と ffmpeg）が必要です。
+pydub が無い場合は WAV のみ分割でき、それ以外は小さいファイルだけ1回で送ります。
+
+文字起こしエンジンは BACKENDS から選べます。
+    "openai" : whisper-1 API
+    "local"  : faster-whisper（int8 量子化、CPU のみ・ネットワーク不要）
+"""
+import io
+import os
+import threading
+import wave
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    import audioop
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+MAX_REQUEST_BYTES = 24 * 1024 * 1024
+
+CHUNK_SEC = 600      # 1チャンクの目安の長さ
+OVERLAP_SEC = 2      # 前のチャンクと重ねる長さ
+OVERLAP_CHARS = OVERLAP_SEC * 20  # 重なり部分の文字数の上限（早口でも1秒20文字程度まで）
+SEARCH_SEC = 30      # 分割位置（無音）を探す範囲
+FRAME_MS = 50        # 音量を測る単位
+MAX_WORKERS = 4
+
+# ローカルエンジンの設定（環境変数で変更可）
+LOCAL_MODEL = os.environ.get("LOCAL_WHISPER_MODEL", "small")
+LOCAL_CHUNK_SEC = 120
+LOCAL_THREADS = int(os.environ.get("LOCAL_WHISPER_THREADS", "2"))
+LOCAL_WORKERS = int(os.environ.get("LOCAL_WHISPER_WORKERS", str(max(1, (os.cpu_count() or 1) // LOCAL_THREADS))))
+
+
+class AudioDecodeError(Exception):
+    """音声ファイルを PCM に変換できない"""
+
+
+# ---------------------------
+# デコード
+# ---------------------------
+def decode_audio(audio_bytes, filename):
+    """音声を 16kHz / モノラル / 16bit の PCM (bytes) に変換"""
+    ext = os.path.splitext(filename)[1].lower().lstrip(".")
+    try:
+        from pydub import AudioSegment
+    except ImportError:
+        AudioSegment = None
+
+    if AudioSegment is not None:
+        seg = AudioSegment.from_file(io.BytesIO(audio_bytes), format=ext or None)
+        seg = seg.set_channels(1).set_frame_rate(SAMPLE_RATE).set_sample_width(SAMPLE_WIDTH)
+        return seg.raw_data
+
+    if ext != "wav":
+        raise AudioDecodeError(f".{ext} の分割には pydub と ffmpeg が必要です")
+
+    with wave.open(io.BytesIO(audio_bytes)) as w:
+        channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+        pcm = w.readframes(w.getnframes())
+    if channels == 2:
+        pcm = audioop.tomono(pcm, width, 0.5, 0.5)
+    elif channels != 1:
+        raise AudioDecodeError(f"{channels}チャンネルの WAV には対応していません")
+    if width != SAMPLE_WIDTH:
+        pcm = audioop.lin2lin(pcm, width, SAMPLE_WIDTH)
+    if rate != SAMPLE_RATE:
+        pcm, _ = audioop.ratecv(pcm, SAMPLE_WIDTH, 1, rate, SAMPLE_RATE, None)
+    return pcm
+
+
+def audio_duration(audio_bytes, filename):
+    """音声の長さ（秒）。デコードできなければ None"""
+    try:
+        return len(decode_audio(audio_bytes, filename)) / (SAMPLE_RATE * SAMPLE_WIDTH)
+    except AudioDecodeError:
+        return None
+
+
+def pcm_to_wav(pcm):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(SAMPLE_WIDTH)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm)
+    return buf.getvalue()
+
+
+# ---------------------------
+# 分割
+# ---------------------------
+def find_quietest(pcm, start, end, frame_bytes):
+    """[start, end) の中で一番音量が小さいフレームの位置（バイト）"""
+    best_pos, best_rms = end, None
+    for pos in range(start, end - frame_bytes + 1, frame_bytes):
+        rms = audioop.rms(pcm[pos:pos + frame_bytes], SAMPLE_WIDTH)
+        if best_rms is None or rms < best_rms:
+            best_pos, best_rms = pos, rms
+    return best_pos
+
+
+def split_points(pcm, chunk_sec=CHUNK_SEC, overlap_sec=OVERLAP_SEC, search_sec=SEARCH_SEC):
+    """無音付近で分割した (開始, 終了) バイト位置のリスト。2つ目以降は overlap_sec 分前から始まる"""
+    bytes_per_sec = SAMPLE_RATE * SAMPLE_WIDTH
+    frame_bytes = bytes_per_sec * FRAME_MS // 1000
+    chunk_bytes = chunk_sec * bytes_per_sec
+    overlap = overlap_sec * bytes_per_sec
+    search = min(search_sec * bytes_per_sec, chunk_bytes // 2)
+
+    chunks = []
+    start = 0
+    while len(pcm) - start > chunk_bytes:
+        target = start + chunk_bytes
+        cut = find_quietest(pcm, target - search, target, frame_bytes)
+        chunks.append((max(0, start - overlap), cut))
+        start = cut
+    chunks.append((max(0, start - overlap), len(pcm)))
+    return chunks
+
+
+# ---------------------------
+# 重複除去しながら連結
+# ---------------------------
+def stitch(texts, max_overlap=OVERLAP_CHARS, min_overlap=4):
+    """前のチャンクの末尾と次のチャンクの先頭の重なりを1回分にしてつなげる。
+    重なりとみなすのは「前の末尾 = 次の先頭」になっている部分だけで、長さは max_overlap 文字まで
+    （途中に出てくる同じ言い回しとは重ねない）。見つからなければ両方をそのまま残す"""
+    result = ""
+    for text in texts:
+        text = text.strip()
+        if not result:
+            result = text
+            continue
+        limit = min(max_overlap, len(result), len(text))
+        size = next((k for k in range(limit, min_overlap - 1, -1) if result.endswith(text[:k])), 0)
+        if size:
+            result = result + text[size:]
+        else:
+            result = result + "\n" + text
+    return result
+
+
+# ---------------------------
+# 文字起こし
+# ---------------------------
+def whisper_transcribe(audio_bytes, filename, client=None):
+    """whisper-1 で1ファイルを文字起こし"""
+    if client is None:
+        from openai import OpenAI
+        client = OpenAI()
+    return client.audio.transcriptions.create(
+        model="whisper-1",
+        file=(filename, audio_bytes),
+        response_format="text"
+    )
+
+
+_local_model = None
+_local_model_lock = threading.Lock()
+
+
+def get_local_model():
+    """faster-whisper のモデルを1度だけ読み込む（num_workers 個のスレッドから同時に使える）"""
+    global _local_model
+    with _local_model_lock:
+        if _local_model is None:
+            from faster_whisper import WhisperModel
+            _local_model = WhisperModel(
+                LOCAL_MODEL,
+                device="cpu",
+                compute_type="int8",
+                cpu_threads=LOCAL_THREADS,
+                num_workers=LOCAL_WORKERS,
+            )
+        return _local_model
+
+
+def local_transcribe(audio_bytes, filename):
+    """faster-whisper（CPU）で1ファイルを文字起こし"""
+    segments, _ = get_local_model().transcribe(
+        io.BytesIO(audio_bytes), beam_size=1, vad_filter=True
+    )
+    return "".join(segment.text for segment in segments).strip()
+
+
+BACKENDS = {
+    # whisper-1 は25MB制限があるので長めのチャンクを少ない並列数で送る
+    "openai": {"transcribe": whisper_transcribe, "chunk_sec": CHUNK_SEC, "max_workers": MAX_WORKERS},
+    # ローカルは短い区間をコア数に応じて並列に処理する
+    "local": {
+        "transcribe": local_transcribe,
+        "chunk_sec": LOCAL_CHUNK_SEC,
+        "max_workers": LOCAL_WORKERS,
+        "max_request_bytes": None,
+    },
+}
+
+
+def transcribe_with_backend(audio_bytes, filename, backend="openai", on_progress=None, **overrides):
+    """BACKENDS の設定で transcribe_long を実行"""
+    options = dict(BACKENDS[backend])
+    options.update(overrides)
+    return transcribe_long(audio_bytes, filename, on_progress=on_progress, **options)
+
+
+def transcribe_long(audio_bytes, filename, transcribe=whisper_transcribe,
+                    chunk_sec=CHUNK_SEC, max_workers=MAX_WORKERS, on_progress=None,
+                    max_request_bytes=MAX_REQUEST_BYTES):
+    """長い音声を分割して並列に文字起こしし、つなげたテキストを返す
+
+    transcribe: (audio_bytes, filename) -> str
+    on_progress: (完了数, 全体数) -> None。呼び出し元のスレッドで呼ばれる
+    max_request_bytes: 1回で送れるサイズの上限（None なら上限なし）
+    """
+    too_large = max_request_bytes is not None and len(audio_bytes) > max_request_bytes
+    try:
+        pcm = decode_audio(audio_bytes, filename)
+    except AudioDecodeError:
+        if too_large:
+            raise
+        pcm = None
+
+    # 分割できない、または1チャンクに収まる場合はそのまま送る
+    if pcm is None or (len(pcm) <= chunk_sec * SAMPLE_RATE * SAMPLE_WIDTH and not too_large):
+        text = transcribe(audio_bytes, filename)
+        if on_progress:
+            on_progress(1, 1)
+        return text
+
+    def run_chunk(i, start, end):
+        # WAV への変換はワーカー内で行い、同時に持つチャンクを max_workers 個に抑える
+        return transcribe(pcm_to_wav(pcm[start:end]), f"chunk_{i:03d}.wav")
+
+    chunks = split_points(pcm, chunk_sec=chunk_sec)
+    texts = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(run_chunk, i, start, end): i
+            for i, (start, end) in enumerate(chunks)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            texts[futures[future]] = future.result()
+            if on_progress:
+                on_progress(done, len(chunks))
+    return stitch(texts)
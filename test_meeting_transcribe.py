@@ -0,0 +1,22 @@
+from meeting_transcribe import stitch
+
+
+def test_stitch_merges_only_the_real_overlap():
+    # 途中に同じ言い回し（について説明します。）があっても、重なりは末尾と先頭だけ
+    first = "最初に新製品について説明します。次に来期の予算案について説明します。工場は来年の春に完成予定です。"
+    second = "完成予定です。続いて人員計画について説明します。"
+    result = stitch([first, second])
+    assert result == first + "続いて人員計画について説明します。"
+
+
+def test_stitch_keeps_both_texts_without_overlap():
+    first = "本日の議題は三つです。"
+    second = "まず売上について説明します。"
+    assert stitch([first, second]) == first + "\n" + second
+
+
+def test_stitch_ignores_phrase_repeated_inside_next_chunk():
+    # 次のチャンクの途中にある前の末尾と同じ言い回しは重なりとみなさない
+    first = "以上について説明します。"
+    second = "質問はありますか。以上について説明します。"
+    assert stitch([first, second]) == first + "\n" + second
@@ -1,11 +1,21 @@
 # app.py
+import os
+import sys
 import streamlit as st
 import pandas as pd
 import json
 import base64
 import requests
 from datetime import datetime, date
-from typing import List, Dict, Optional, Tuple
+from typing import List, Optional, Tuple
+
+# タスク型は CLI 版（create-sakuhin）と共通
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "create-sakuhin"))
+from todo_model import Task, PRIORITY_LABELS, STATUS_DONE, NO_DATE
+from todo_agenda import Agenda
+from todo_calendar import overdue_business_days, parse_due
+from todo_watch import GitHubPoller
+from todo_history import History
 
 # -----------------------
 # 設定（Streamlit Secrets から取得）
@@ -38,9 +48,9 @@ HEADERS = {
 # -----------------------
 # ユーティリティ：GitHub ファイル取得 / 更新
 # -----------------------
-def github_get_file() -> Tuple[List[Dict], Optional[str]]:
+def github_get_file() -> Tuple[List[Task], Optional[str]]:
     """
-    GitHub からファイルを取得して JSON を返す。
+    GitHub からファイルを取得して Task のリストにする（JSON との変換はここだけ）。
     戻り値: (tasks_list, sha) sha は更新時に必要。ファイルが無ければ ([], None)
     """
     try:
@@ -55,7 +65,7 @@ def github_get_file() -> Tuple[List[Dict], Optional[str]]:
                 try:
                     data = json.loads(raw)
                     if isinstance(data, list):
-                        return data, sha
+                        return [Task.from_dict(d) for d in data if isinstance(d, dict)], sha
                     else:
                         # 想定外のデータ型のときは空リストとして扱う
                         return [], sha
@@ -73,13 +83,13 @@ def github_get_file() -> Tuple[List[Dict], Optional[str]]:
         st.error(f"GitHub 取得エラー: {e}")
         return [], None
 
-def github_put_file(tasks: List[Dict], message: str = "Update todo_list.json", sha: Optional[str] = None) -> bool:
+def github_put_file(tasks: List[Task], message: str = "Update todo_list.json", sha: Optional[str] = None) -> bool:
     """
     tasks を JSON にして GitHub に PUT (create/update) する。
     sha を渡すと更新、None のときは作成。
     """
     try:
-        payload_text = json.dumps(tasks, ensure_ascii=False, indent=2)
+        payload_text = json.dumps([t.to_dict() for t in tasks], ensure_ascii=False, indent=2)
         b64 = base64.b64encode(payload_text.encode("utf-8")).decode("utf-8")
         payload = {
             "message": message,
@@ -100,71 +110,88 @@ def github_put_file(tasks: List[Dict], message: str = "Update todo_list.json", s
 # -----------------------
 # タスク管理ユーティリティ
 # -----------------------
-PRIORITY_LABELS = {1: "緊急", 2: "高", 3: "中", 4: "低"}
-
-def normalize_task_for_display(t: Dict) -> Dict:
-    """
-    t: dict with keys title, cat, prio, dl, status
-    Returns a normalized dict for frontend display.
-    """
-    return {
-        "title": t.get("title", ""),
-        "cat": t.get("cat", "未分類"),
-        "prio": int(t.get("prio", 3)) if t.get("prio") is not None else 3,
-        "dl": t.get("dl", None),
-        "status": t.get("status", "未"),
-        "created_at": t.get("created_at", None),
-    }
-
-def tasks_to_df(tasks: List[Dict]) -> pd.DataFrame:
-    rows = []
-    for i, t in enumerate(tasks, start=1):
-        rows.append({
-            "No": i,
-            "タイトル": t.get("title", ""),
-            "カテゴリ": t.get("cat", "未分類"),
-            "優先度": PRIORITY_LABELS.get(int(t.get("prio", 3)), "中"),
-            "prio_int": int(t.get("prio", 3)) if t.get("prio", None) is not None else 3,
-            "期限": t.get("dl") if t.get("dl") else "----------",
-            "状態": t.get("status", "未"),
-            "created_at": t.get("created_at", "")
-        })
-    df = pd.DataFrame(rows)
+def tasks_to_df(tasks: List[Task]) -> pd.DataFrame:
+    # 列ごとに作る（1件ずつ dict を作らない）
+    df = pd.DataFrame({
+        "No": range(1, len(tasks) + 1),
+        "タイトル": [t.title for t in tasks],
+        "カテゴリ": [t.cat for t in tasks],
+        "優先度": [t.prio_label for t in tasks],
+        "prio_int": [t.prio for t in tasks],
+        "期限": [t.dl_str or NO_DATE for t in tasks],
+        "状態": [t.status for t in tasks],
+        # 期限を過ぎた営業日（土日祝を除く）の数。全件まとめて計算する
+        "超過(営業日)": overdue_business_days(tasks),
+        "created_at": [t.created_at or "" for t in tasks],
+    })
     return df
 
 def validate_date_str(s: str) -> bool:
+    # YYYY-MM-DD のほか +3（3日後）/ +3営業日 / 今日 / 明日 も使える（todo_calendar.parse_due）
     if not s:
         return True
     try:
-        datetime.strptime(s, "%Y-%m-%d")
+        parse_due(s)
         return True
-    except Exception:
+    except ValueError:
         return False
 
+@st.cache_resource
+def get_github_poller() -> GitHubPoller:
+    """GitHub 上の todo_list.json を ETag 付きで定期確認する（プロセスで1つ、全セッション共有）"""
+    return GitHubPoller(API_BASE, HEADERS)
+
+def remember_written(tasks: List[Task]):
+    """書き込みに成功した内容を他のセッションへ配り、このセッションの一覧も置き換える"""
+    poller = get_github_poller()
+    poller.publish([poller.encode(t) for t in tasks])
+    st.session_state.todos_raw = tasks
+    st.session_state.agenda_source = None  # 中身を書き換えたのでアジェンダを作り直す
+    st.session_state.github_version = poller.version
+    st.session_state.github_sha = github_get_file()[1]
+
+def put_or_revert(current: List[Task], ops, message: str) -> bool:
+    """履歴に記録した ops を GitHub に書き込む。失敗したら ops を戻して履歴からも消す
+    （sha が古ければ GitHub が拒否するので、他で更新された内容を上書きしない）"""
+    ok = github_put_file(current, message=message, sha=st.session_state.github_sha)
+    if ok:
+        remember_written(current)
+    else:
+        for op in reversed(ops):
+            op.revert(current)
+        st.session_state.history.drop(*ops)
+        st.session_state.agenda_source = None
+    return ok
+
 # -----------------------
 # セッション初期化
 # -----------------------
+poller = get_github_poller()
 if "todos_raw" not in st.session_state:
-    # 最初に GitHub からロード（tasks list と sha を保存）
-    data, sha = github_get_file()
-    # Ensure each entry normalized
-    normalized = []
-    for item in data:
-        # Backward compatibility: if item missing fields, ensure defaults
-        t = {
-            "title": item.get("title", ""),
-            "cat": item.get("cat", "未分類"),
-            "prio": int(item.get("prio", 3)) if item.get("prio") is not None else 3,
-            "dl": item.get("dl", None),
-            "status": item.get("status", "未"),
-            "created_at": item.get("created_at", None),
-        }
-        normalized.append(t)
-    st.session_state.todos_raw = normalized
-    st.session_state.github_sha = sha
+    # 最初はポーラーが持っている最新の内容から作る（GitHub へは問い合わせない）
+    # 欠けた項目の補完は Task.from_dict で済んでいる
+    version, rows = poller.snapshot()
+    st.session_state.todos_raw = [poller.decode(row) for row in rows]
+    st.session_state.github_version = version
+    st.session_state.github_sha = poller.sha
     st.session_state.sort_count = 0
     st.session_state.last_search = ""
     st.session_state.ui_message = ""
+    st.session_state.history = History()
+else:
+    # 前回の表示以降に GitHub 側で変わった行だけを反映する
+    version, reloaded = poller.sync(
+        st.session_state.todos_raw, st.session_state.github_version, poller.decode, st.session_state.get("agenda")
+    )
+    if version != st.session_state.github_version:
+        # 他で更新された（履歴が指すタスクが入れ替わった）ので取り消しはできない
+        st.session_state.history.clear()
+        st.session_state.github_sha = poller.sha
+    st.session_state.github_version = version
+    if reloaded:
+        st.session_state.agenda_source = None
+if poller.error:
+    st.warning(f"GitHub の確認に失敗しました（{poller.error}）。表示が古い可能性があります。")
 
 # -----------------------
 # UI
@@ -179,16 +206,15 @@ st.sidebar.subheader("タスク追加")
 titles_str = st.sidebar.text_input("タイトル（複数は ; で区切る）", help="例: 買い物;振込")
 cat = st.sidebar.text_input("カテゴリ", value="未分類")
 prio_sel = st.sidebar.selectbox("優先度", options=[1,2,3,4], index=2, format_func=lambda x: f"{x} - {PRIORITY_LABELS.get(x)}")
-dl_input = st.sidebar.text_input("期限 (YYYY-MM-DD、空でなし)", value="")
+dl_input = st.sidebar.text_input("期限 (YYYY-MM-DD / +3 / +3営業日、空でなし)", value="")
 
 if st.sidebar.button("追加"):
     titles = [s.strip() for s in titles_str.split(";") if s.strip()]
     if not titles:
         st.sidebar.info("タイトルを入力してください。")
     else:
-        latest, sha = github_get_file()
-        current = latest or []
-        added = 0
+        current = st.session_state.todos_raw
+        new_tasks = []
 
         for t in titles:
             dl = dl_input.strip() if dl_input.strip() else None
@@ -197,26 +223,17 @@ if st.sidebar.button("追加"):
             if dl and not validate_date_str(dl):
                 st.sidebar.error(
                     f"期限 '{dl}' は存在しない日付です。\n"
-                    "正しい日付（YYYY-MM-DD）を入力し直してください。"
+                    "正しい日付（YYYY-MM-DD / +3 / +3営業日）を入力し直してください。"
                 )
                 st.stop()
+            dl = parse_due(dl) if dl else None
+
+            new_tasks.append(Task(t, cat, prio_sel, dl, created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
 
-            task_obj = {
-                "title": t,
-                "cat": cat if cat else "未分類",
-                "prio": int(prio_sel) if prio_sel in (1, 2, 3, 4) else 3,
-                "dl": dl,
-                "status": "未",
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            current.append(task_obj)
-            added += 1
-
-        ok = github_put_file(current, message=f"Add {added} task(s) via streamlit", sha=sha)
-        if ok:
+        added = len(new_tasks)
+        op = st.session_state.history.insert(current, new_tasks, f"追加（{added}件）")
+        if put_or_revert(current, [op], f"Add {added} task(s) via streamlit"):
             st.sidebar.success(f"{added} 件を追加しました。")
-            st.session_state.todos_raw = current
-            st.session_state.github_sha = github_get_file()[1]
             st.rerun()
         else:
             st.sidebar.error("追加に失敗しました。")
@@ -228,13 +245,8 @@ upload = st.sidebar.file_uploader("テキスト/CSV をアップロード", type
 if upload is not None:
     try:
         text_lines = upload.read().decode("utf-8").splitlines()
-        latest, sha = github_get_file()
-        current = latest or []
-
-        st.write("sha:", sha)
-        st.write("latest:", latest)
-        
-        added = 0
+        current = st.session_state.todos_raw
+        new_tasks = []
         for line in text_lines:
             line = line.strip()
             if not line or line.startswith("#"):
@@ -246,23 +258,12 @@ if upload is not None:
             cat_f = parts[1] if len(parts) > 1 and parts[1] else "未分類"
             prio_f = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() and 1 <= int(parts[2]) <= 4 else 3
             dl_f = parts[3] if len(parts) > 3 and parts[3] else None
-            if dl_f and not validate_date_str(dl_f):
-                dl_f = None
-            obj = {
-                "title": title,
-                "cat": cat_f,
-                "prio": prio_f,
-                "dl": dl_f,
-                "status": "未",
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            current.append(obj)
-            added += 1
-        ok = github_put_file(current, message=f"Import {added} tasks via streamlit", sha=sha)
-        if ok:
+            dl_f = parse_due(dl_f) if dl_f and validate_date_str(dl_f) else None
+            new_tasks.append(Task(title, cat_f, prio_f, dl_f, created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        added = len(new_tasks)
+        op = st.session_state.history.insert(current, new_tasks, f"インポート（{added}件）")
+        if put_or_revert(current, [op], f"Import {added} tasks via streamlit"):
             st.sidebar.success(f"{added} 件インポートしました。")
-            st.session_state.todos_raw = current
-            st.session_state.github_sha = github_get_file()[1]
         else:
             st.sidebar.error("インポートに失敗しました。")
     except Exception as e:
@@ -275,6 +276,31 @@ if st.sidebar.button("検索実行"):
     st.session_state["last_search"] = search_kw
     st.sidebar.success("検索を適用しました。")
 
+# ---- 取り消し・やり直し ----
+st.sidebar.subheader("取り消し")
+history = st.session_state.history
+col_undo, col_redo = st.sidebar.columns(2)
+with col_undo:
+    undo_clicked = st.button("↩ 取消", disabled=history.undo_label is None, help=history.undo_label)
+with col_redo:
+    redo_clicked = st.button("↪ やり直し", disabled=history.redo_label is None, help=history.redo_label)
+if undo_clicked or redo_clicked:
+    current = st.session_state.todos_raw
+    op = history.undo(current) if undo_clicked else history.redo(current)
+    word = "取り消し" if undo_clicked else "やり直し"
+    ok = github_put_file(current, message=f"{'Undo' if undo_clicked else 'Redo'}: {op.label}", sha=st.session_state.github_sha)
+    if ok:
+        remember_written(current)
+        st.rerun()
+    else:
+        # 書き込めなかったので、手元の一覧と履歴を元に戻す
+        if undo_clicked:
+            history.redo(current)
+        else:
+            history.undo(current)
+        st.session_state.agenda_source = None
+        st.sidebar.error(f"「{op.label}」の{word}に失敗しました（GitHub が他で更新された可能性があります）。")
+
 # ---- ソートトグル（奇数回：優先度+期限 / 偶数回：期限） ----
 if st.sidebar.button("ソート (切替)"):
     st.session_state.sort_count = st.session_state.get("sort_count", 0) + 1
@@ -283,45 +309,47 @@ if st.sidebar.button("ソート (切替)"):
 # -----------------------
 # メイン領域：表示
 # -----------------------
-st.subheader("タスク一覧")
+# ---- アジェンダ（並び替えずに索引から表示） ----
+# todos_raw が置き換わったときだけ作り直す
+if st.session_state.get("agenda_source") is not st.session_state.todos_raw:
+    st.session_state.agenda = Agenda(st.session_state.todos_raw)
+    st.session_state.agenda_source = st.session_state.todos_raw
+agenda = st.session_state.agenda
+
+def show_agenda_table(tasks, empty_message):
+    if not tasks:
+        st.info(empty_message)
+        return
+    st.dataframe(tasks_to_df(tasks)[["タイトル","カテゴリ","優先度","期限"]], hide_index=True, use_container_width=True)
+
+st.subheader("アジェンダ")
+tab_next, tab_overdue, tab_week = st.tabs(["次にやること", "期限切れ", "今週が期限"])
+with tab_next:
+    show_agenda_table(agenda.next_up(5), "未完了のタスクはありません。")
+with tab_overdue:
+    show_agenda_table(agenda.overdue(), "期限切れのタスクはありません。")
+with tab_week:
+    show_agenda_table(agenda.due_this_week(), "今週が期限のタスクはありません。")
 
-# ensure latest fetch to show current
-raw_tasks, _ = github_get_file()
-if raw_tasks is None:
-    raw_tasks = []
+st.subheader("タスク一覧")
 
-# Use session copy for display to reduce API calls, but refresh if GitHub newer
-# (we'll prefer the session copy that we update after writes)
-display_tasks = st.session_state.get("todos_raw", raw_tasks)
+# 表示はセッションの一覧を使う（GitHub 側の変更はポーラーから差分で反映済み）
+display_tasks = st.session_state.todos_raw
 
 # Apply search (session last_search has priority)
 kw = st.session_state.get("last_search", "")
 if kw:
-    display_tasks = [t for t in display_tasks if kw.lower() in (t.get("title","").lower() + t.get("cat","").lower())]
+    display_tasks = [t for t in display_tasks if kw.lower() in (t.title.lower() + t.cat.lower())]
 
 # Apply sort toggle behavior (uses session sort_count)
 def sort_display(tasks):
     sc = st.session_state.get("sort_count", 0)
     if sc % 2 == 1:
         # odd: priority (small first) then due date
-        def keyfn(x):
-            pr = int(x.get("prio", 3)) if x.get("prio") is not None else 3
-            dl = x.get("dl") or ""
-            try:
-                dl_date = datetime.strptime(dl, "%Y-%m-%d").date() if dl else date.max
-            except Exception:
-                dl_date = date.max
-            return (pr, dl_date)
-        return sorted(tasks, key=keyfn)
+        return sorted(tasks, key=lambda x: (x.prio, x.dl or date.max))
     elif sc % 2 == 0 and sc != 0:
         # even but not zero: due date only
-        def keyfn2(x):
-            dl = x.get("dl") or ""
-            try:
-                return datetime.strptime(dl, "%Y-%m-%d").date() if dl else date.max
-            except Exception:
-                return date.max
-        return sorted(tasks, key=keyfn2)
+        return sorted(tasks, key=lambda x: x.dl or date.max)
     else:
         return tasks
 
@@ -333,7 +361,7 @@ if df.empty:
     st.info("タスクはありません。")
 else:
     # show without the helper 'prio_int' column
-    show_df = df[["No","タイトル","カテゴリ","優先度","期限","状態","created_at"]]
+    show_df = df[["No","タイトル","カテゴリ","優先度","期限","状態","超過(営業日)","created_at"]]
     st.dataframe(show_df, use_container_width=True)
 
 # -----------------------
@@ -348,90 +376,72 @@ if st.button("複数完了"):
     if not selected_nos:
         st.warning("少なくとも1つ選択してください。")
     else:
-        latest, sha = github_get_file()
-        current = latest or []
-
-        for n in selected_nos:
-            display_idx = no_to_index.get(n)
-            if display_idx is None:
-                continue
-
-            task = display_tasks[display_idx]
+        current = st.session_state.todos_raw
+        # 表示中のタスクはセッションの一覧と同じオブジェクト
+        targets = [display_tasks[no_to_index[n]] for n in selected_nos if n in no_to_index]
 
-            for i, t in enumerate(current):
-                if (
-                    t["title"] == task["title"]
-                    and t.get("created_at") == task.get("created_at")
-                ):
-                    current[i]["status"] = "完"
-                    break
+        with st.session_state.history.updating(targets, f"完了（{len(targets)}件）") as ops:
+            for t in targets:
+                t.status = STATUS_DONE
 
-        ok = github_put_file(current, message=f"Mark {len(selected_nos)} tasks as done", sha=sha)
-        if ok:
+        if put_or_revert(current, ops, f"Mark {len(selected_nos)} tasks as done"):
             st.success(f"{len(selected_nos)} 件を完了にしました。")
-            st.session_state.todos_raw = current
-            st.session_state.github_sha = github_get_file()[1]
             st.rerun()
+        else:
+            st.error("完了にできませんでした（GitHub が他で更新された可能性があります）。")
 
 # 削除
 if st.button("複数削除"):
     if not selected_nos:
         st.warning("少なくとも1つ選択してください。")
     else:
-        latest, sha = github_get_file()
-        current = latest or []
-        # build new list excluding selected indices
-        sel_idxs = sorted([n-1 for n in selected_nos], reverse=True)
-        for idx in sel_idxs:
-            if 0 <= idx < len(current):
-                current.pop(idx)
-        ok = github_put_file(current, message=f"Delete {len(selected_nos)} tasks", sha=sha)
-        if ok:
+        current = st.session_state.todos_raw
+        # 消したタスクと位置は履歴に残る（取消で元の位置に戻せる）
+        op = st.session_state.history.delete(current, [n - 1 for n in selected_nos], f"削除（{len(selected_nos)}件）")
+        if put_or_revert(current, [op], f"Delete {len(selected_nos)} tasks"):
             st.success(f"{len(selected_nos)} 件を削除しました。")
-            st.session_state.todos_raw = current
-            st.session_state.github_sha = github_get_file()[1]
             st.rerun()
+        else:
+            st.error("削除できませんでした（GitHub が他で更新された可能性があります）。")
 
 # 複数更新（対話式）
 st.subheader("複数更新（選択したタスクに対して）")
 upd_cat = st.text_input("新カテゴリ (空は変更しない)")
 upd_prio = st.selectbox("新優先度 (空で変更しない)", options=["","1 - 緊急","2 - 高","3 - 中","4 - 低"])
-upd_dl = st.text_input("新期限 (YYYY-MM-DD、空は変更しない)")
+upd_dl = st.text_input("新期限 (YYYY-MM-DD / +3 / +3営業日、空は変更しない)")
 
 if st.button("複数更新実行"):
     if not selected_nos:
         st.warning("少なくとも1つ選択してください。")
     else:
-        latest, sha = github_get_file()
-        current = latest or []
+        # セッションの一覧を直接書き換えるので、日付は先に確認する
+        if upd_dl and not validate_date_str(upd_dl):
+            st.error(f"{upd_dl} は存在しない日付です。修正してください。")
+            st.stop()
+
+        current = st.session_state.todos_raw
+        targets = [current[n - 1] for n in selected_nos if 0 <= n - 1 < len(current)]
         updated = 0
-        for n in selected_nos:
-            idx = n - 1
-            if 0 <= idx < len(current):
+        with st.session_state.history.updating(targets, f"更新（{len(targets)}件）") as ops:
+            for t in targets:
                 fields_changed = False
                 if upd_cat:
-                    current[idx]["cat"] = upd_cat
+                    t.cat = sys.intern(upd_cat)
                     fields_changed = True
                 if upd_prio and upd_prio != "":
-                    current[idx]["prio"] = int(upd_prio.split(" - ")[0])
+                    t.prio = int(upd_prio.split(" - ")[0])
                     fields_changed = True
-
                 if upd_dl:
-                    if validate_date_str(upd_dl):
-                        current[idx]["dl"] = upd_dl
-                        fields_changed = True
-                    else:
-                        st.error(f"{upd_dl} は存在しない日付です。修正してください。")
-                        st.stop()
+                    t.dl = parse_due(upd_dl)
+                    fields_changed = True
 
                 if fields_changed:
                     updated += 1
-        ok = github_put_file(current, message=f"Update {updated} tasks", sha=sha)
-        if ok:
+        if put_or_revert(current, ops, f"Update {updated} tasks"):
             st.success(f"{updated} 件を更新しました。")
-            st.session_state.todos_raw = current
-            st.session_state.github_sha = github_get_file()[1]
             st.rerun()
+        else:
+            st.error("更新できませんでした（GitHub が他で更新された可能性があります）。")
 
 # 検索クリア
 if st.button("検索クリア"):
@@ -0,0 +1,243 @@
+"""
+チャットから TODO リスト（todo_list.json）を参照するための検索
+
+タスクごとに「キーワード（文字 bigram の転置インデックス）」と「ベクトル（chat_vector_index の埋め込み）」
+を持ち、質問に近いタスクを上位 k 件だけプロンプトに入れます。タスクが何件あっても
+プロンプトに入るのは最大 k 件・MAX_CONTEXT_CHARS 文字までです。
+
+「仕事の期限切れは？」のような質問は、文中のカテゴリ名や「期限切れ」「今週」「完了」などの語から
+絞り込み条件を作り、条件に合うタスクの中で順位を付けます。
+ファイルの更新（mtime・サイズ）を見て、変わったタスクだけ埋め込みを作り直します。
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+TODO_FILE = "todo_list.json"
+TOP_K = 8
+MAX_CONTEXT_CHARS = 2000
+KEYWORD_WEIGHT = 0.5
+PRIORITY_LABELS = {1: "緊急", 2: "高", 3: "中", 4: "低"}
+
+OVERDUE_WORDS = ("期限切れ", "超過", "過ぎ", "遅れ", "overdue")
+TODAY_WORDS = ("今日", "本日", "today")
+WEEK_WORDS = ("今週", "1週間", "一週間", "this week")
+DONE_WORDS = ("完了した", "終わった", "済み", "完了済")
+URGENT_WORDS = ("緊急", "優先度が高", "急ぎ")
+
+
+def normalize_task(item):
+    """todo_list.json の1件を欠けた項目を補って返す"""
+    return {
+        "title": item.get("title", ""),
+        "cat": item.get("cat", "未分類"),
+        "prio": int(item.get("prio", 3)) if item.get("prio") is not None else 3,
+        "dl": item.get("dl") or None,
+        "status": item.get("status", "未"),
+        "created_at": item.get("created_at"),
+    }
+
+
+def task_key(task):
+    """内容から決まるキー（内容が変わったタスクだけ作り直すため）"""
+    raw = json.dumps(task, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def task_text(task):
+    return f"{task['title']} {task['cat']}"
+
+
+def parse_due(task):
+    try:
+        return datetime.strptime(task["dl"], "%Y-%m-%d").date() if task["dl"] else None
+    except ValueError:
+        return None
+
+
+def bigrams(text):
+    text = text.lower().replace(" ", "")
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def format_task(task):
+    due = task["dl"] or "なし"
+    prio = PRIORITY_LABELS.get(task["prio"], "中")
+    return f"- [{task['status']}] {task['title']}（カテゴリ: {task['cat']} / 優先度: {prio} / 期限: {due}）"
+
+
+class TodoIndex:
+    """タスクのキーワード＋ベクトル索引（スレッドセーフ。st.cache_resource で共有する想定）"""
+
+    def __init__(self, embedder, path=TODO_FILE):
+        self.embedder = embedder
+        self.path = path
+        self.signature = None
+        self.lock = threading.Lock()
+        self.tasks = {}      # key -> task
+        self.vectors = {}    # key -> 埋め込みベクトル
+        self.postings = {}   # bigram -> set of key
+        self.keys = []
+        self.matrix = np.zeros((0, embedder.dim), np.float32)
+
+    # ---------------------------
+    # 更新
+    # ---------------------------
+    def refresh(self):
+        """ファイルが変わっていれば読み直す。変わったかどうかを返す"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self.signature:
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.update(data if isinstance(data, list) else [])
+        self.signature = signature
+        return True
+
+    def update(self, items):
+        """タスク一覧を反映する（追加・変更されたタスクだけ埋め込みを作る）"""
+        tasks = {}
+        seen = {}
+        for item in items:
+            task = normalize_task(item)
+            key = task_key(task)
+            # 同じ内容のタスクが複数ある場合は番号を付けて区別する
+            seen[key] = seen.get(key, 0) + 1
+            tasks[f"{key}#{seen[key]}"] = task
+        with self.lock:
+            added = [k for k in tasks if k not in self.tasks]
+            removed = [k for k in self.tasks if k not in tasks]
+        vectors = self.embedder.embed([task_text(tasks[k]) for k in added]) if added else []
+
+        with self.lock:
+            for key in removed:
+                for gram in bigrams(task_text(self.tasks[key])):
+                    self.postings.get(gram, set()).discard(key)
+                del self.tasks[key]
+                del self.vectors[key]
+            for key, vector in zip(added, vectors):
+                self.tasks[key] = tasks[key]
+                self.vectors[key] = vector
+                for gram in bigrams(task_text(tasks[key])):
+                    self.postings.setdefault(gram, set()).add(key)
+            if added or removed:
+                self.keys = list(self.tasks)
+                self.matrix = (
+                    np.stack([self.vectors[k] for k in self.keys])
+                    if self.keys else np.zeros((0, self.embedder.dim), np.float32)
+                )
+
+    # ---------------------------
+    # 検索
+    # ---------------------------
+    def filters_for(self, question, today=None):
+        """質問文から絞り込み条件（カテゴリ・期限・状態）を作る"""
+        today = today or date.today()
+        with self.lock:
+            categories = {t["cat"] for t in self.tasks.values()}
+        filters = {}
+        matched = [c for c in categories if c and c in question]
+        # 「日常タスク」に含まれる「タスク」のような短い方は除く
+        matched = [c for c in matched if not any(c != other and c in other for other in matched)]
+        if matched:
+            filters["cat"] = set(matched)
+        if any(w in question for w in OVERDUE_WORDS):
+            filters["due_before"] = today
+        elif any(w in question for w in TODAY_WORDS):
+            filters["due_from"] = filters["due_until"] = today
+        elif any(w in question for w in WEEK_WORDS):
+            filters["due_from"] = today
+            filters["due_until"] = today + timedelta(days=6 - today.weekday())
+        filters["status"] = "完" if any(w in question for w in DONE_WORDS) else "未"
+        if any(w in question for w in URGENT_WORDS):
+            filters["prio_max"] = 2
+        return filters
+
+    def _matches(self, task, filters):
+        if "cat" in filters and task["cat"] not in filters["cat"]:
+            return False
+        if task["status"] != filters.get("status", task["status"]):
+            return False
+        if task["prio"] > filters.get("prio_max", 4):
+            return False
+        if "due_before" in filters or "due_until" in filters:
+            due = parse_due(task)
+            if due is None:
+                return False
+            if "due_before" in filters and due >= filters["due_before"]:
+                return False
+            if "due_from" in filters and due < filters["due_from"]:
+                return False
+            if "due_until" in filters and due > filters["due_until"]:
+                return False
+        return True
+
+    def retrieve(self, question, k=TOP_K, today=None):
+        """(関連するタスク上位 k 件, 条件に合うタスクの総数) を返す"""
+        filters = self.filters_for(question, today)
+        query_vector = self.embedder.embed([question], query=True)[0]
+        query_grams = bigrams(question)
+        with self.lock:
+            keys, matrix = self.keys, self.matrix
+            tasks = self.tasks
+            rows = [r for r, key in enumerate(keys) if self._matches(tasks[key], filters)]
+            if not rows:
+                return [], 0
+            hits = {}
+            for gram in query_grams:
+                for key in self.postings.get(gram, ()):
+                    hits[key] = hits.get(key, 0) + 1
+
+        scores = matrix[rows] @ query_vector
+        if query_grams:
+            scores += KEYWORD_WEIGHT * np.array([hits.get(keys[r], 0) for r in rows]) / len(query_grams)
+        # 上位の候補だけを取り出し、同点なら優先度が高く期限の近いものを先に
+        candidates = np.argpartition(-scores, min(k * 4, len(rows)) - 1)[:k * 4]
+        order = sorted(
+            candidates,
+            key=lambda i: (-round(float(scores[i]), 4), tasks[keys[rows[i]]]["prio"],
+                           parse_due(tasks[keys[rows[i]]]) or date.max),
+        )
+        return [tasks[keys[rows[i]]] for i in order[:k]], len(rows)
+
+    def build_context(self, question, k=TOP_K, today=None):
+        """プロンプトに入れる TODO の抜粋（最大 k 件・MAX_CONTEXT_CHARS 文字）と使ったタスクを返す"""
+        today = today or date.today()
+        tasks, total = self.retrieve(question, k, today)
+        if not tasks:
+            if not self.tasks:
+                return "", []
+            return f"TODO リストには質問の条件に合うタスクはありません（今日は {today}）。", []
+        lines = []
+        used = []
+        size = 0
+        for task in tasks:
+            line = format_task(task)
+            if size + len(line) > MAX_CONTEXT_CHARS:
+                break
+            lines.append(line)
+            used.append(task)
+            size += len(line) + 1
+        header = f"以下はチームの TODO リストから質問に関係しそうなタスクを抜き出したものです（今日は {today}）。"
+        if total > len(used):
+            header += f" 条件に合うタスクは全部で {total} 件あり、そのうち {len(used)} 件を載せています。"
+        return header + "\n" + "\n".join(lines), used
+
+
+def with_todo_context(question, index, k=TOP_K):
+    """質問の前に TODO の抜粋を付けたプロンプトと、使ったタスクを返す"""
+    index.refresh()
+    context, used = index.build_context(question, k)
+    if not context:
+        return question, []
+    return f"{context}\n\n質問: {question}", used